@@ -0,0 +1,466 @@
+"""
+This module is responsible for measuring how quickly the prediction and monitoring code runs, so
+that changes which make it slower can be spotted. It is run from the command line:
+
+    python benchmarks.py --sizes 662,100000,10000000 --output results.json --compare old.json
+
+For each size of sales file, a CSV file with that many orders is made by repeating the orders of
+the shipped CSV file, and the prediction functions are timed on it. The monitoring functions are
+timed on a brewery with the chosen numbers of batches and tanks, along with how long a new process
+takes to import brewery_monitoring. The forecast of several sites is timed in one process and
+with a process pool, using a copy of the sales file for each site. Every benchmark reports its
+throughput, the 50th, 90th and 99th percentile of its latency and the peak memory it allocated
+(measured with tracemalloc in a separate run, so that tracing does not slow down the timings, and
+reported as None for the process pool, whose memory tracemalloc cannot see). The results are
+saved as JSON, and can be compared with the results of an earlier run.
+"""
+# Imports
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import brewery_monitoring as b_m
+import csv_prediction as predict
+import sales_data
+
+# Constants
+SHIPPED_FILE: str = "Barnabys_sales_fabriacted_data.csv"
+SHIPPED_ROWS: int = 662
+SIZES: list = [SHIPPED_ROWS, 100000]
+BATCH_COUNTS: list = [100, 10000]
+REPEAT: int = 5
+# Calls that read from already loaded sales data take microseconds, so they are timed more often.
+WARM_REPEAT: int = 100
+# The number of sites forecast at once by the multi-site benchmark.
+SITE_COUNT: int = 4
+OUTPUT_FILE: str = "benchmark_results.json"
+# A benchmark is reported as slower when its median latency has grown by more than this ratio.
+REGRESSION_RATIO: float = 1.2
+PERCENTILES: tuple = (50, 90, 99)
+
+
+# Classes
+class BenchmarkResult:
+    """
+    This class is used to define the measurements of one benchmark at one size.
+
+    attributes:
+    name: str - the name of the benchmark
+    size: int - the number of orders in the sales file, or the number of batches in the brewery
+    samples: list - the time each call took, in seconds
+    items: int - how many orders or batches each call handled, used to work out throughput
+    peak_memory: int - the most memory allocated during one call, in bytes, or None if it cannot be
+    measured
+    """
+    def __init__(self, name: str, size: int, items: int = 1):
+        self.name = name
+        self.size = size
+        self.samples: list = []
+        self.items = items
+        self.peak_memory: int = 0
+
+    def to_dict(self) -> dict:
+        """
+        A class method which summarises the measurements as a dictionary that can be saved as JSON.
+
+        :return: dict
+        """
+        total = sum(self.samples)
+        summary = {
+            "name": self.name,
+            "size": self.size,
+            "calls": len(self.samples),
+            "total_seconds": total,
+            "calls_per_second": len(self.samples) / total if total else None,
+            "items_per_second": len(self.samples) * self.items / total if total else None,
+            "max_seconds": max(self.samples),
+            "peak_memory_bytes": self.peak_memory,
+        }
+        for percentile in PERCENTILES:
+            summary["p%d_seconds" % percentile] = percentile_of(self.samples, percentile)
+        return summary
+
+
+# Functions
+def percentile_of(samples: list, percentile: float) -> float:
+    """
+    A function which returns a percentile of a list of samples, interpolating between the two
+    nearest samples.
+
+    :param samples: list
+    :param percentile: float - from 0 to 100
+    :return: float
+    """
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * percentile / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_memory_of(function, *args) -> int:
+    """
+    A function which runs a function once while tracing memory, and returns the most memory it had
+    allocated at any one time, in bytes.
+
+    :param function: the function to run
+    :param args: the arguments to run it with
+    :return: int
+    """
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def time_calls(result: BenchmarkResult, function, args_list: list):
+    """
+    A function which calls a function once for each set of arguments, adding the time each call
+    took to the samples of a result.
+
+    :param result: BenchmarkResult
+    :param function: the function to time
+    :param args_list: list - a tuple of arguments for each call
+    :return: None
+    """
+    clock = time.perf_counter
+    samples = result.samples
+    for args in args_list:
+        start = clock()
+        function(*args)
+        samples.append(clock() - start)
+
+
+def scale_sales_file(rows: int, directory: str) -> str:
+    """
+    A function which makes a sales CSV file with the given number of orders, by repeating the orders
+    of the shipped file. The shipped file itself is used when it already has that many orders.
+
+    :param rows: int
+    :param directory: str - the folder to save the new file in
+    :return: file_name: str
+    """
+    if rows == SHIPPED_ROWS:
+        return os.path.abspath(SHIPPED_FILE)
+
+    with open(SHIPPED_FILE, mode="r") as csv_file:
+        heading = csv_file.readline()
+        orders = csv_file.readlines()
+
+    file_name = os.path.join(directory, "sales_%d.csv" % rows)
+    with open(file_name, mode="w") as csv_file:
+        csv_file.write(heading)
+        whole, part = divmod(rows, len(orders))
+        block = "".join(orders)
+        for _ in range(whole):
+            csv_file.write(block)
+        csv_file.writelines(orders[:part])
+    return file_name
+
+
+def cold(function):
+    """
+    A function which wraps a function so that the cached sales data is thrown away before each
+    call, so that the file is read again every time.
+
+    :param function: the function to wrap
+    :return: the wrapped function
+    """
+    def wrapped(*args):
+        sales_data.invalidate_cache()
+        return function(*args)
+    return wrapped
+
+
+def benchmark_predictions(file_name: str, rows: int, repeat: int) -> list:
+    """
+    A function which times the prediction functions on one sales file.
+
+    :param file_name: str
+    :param rows: int - the number of orders in the file
+    :param repeat: int - how many times each function is timed
+    :return: list of BenchmarkResult
+    """
+    results = []
+    sales_data.CSV_FILE[0] = file_name
+    recipe, month = "Organic Pilsner", "Jan"
+
+    orders = predict.import_to_dicts(file_name)
+    batches = b_m.view_all_batches_as_list()
+    cases = [
+        ("import_to_dicts", predict.import_to_dicts, (file_name,), rows),
+        ("sort_by_month", predict.sort_by_month, (orders,), rows),
+        ("calc_annual_growth_rate (cold)", cold(predict.calc_annual_growth_rate),
+         (recipe, file_name), rows),
+        ("calc_annual_growth_rate (warm)", predict.calc_annual_growth_rate,
+         (recipe, file_name), 1),
+        ("predict_for_given_month (cold)", cold(predict.predict_for_given_month),
+         (recipe, month, file_name), rows),
+        ("predict_for_given_month (warm)", predict.predict_for_given_month,
+         (recipe, month, file_name), 1),
+        ("predict_on_current_stock (cold)", cold(predict.predict_on_current_stock),
+         (batches,), rows),
+        ("predict_on_current_stock (warm)", predict.predict_on_current_stock, (batches,), 1),
+    ]
+    for name, function, args, items in cases:
+        result = BenchmarkResult(name, rows, items)
+        # predict_on_current_stock prints the forecast, which would flood the results.
+        with open(os.devnull, mode="w") as devnull, contextlib.redirect_stdout(devnull):
+            # Warm runs are made warm by this first call, which is not timed.
+            function(*args)
+            time_calls(result, function, [args] * (repeat if items > 1 else repeat * WARM_REPEAT))
+            result.peak_memory = peak_memory_of(function, *args)
+        results.append(result)
+        print_result(result)
+    del orders
+    sales_data.invalidate_cache()
+    return results
+
+
+def benchmark_sites(file_name: str, rows: int, repeat: int) -> list:
+    """
+    A function which times the forecast of SITE_COUNT sites, each with a copy of the sales file, in
+    one process and with a process pool of one process per CPU core. Every call reads the files
+    again, since the pool starts new processes each time.
+
+    :param file_name: str
+    :param rows: int - the number of orders in each file
+    :param repeat: int
+    :return: list of BenchmarkResult
+    """
+    results = []
+    directory = tempfile.mkdtemp(prefix="brewery_sites_")
+    try:
+        site_files = []
+        for site in range(SITE_COUNT):
+            site_file = os.path.join(directory, "site_%d.csv" % site)
+            shutil.copyfile(file_name, site_file)
+            site_files.append(site_file)
+
+        cases = [
+            ("forecast_sites (1 process)", 1),
+            ("forecast_sites (process pool)", None),
+        ]
+        for name, workers in cases:
+            result = BenchmarkResult(name, rows, rows * SITE_COUNT)
+            time_calls(result, cold(predict.forecast_sites), [(site_files, workers)] * repeat)
+            if workers == 1:
+                result.peak_memory = peak_memory_of(cold(predict.forecast_sites), site_files, 1)
+            else:
+                # tracemalloc cannot see the memory of the processes in the pool.
+                result.peak_memory = None
+            results.append(result)
+            print_result(result)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+        sales_data.invalidate_cache()
+    return results
+
+
+def benchmark_startup(repeat: int) -> list:
+    """
+    A function which times how long a new Python process takes to import brewery_monitoring, as
+    scripts which only manage tanks and batches must start quickly.
+
+    :param repeat: int
+    :return: list of BenchmarkResult
+    """
+    result = BenchmarkResult("import brewery_monitoring", 1)
+    command = [sys.executable, "-c", "import brewery_monitoring"]
+    time_calls(result, subprocess.run, [(command,)] * repeat)
+    results = [result]
+    print_result(result)
+    return results
+
+
+def fill_brewery(batch_count: int):
+    """
+    A function which empties the brewery and then fills it with one tank able to ferment and
+    condition for each batch, and the given number of batches at stage 1.
+
+    :param batch_count: int
+    :return: names: list - the names of the batches
+    """
+    b_m.clear_brewery()
+    recipes = sorted(b_m.VALID_RECIPE)
+    names = []
+    for index in range(batch_count):
+        b_m.create_new_tank("Tank %d" % index, 1000, b_m.FERMENTER_CONDITIONER)
+        name = "Batch %d" % index
+        b_m.create_new_batch(name, recipes[index % len(recipes)], 1 + index % 2000)
+        names.append(name)
+    return names
+
+
+def call_each(function, args_list: list):
+    """
+    A function which calls a function once for each set of arguments.
+
+    :param function: the function to call
+    :param args_list: list - a tuple of arguments for each call
+    :return: None
+    """
+    for args in args_list:
+        function(*args)
+
+
+def benchmark_monitoring(batch_count: int) -> list:
+    """
+    A function which times moving batches between stages, and finding their time at stage, in a
+    brewery with the given number of batches.
+
+    :param batch_count: int
+    :return: list of BenchmarkResult
+    """
+    names = fill_brewery(batch_count)
+    tanks = [(name, name.replace("Batch", "Tank")) for name in names]
+    cases = [
+        ("move_to_stage_2", b_m.move_to_stage_2, tanks),
+        ("time_at_stage", b_m.time_at_stage, [(name,) for name in names]),
+        ("move_to_stage_3", b_m.move_to_stage_3, [(name, "") for name in names]),
+        ("move_to_stage_4", b_m.move_to_stage_4, [(name,) for name in names]),
+    ]
+    results = []
+    for name, function, args_list in cases:
+        result = BenchmarkResult(name, batch_count)
+        time_calls(result, function, args_list)
+        results.append(result)
+
+    # Memory is measured over a second run through the stages, tracing each stage on its own.
+    fill_brewery(batch_count)
+    for result, (_name, function, args_list) in zip(results, cases):
+        result.peak_memory = peak_memory_of(call_each, function, args_list)
+        print_result(result)
+    b_m.clear_brewery()
+    return results
+
+
+def print_result(result: BenchmarkResult):
+    """
+    A function which prints a one line summary of a result.
+
+    :param result: BenchmarkResult
+    :return: None
+    """
+    summary = result.to_dict()
+    peak = summary["peak_memory_bytes"]
+    print("%-34s %10d  p50 %10.6fs  p99 %10.6fs  %12.0f items/s  %12s" % (
+        summary["name"], summary["size"], summary["p50_seconds"], summary["p99_seconds"],
+        summary["items_per_second"] or 0, "n/a" if peak is None else "%.1f MiB" % (peak / 2 ** 20)
+    ))
+
+
+def compare_results(old_file: str, results: list, ratio: float = REGRESSION_RATIO) -> list:
+    """
+    A function which compares results with those saved by an earlier run, and prints every
+    benchmark whose median latency has changed by more than the ratio given.
+
+    :param old_file: str
+    :param results: list - the summaries of this run
+    :param ratio: float = REGRESSION_RATIO
+    :return: regressions: list - the (name, size) of every benchmark that became slower
+    """
+    with open(old_file, mode="r") as json_file:
+        old_results = json.load(json_file)["results"]
+    old = {(result["name"], result["size"]): result for result in old_results}
+
+    regressions = []
+    for result in results:
+        key = (result["name"], result["size"])
+        if key not in old or not old[key]["p50_seconds"]:
+            continue
+        change = result["p50_seconds"] / old[key]["p50_seconds"]
+        if change > ratio:
+            regressions.append(key)
+            print("SLOWER  %-34s %10d  x%.2f" % (key[0], key[1], change))
+        elif change < 1 / ratio:
+            print("FASTER  %-34s %10d  x%.2f" % (key[0], key[1], change))
+    return regressions
+
+
+def run_benchmarks(sizes: list, batch_counts: list, repeat: int) -> dict:
+    """
+    A function which runs every benchmark and returns the results, along with details of the
+    machine they were run on.
+
+    :param sizes: list - the numbers of orders in the sales files
+    :param batch_counts: list - the numbers of batches in the brewery
+    :param repeat: int
+    :return: dict
+    """
+    results = []
+    directory = tempfile.mkdtemp(prefix="brewery_benchmarks_")
+    try:
+        for rows in sizes:
+            file_name = scale_sales_file(rows, directory)
+            results.extend(benchmark_predictions(file_name, rows, repeat))
+            results.extend(benchmark_sites(file_name, rows, repeat))
+            if file_name.startswith(directory):
+                os.remove(file_name)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+        sales_data.CSV_FILE[0] = SHIPPED_FILE
+
+    results.extend(benchmark_startup(repeat))
+    for batch_count in batch_counts:
+        results.extend(benchmark_monitoring(batch_count))
+
+    return {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "results": [result.to_dict() for result in results],
+    }
+
+
+def parse_sizes(text: str) -> list:
+    """
+    A function which turns a comma separated list of sizes into a list of integers.
+
+    :param text: str
+    :return: list
+    """
+    return [int(size) for size in text.split(",") if size.strip()]
+
+
+def main():
+    """
+    A function which runs the benchmarks chosen on the command line, saves the results and compares
+    them with an earlier run if asked to.
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the brewery prediction and monitoring.")
+    parser.add_argument("--sizes", type=parse_sizes, default=SIZES,
+                        help="comma separated numbers of orders in the sales file")
+    parser.add_argument("--batches", type=parse_sizes, default=BATCH_COUNTS,
+                        help="comma separated numbers of batches in the brewery")
+    parser.add_argument("--repeat", type=int, default=REPEAT,
+                        help="how many times each prediction benchmark is timed")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="the JSON file to save results to")
+    parser.add_argument("--compare", help="a JSON file saved by an earlier run to compare with")
+    arguments = parser.parse_args()
+
+    report = run_benchmarks(arguments.sizes, arguments.batches, arguments.repeat)
+    with open(arguments.output, mode="w") as json_file:
+        json.dump(report, json_file, indent=2)
+    print("Results saved to", arguments.output)
+
+    if arguments.compare:
+        if compare_results(arguments.compare, report["results"]):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
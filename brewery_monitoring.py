@@ -4,54 +4,124 @@ It can create new batches, move them between the different stages of the brew pr
 status of all batches and tanks. It is also responsible for importing the CSV file for predictions.
 """
 # Imports
-import csv
-from datetime import datetime
-import csv_prediction as predict
-
-# Global lists
-available_tanks: list = []
-running_tanks: list = []
-batches_s1: list = []
-batches_s2: list = []
-batches_s3: list = []
-batches_s4: list = []
+# csv, brewery_store and csv_prediction are imported by the functions which use them, so that
+# scripts which only manage tanks and batches start quickly.
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import count
+import instrumentation
+import sales_data
 
 # Constants
 VALID_RECIPE: set = {"Organic Pilsner", "Organic Red Helles", "Organic Dunkel"}
 FERMENTER: str = "Fermenter"
 CONDITIONER: str = "Conditioner"
 FERMENTER_CONDITIONER: str = "Fermenter/conditioner"
-CSV_FILE: list = ["Barnabys_sales_fabriacted_data.csv"]
+IDLE: str = "Idle"
+FERMENTING: str = "Fermenting"
+CONDITIONING: str = "Conditioning"
+# Batches and tanks store integer codes instead of their recipe, stage, capability and state, so
+# that they are small and quick to compare. The code of each string is its position in its tuple;
+# the first stage is 1, so that the code of each stage is its number.
+RECIPES: tuple = ("Organic Pilsner", "Organic Red Helles", "Organic Dunkel")
+STAGES: tuple = (None, "1", "2", "3", "4")
+CAPABILITIES: tuple = (FERMENTER, CONDITIONER, FERMENTER_CONDITIONER)
+TANK_STATES: tuple = (IDLE, FERMENTING, CONDITIONING)
+RECIPE_CODES: dict = {recipe: code for code, recipe in enumerate(RECIPES)}
+STAGE_CODES: dict = {stage: code for code, stage in enumerate(STAGES) if stage is not None}
+CAPABILITY_CODES: dict = {capability: code for code, capability in enumerate(CAPABILITIES)}
+TANK_STATE_CODES: dict = {state: code for code, state in enumerate(TANK_STATES)}
+FERMENTER_CODE: int = CAPABILITY_CODES[FERMENTER]
+CONDITIONER_CODE: int = CAPABILITY_CODES[CONDITIONER]
+FERMENTER_CONDITIONER_CODE: int = CAPABILITY_CODES[FERMENTER_CONDITIONER]
+# The tank capabilities that can be used for each stage that needs a tank.
+STAGE_CAPABILITIES: dict = {
+    "2": [FERMENTER, FERMENTER_CONDITIONER],
+    "3": [CONDITIONER, FERMENTER_CONDITIONER],
+}
+STAGE_CAPABILITY_CODES: dict = {
+    stage: [CAPABILITY_CODES[capability] for capability in capabilities]
+    for stage, capabilities in STAGE_CAPABILITIES.items()
+}
+# Times are stored as whole microseconds since EPOCH, which converts to and from a datetime exactly.
+EPOCH: datetime = datetime(1970, 1, 1)
+MICROSECOND: timedelta = timedelta(microseconds=1)
+# The kinds of change that are published to subscribers.
+TANK_CREATED: str = "tank_created"
+BATCH_CREATED: str = "batch_created"
+STAGE_CHANGED: str = "stage_changed"
+TANK_OCCUPIED: str = "tank_occupied"
+TANK_FREED: str = "tank_freed"
+# The same list as sales_data.CSV_FILE, so a new file chosen here is used for predictions.
+CSV_FILE: list = sales_data.CSV_FILE
+STATE_FILE: str = "brewery_state.db"
+# The state store that changes are saved to, once open_state_store has been called.
+STATE_STORE: list = [None]
+# (name, max_volume, capability) of each tank which the client possesses.
+REQUIRED_TANKS: list = [
+    ("Albert", 1000, "Fermenter/conditioner"),
+    ("Brigadier", 800, "Fermenter/conditioner"),
+    ("Camilla", 1000, "Fermenter/conditioner"),
+    ("Dylon", 800, "Fermenter/conditioner"),
+    ("Emily", 1000, "Fermenter/conditioner"),
+    ("Florence", 800, "Fermenter/conditioner"),
+    ("Gertrude", 680, "Conditioner"),
+    ("Harry", 680, "Conditioner"),
+    ("R2D2", 800, "Fermenter"),
+]
 
 
 # Classes
 class Tank:
     """
     This class is used to define Tanks. A tank can hold one batch and has various attributes that
-    dictate what kind of batch it can hold.
+    dictate what kind of batch it can hold. The capability and state are stored as integer codes.
 
     attributes:
     name: str - the name of the tank
     max_volume: int - the maximum volume (in Litres) that a tank can hold
-    capability: str - which stages of the process the tank can do
-    current_state: str = "Idle" - the current state of the tank, (it is idle, fermenting or
-    conditioning)
+    capability_code: int - the code in CAPABILITIES of which stages of the process the tank can do
+    state_code: int - the code in TANK_STATES of the current state of the tank, (it is idle,
+    fermenting or conditioning)
+    capability: str - the capability itself, worked out from capability_code
+    current_state: str = "Idle" - the current state itself, worked out from state_code
     """
+    __slots__ = ("name", "max_volume", "capability_code", "state_code")
+
     # Attribute volume is measured in litres (L) and capability describes what the tank can do.
-    def __init__(self, name: str, max_volume: int, capability: str, current_state: str = "Idle"):
+    def __init__(self, name: str, max_volume: int, capability: str, current_state: str = IDLE):
         self.name = name
         self.max_volume = max_volume
 
-        if capability in ["Fermenter/conditioner", "Fermenter", "Conditioner"]:
-            self.capability = capability
+        if capability in CAPABILITY_CODES:
+            self.capability_code: int = CAPABILITY_CODES[capability]
         else:
             raise ValueError("Invalid capability")
 
-        if current_state in ["Idle", "Fermenting", "Conditioning"]:
-            self.current_state = current_state
+        if current_state in TANK_STATE_CODES:
+            self.state_code: int = TANK_STATE_CODES[current_state]
         else:
             raise ValueError("Invalid current state.")
 
+    @property
+    def capability(self) -> str:
+        """
+        A class method which returns the capability of the tank.
+
+        :return: str
+        """
+        return CAPABILITIES[self.capability_code]
+
+    @property
+    def current_state(self) -> str:
+        """
+        A class method which returns the current state of the tank.
+
+        :return: str
+        """
+        return TANK_STATES[self.state_code]
+
     def change_current_state(self, new_state: str):
         """
         A class method which changes the current state of the tank.
@@ -59,45 +129,95 @@ class Tank:
         :param new_state: str
         :return: None
         """
-        self.current_state = new_state
+        if new_state in TANK_STATE_CODES:
+            self.state_code = TANK_STATE_CODES[new_state]
+        else:
+            raise ValueError("Invalid current state.")
 
 
 class Batch:
     """
     This class is used to define batches of beer and has various attributes which helps the user do
-    that.
+    that. The recipe and stage are stored as integer codes and the time started as a whole number of
+    microseconds, so that a long history of batches takes little memory.
 
     class attributes:
     bottle_vol: float = 0.5 - the volume of any bottle that is in the batch
-    time_started: datetime - the time at which the batch instance was created
+    first_started: int - the time at which this module was loaded, which every batch has as its time
+    started until it is updated
 
     attributes:
     name: str - the name of the batch
-    recipe: str - the recipe of the batch
+    recipe_code: int - the code in RECIPES of the recipe of the batch
     quantity: int - the number of bottles in the batch
-    stage: str - the stage at which the batch is at. Stage 1 = Hot Brew, Stage 2 = Fermenting,
-                    Stage 3 = Conditioning and Carbonation, Stage 4 = Bottling and Labelling.
+    stage_code: int - the stage at which the batch is at, as a number. Stage 1 = Hot Brew,
+                    Stage 2 = Fermenting, Stage 3 = Conditioning and Carbonation,
+                    Stage 4 = Bottling and Labelling.
     volume: float - the total volume of the batch. A product of bottle_vol and quantity.
+    started: int - the time at which the batch reached its stage, in microseconds since EPOCH
+    recipe: str - the recipe itself, worked out from recipe_code
+    stage: str - the stage as a string ("1" to "4"), worked out from stage_code
+    time_started: datetime - the time at which the batch reached its stage, worked out from started
     """
+    __slots__ = ("name", "recipe_code", "quantity", "volume", "stage_code", "started")
+
     # Class attribute bottle_vol is volume of single bottle, measured in litres (L).
     bottle_vol: float = 0.5
-    time_started: datetime = datetime.now()
+    first_started: int = (datetime.now() - EPOCH) // MICROSECOND
 
     def __init__(self, name: str, recipe: str, quantity: int, stage: str = "1"):
-        if recipe in ["Organic Dunkel", "Organic Pilsner", "Organic Red Helles"]:
-            self.recipe = recipe
+        if recipe in RECIPE_CODES:
+            self.recipe_code: int = RECIPE_CODES[recipe]
         else:
             raise ValueError("Invalid recipe.")
 
         self.name = name
         self.quantity = quantity
         self.volume: float = quantity * self.bottle_vol
+        self.started: int = self.first_started
 
-        if stage in ["1", "2", "3", "4"]:
-            self.stage = stage
+        if stage in STAGE_CODES:
+            self.stage_code: int = STAGE_CODES[stage]
         else:
             raise ValueError("Invalid Stage")
 
+    @property
+    def recipe(self) -> str:
+        """
+        A class method which returns the recipe of the batch.
+
+        :return: str
+        """
+        return RECIPES[self.recipe_code]
+
+    @property
+    def stage(self) -> str:
+        """
+        A class method which returns the stage of the batch.
+
+        :return: str
+        """
+        return STAGES[self.stage_code]
+
+    @property
+    def time_started(self) -> datetime:
+        """
+        A class method which returns the time at which the batch reached its stage.
+
+        :return: datetime
+        """
+        return EPOCH + self.started * MICROSECOND
+
+    @time_started.setter
+    def time_started(self, time_started: datetime):
+        """
+        A class method which changes the time at which the batch reached its stage.
+
+        :param time_started: datetime
+        :return: None
+        """
+        self.started = (time_started - EPOCH) // MICROSECOND
+
     def change_stage(self, new_stage: str):
         """
         A class method which changes the current stage of the brewing process that the batch is on.
@@ -105,8 +225,8 @@ class Batch:
         :param new_stage: str
         :return: None
         """
-        if new_stage in ["1", "2", "3", "4"]:
-            self.stage = new_stage
+        if new_stage in STAGE_CODES:
+            self.stage_code = STAGE_CODES[new_stage]
         else:
             raise ValueError("Invalid stage")
 
@@ -116,10 +236,470 @@ class Batch:
 
         :return: None
         """
-        self.time_started = datetime.now()
+        self.started = (datetime.now() - EPOCH) // MICROSECOND
+
+
+class Placement:
+    """
+    This class is used to define the entry of a batch at stage 2 or 3, which is in a tank.
+
+    attributes:
+    batch: Batch - the batch
+    tank: Tank - the tank the batch is in
+    """
+    __slots__ = ("batch", "tank")
+
+    def __init__(self, batch: Batch, tank: Tank):
+        self.batch = batch
+        self.tank = tank
+
+    def __repr__(self) -> str:
+        return "Placement(%s, %s)" % (self.batch.name, self.tank.name)
+
+
+class BatchRegistry:
+    """
+    This class is used to keep track of every batch in the brewery, so that a batch can be found by
+    its name without searching through the lists of each stage. Batch names must be unique.
+
+    attributes:
+    by_name: dict - every batch, keyed by name
+    stages: dict - for each stage ("1" to "4"), the entries of the batches at that stage keyed by
+    batch name, in the order they reached the stage. The entry of a batch at stage 1 or 4 is the
+    Batch itself, and the entry of a batch at stage 2 or 3 is the Placement of the batch in its
+    tank.
+    load_delivered: callable = None - if set, a function returning the saved batches at stage 4,
+    which is only called the first time the batches at stage 4 are needed
+    load_batch: callable = None - if set, a function returning the saved batch with a given name,
+    used to find batches at stage 4 before they have all been loaded
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """
+        A class method which removes every batch from the registry.
+
+        :return: None
+        """
+        self.by_name: dict = {}
+        self.stages: dict = {"1": {}, "2": {}, "3": {}, "4": {}}
+        self.load_delivered = None
+        self.load_batch = None
+
+    def add(self, batch: Batch):
+        """
+        A class method which adds a new batch at its current stage. A ValueError is raised if there
+        is already a batch with the same name.
+
+        :param batch: Batch
+        :return: None
+        """
+        if self.get(batch.name) is not None:
+            raise ValueError("A batch called %s already exists." % batch.name)
+        self.restore(batch, batch)
+
+    def restore(self, batch: Batch, entry):
+        """
+        A class method which puts a batch that has been loaded from the state store back at its
+        stage, with the given entry.
+
+        :param batch: Batch
+        :param entry: Batch or Placement
+        :return: None
+        """
+        self.by_name[batch.name] = batch
+        self.stages[batch.stage][batch.name] = entry
+
+    def get(self, name: str) -> Batch:
+        """
+        A class method which returns the batch with the given name, or None if there is no such
+        batch.
+
+        :param name: str
+        :return: Batch
+        """
+        batch = self.by_name.get(name)
+        if batch is None and self.load_batch is not None:
+            batch = self.load_batch(name)
+            if batch is not None:
+                self.restore(batch, batch)
+        return batch
+
+    def stage(self, stage: str) -> dict:
+        """
+        A class method which returns the entries of the batches at a stage, keyed by batch name.
+
+        :param stage: str
+        :return: dict
+        """
+        if stage == "4" and self.load_delivered is not None:
+            load_delivered, self.load_delivered = self.load_delivered, None
+            for batch in load_delivered():
+                if batch.name not in self.by_name:
+                    self.restore(batch, batch)
+            self.load_batch = None
+        return self.stages[stage]
+
+    def entry(self, name: str, stage: str):
+        """
+        A class method which returns the entry of the named batch if it is at the given stage, or
+        None if it is not.
+
+        :param name: str
+        :param stage: str
+        :return: Batch or Placement
+        """
+        return self.stage(stage).get(name)
+
+    def move(self, name: str, new_stage: str, new_entry=None):
+        """
+        A class method which moves the named batch from its current stage to a new stage, changing
+        the stage of the batch and resetting its time at stage. The new entry is the Placement of
+        the batch in its tank for stages 2 and 3, or None for stages 1 and 4.
+
+        :param name: str
+        :param new_stage: str
+        :param new_entry: Placement = None
+        :return: None
+        """
+        batch = self.by_name[name]
+        del self.stages[batch.stage][name]
+        batch.change_stage(new_stage)
+        batch.update_time()
+        self.stages[new_stage][name] = batch if new_entry is None else new_entry
+
+
+class StageView:
+    """
+    This class is used to give a read-only, list-like view of the batches at one or more stages of a
+    BatchRegistry. Iterating over it gives the entries of each stage in turn.
+
+    attributes:
+    registry: BatchRegistry - the registry that is viewed
+    stages: tuple - the stages that are viewed
+    """
+    def __init__(self, registry: BatchRegistry, *stages: str):
+        self.registry = registry
+        self.stages = stages
+
+    def __iter__(self):
+        for stage in self.stages:
+            yield from self.registry.stage(stage).values()
+
+    def __len__(self) -> int:
+        return sum(len(self.registry.stage(stage)) for stage in self.stages)
+
+    def __getitem__(self, index):
+        return list(self)[index]
+
+    def __contains__(self, item) -> bool:
+        return any(entry is item or entry == item for entry in self)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class TankIndex:
+    """
+    This class is used to keep track of the tanks that are available (not holding a batch), indexed
+    by capability and sorted by volume, so that the smallest available tank that can hold a batch is
+    found with a binary search instead of checking every tank. Iterating over it gives the tanks in
+    the order they became available, in the same way as a list.
+
+    attributes:
+    by_name: dict - every available tank, keyed by name, in the order they became available
+    by_capability: list - for each capability code, a sorted list of (max_volume, order, name) of
+    the available tanks with that capability, where order breaks ties in the order tanks were added
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """
+        A class method which removes every tank from the index.
+
+        :return: None
+        """
+        self.by_name: dict = {}
+        self.by_capability: list = [[] for _capability in CAPABILITIES]
+        self.order: dict = {}
+        self.counter = count()
+
+    def __iter__(self):
+        return iter(list(self.by_name.values()))
+
+    def __len__(self) -> int:
+        return len(self.by_name)
+
+    def __getitem__(self, index):
+        return list(self.by_name.values())[index]
+
+    def __contains__(self, tank) -> bool:
+        return self.by_name.get(getattr(tank, "name", None)) is tank
+
+    def __repr__(self) -> str:
+        return repr(list(self.by_name.values()))
+
+    def add(self, tank: Tank):
+        """
+        A class method which adds a tank that has become available. A ValueError is raised if a
+        tank with the same name is already available.
+
+        :param tank: Tank
+        :return: None
+        """
+        if tank.name in self.by_name:
+            raise ValueError("A tank called %s already exists." % tank.name)
+        order = next(self.counter)
+        self.by_name[tank.name] = tank
+        self.order[tank.name] = order
+        insort(self.by_capability[tank.capability_code], (tank.max_volume, order, tank.name))
+
+    def remove(self, tank: Tank):
+        """
+        A class method which removes a tank that is no longer available.
+
+        :param tank: Tank
+        :return: None
+        """
+        del self.by_name[tank.name]
+        key = (tank.max_volume, self.order.pop(tank.name), tank.name)
+        tanks = self.by_capability[tank.capability_code]
+        del tanks[bisect_left(tanks, key)]
+
+    def get(self, name: str) -> Tank:
+        """
+        A class method which returns the available tank with the given name, or None.
+
+        :param name: str
+        :return: Tank
+        """
+        return self.by_name.get(name)
+
+    def smallest(self, capabilities: list, volume: float) -> Tank:
+        """
+        A class method which returns the smallest available tank with one of the given capability
+        codes that can hold the given volume, or None if there is no such tank.
+
+        :param capabilities: list
+        :param volume: float
+        :return: Tank
+        """
+        best = None
+        for capability in capabilities:
+            tanks = self.by_capability[capability]
+            position = bisect_left(tanks, (volume,))
+            if position < len(tanks) and (best is None or tanks[position] < best):
+                best = tanks[position]
+        return None if best is None else self.by_name[best[2]]
+
+    def fitting(self, capabilities: list, volume: float) -> list:
+        """
+        A class method which returns every available tank with one of the given capability codes
+        that can hold the given volume, smallest first.
+
+        :param capabilities: list
+        :param volume: float
+        :return: list
+        """
+        fitting = []
+        for capability in capabilities:
+            tanks = self.by_capability[capability]
+            fitting.extend(tanks[bisect_left(tanks, (volume,)):])
+        return [self.by_name[name] for _volume, _order, name in sorted(fitting)]
+
+
+class ChangeEvent:
+    """
+    This class is used to define a change to the tanks or batches of the brewery, which is published
+    to every subscriber.
+
+    attributes:
+    kind: str - TANK_CREATED, BATCH_CREATED, STAGE_CHANGED, TANK_OCCUPIED or TANK_FREED
+    batch: Batch - the batch which changed, or the batch which occupied or freed the tank
+    tank: Tank - the tank which changed, or the tank the batch is in after a change of stage
+    """
+    def __init__(self, kind: str, batch: Batch = None, tank: Tank = None):
+        self.kind = kind
+        self.batch = batch
+        self.tank = tank
+
+    def __repr__(self) -> str:
+        return "ChangeEvent(%s, %s, %s)" % (
+            self.kind,
+            None if self.batch is None else self.batch.name,
+            None if self.tank is None else self.tank.name,
+        )
+
+
+# Global lists
+# The functions which are called with every ChangeEvent.
+SUBSCRIBERS: list = []
+BATCHES = BatchRegistry()
+available_tanks: TankIndex = TankIndex()
+running_tanks: StageView = StageView(BATCHES, "2", "3")
+batches_s1: StageView = StageView(BATCHES, "1")
+batches_s2: StageView = StageView(BATCHES, "2")
+batches_s3: StageView = StageView(BATCHES, "3")
+batches_s4: StageView = StageView(BATCHES, "4")
 
 
 # Functions
+def subscribe(callback):
+    """
+    A function which makes callback be called with a ChangeEvent every time a tank or batch changes.
+
+    :param callback: a function taking a ChangeEvent
+    :return: None
+    """
+    if callback not in SUBSCRIBERS:
+        SUBSCRIBERS.append(callback)
+
+
+def unsubscribe(callback):
+    """
+    A function which stops callback being called when a tank or batch changes.
+
+    :param callback: a function taking a ChangeEvent
+    :return: None
+    """
+    if callback in SUBSCRIBERS:
+        SUBSCRIBERS.remove(callback)
+
+
+def publish(kind: str, batch: Batch = None, tank: Tank = None):
+    """
+    A function which tells every subscriber about a change to a tank or batch.
+
+    :param kind: str
+    :param batch: Batch = None
+    :param tank: Tank = None
+    :return: None
+    """
+    if SUBSCRIBERS:
+        event = ChangeEvent(kind, batch, tank)
+        for callback in list(SUBSCRIBERS):
+            callback(event)
+
+
+@instrumentation.instrumented
+def open_state_store(path: str = STATE_FILE):
+    """
+    A function which opens the state store, loads the tanks and batches saved in it, and saves every
+    change made from then on. It should be called once, before any tanks or batches are created.
+
+    Only the tanks and the batches that have not reached stage 4 are loaded straight away. Batches
+    at stage 4 are loaded the first time they are needed, so opening a store with a long history of
+    delivered batches is just as quick as opening a new one.
+
+    :param path: str = STATE_FILE
+    :return: None
+    """
+    import brewery_store
+
+    store = brewery_store.StateStore(path)
+    STATE_STORE[0] = store
+
+    tanks: dict = {}
+    for name, max_volume, capability, current_state in store.load_tanks():
+        tanks[name] = find_tank(name) or Tank(name, max_volume, capability, current_state)
+
+    for row in store.load_active_batches():
+        batch = batch_from_row(row)
+        tank = tanks.pop(row[5], None) if batch.stage_code in (2, 3) else None
+        if BATCHES.get(batch.name) is None:
+            BATCHES.restore(batch, batch if tank is None else Placement(batch, tank))
+
+    for tank in tanks.values():
+        if find_tank(tank.name) is None:
+            available_tanks.add(tank)
+
+    BATCHES.load_delivered = lambda: (batch_from_row(row) for row in store.iter_delivered_batches())
+    BATCHES.load_batch = lambda name: batch_from_row(store.load_batch(name))
+
+
+def batch_from_row(row: tuple) -> Batch:
+    """
+    A function which creates a Batch from a row of the state store.
+
+    :param row: tuple - (name, recipe, quantity, stage, time_started, tank), or None
+    :return: Batch - or None if the row is None
+    """
+    if row is None:
+        return None
+    name, recipe, quantity, stage, time_started, _tank = row
+    batch = Batch(name, recipe, quantity, stage)
+    batch.time_started = time_started
+    return batch
+
+
+@contextmanager
+def state_transaction():
+    """
+    A function which groups every change saved inside a with block into one transaction of the
+    state store. If no state store is open, nothing is done.
+
+    :return: None
+    """
+    store = STATE_STORE[0]
+    if store is None:
+        yield
+    else:
+        with store.transaction():
+            yield
+
+
+def brewery_at(when: datetime) -> tuple:
+    """
+    A function which rebuilds the tanks and batches as they were at a point in time, from the
+    journal of the state store.
+
+    :param when: datetime
+    :return: (tanks, batches, placed): tuple - a list of Tank, a list of Batch and a dict of the
+    name of each batch in a tank to the name of that tank, or None if no state store is open
+    """
+    store = STATE_STORE[0]
+    if store is None:
+        return None
+    tank_rows, batch_rows = store.state_at(when)
+    tanks = [
+        Tank(name, max_volume, capability, current_state)
+        for name, (max_volume, capability, current_state) in tank_rows.items()
+    ]
+    batches = [batch_from_row((name,) + row) for name, row in batch_rows.items()]
+    placed = {name: row[4] for name, row in batch_rows.items() if row[4] is not None}
+    return tanks, batches, placed
+
+
+def save_batch_stage(batch: Batch, tank: Tank = None):
+    """
+    A function which saves the stage, time started and tank of a batch to the state store, if one
+    is open.
+
+    :param batch: Batch
+    :param tank: Tank = None
+    :return: None
+    """
+    store = STATE_STORE[0]
+    if store is not None:
+        store.move_batch(
+            batch.name, batch.stage, batch.time_started, None if tank is None else tank.name
+        )
+
+
+def clear_brewery():
+    """
+    A function which removes every tank and batch, so that scripts such as the benchmarks can start
+    again from an empty brewery. Nothing is removed from the state store.
+
+    :return: None
+    """
+    BATCHES.clear()
+    available_tanks.clear()
+
+
+@instrumentation.instrumented
 def create_new_tank(name: str, max_volume: int, capability: str):
     """
     A function which creates a new Tank object.
@@ -133,8 +713,11 @@ def create_new_tank(name: str, max_volume: int, capability: str):
     :return: None
     """
     try:
-        tank = Tank(name, max_volume, capability, "Idle")
-        available_tanks.append(tank)
+        tank = Tank(name, max_volume, capability, IDLE)
+        available_tanks.add(tank)
+        if STATE_STORE[0] is not None:
+            STATE_STORE[0].save_tank(name, max_volume, capability, tank.current_state)
+        publish(TANK_CREATED, tank=tank)
     except ValueError as e:
         print(e)
 
@@ -142,19 +725,14 @@ def create_new_tank(name: str, max_volume: int, capability: str):
 def create_required_tanks():
     """
     A function which creates Tank instances using details about the current tanks which the client
-    possesses.
+    possesses. Tanks that already exist, such as those loaded from the state store, are skipped.
 
     :return: None
     """
-    create_new_tank("Albert", 1000, "Fermenter/conditioner")
-    create_new_tank("Brigadier", 800, "Fermenter/conditioner")
-    create_new_tank("Camilla", 1000, "Fermenter/conditioner")
-    create_new_tank("Dylon", 800, "Fermenter/conditioner")
-    create_new_tank("Emily", 1000, "Fermenter/conditioner")
-    create_new_tank("Florence", 800, "Fermenter/conditioner")
-    create_new_tank("Gertrude", 680, "Conditioner")
-    create_new_tank("Harry", 680, "Conditioner")
-    create_new_tank("R2D2", 800, "Fermenter")
+    existing = {tank.name for tank in all_tanks()}
+    for name, max_volume, capability in REQUIRED_TANKS:
+        if name not in existing:
+            create_new_tank(name, max_volume, capability)
 
 
 def create_new_batch_manual_entry():
@@ -170,6 +748,7 @@ def create_new_batch_manual_entry():
     create_new_batch(name, recipe, quantity)
 
 
+@instrumentation.instrumented
 def create_new_batch(name: str, recipe: str, quantity: int):
     """
     A function which creates a new Batch instance.
@@ -177,7 +756,7 @@ def create_new_batch(name: str, recipe: str, quantity: int):
     This function creates a new Batch instance using user input for name, quantity
     (number of bottles) and recipe. The recipe can only be one of three set recipes
     (Organic Pilsner, Organic Dunkel and Organic Red Helles). Client has not specified the need to
-     be able to make batches of other recipes.
+     be able to make batches of other recipes. Each batch must have a different name.
 
     :return: None
     """
@@ -186,7 +765,10 @@ def create_new_batch(name: str, recipe: str, quantity: int):
 
         if quantity <= 2000 and recipe in VALID_RECIPE:
             batch = Batch(name, recipe, quantity)
-            batches_s1.append(batch)
+            BATCHES.add(batch)
+            if STATE_STORE[0] is not None:
+                STATE_STORE[0].save_batch(name, recipe, quantity, batch.stage, batch.time_started)
+            publish(BATCH_CREATED, batch)
         elif quantity > 2000:
             print("You cannot make that many bottles in one batch.")
             create_new_batch()
@@ -198,22 +780,43 @@ def create_new_batch(name: str, recipe: str, quantity: int):
 
 def show_relevant_tanks(stage: str, batch_volume: int):
     """
-    A function which shows all available tanks which can be used for a batch at stage 2 or 3.
-    Does not show tanks which can ferment and condition and have batches already.
+    A function which shows all available tanks which can be used for a batch at stage 2 or 3,
+    smallest first. Does not show tanks which can ferment and condition and have batches already.
 
     :param stage: str
     :param batch_volume: int
     :return: None
     """
-    for tank in available_tanks:
-        if stage == "2":
-            if tank.capability in [FERMENTER, FERMENTER_CONDITIONER] and tank.max_volume >= \
-                    batch_volume:
-                print(tank.name)
-        if stage == "3":
-            if tank.capability in [CONDITIONER, FERMENTER_CONDITIONER] and tank.max_volume >= \
-                    batch_volume:
-                print(tank.name)
+    for tank in relevant_tanks(stage, batch_volume):
+        print(tank.name)
+
+
+def relevant_tanks(stage: str, batch_volume: int) -> list:
+    """
+    A function which returns all available tanks which can be used for a batch at stage 2 or 3,
+    smallest first.
+
+    :param stage: str
+    :param batch_volume: int
+    :return: list
+    """
+    if stage not in STAGE_CAPABILITY_CODES:
+        return []
+    return available_tanks.fitting(STAGE_CAPABILITY_CODES[stage], batch_volume)
+
+
+def best_fit_tank(stage: str, batch_volume: int) -> Tank:
+    """
+    A function which returns the smallest available tank which can be used for a batch at stage 2
+    or 3, or None if no available tank is big enough.
+
+    :param stage: str
+    :param batch_volume: int
+    :return: Tank
+    """
+    if stage not in STAGE_CAPABILITY_CODES:
+        return None
+    return available_tanks.smallest(STAGE_CAPABILITY_CODES[stage], batch_volume)
 
 
 def choose_tank(stage: str, batch_volume: int) -> str:
@@ -255,46 +858,78 @@ def view_by_stage(stage: str) -> None:
             print(batch.name, "is at stage 1, waiting to move onto stage 2.")
     elif stage == "2":
         for batch in batches_s2:
-            print(batch["batch"].name, "is at stage 2 in tank", batch["tank"].name,
+            print(batch.batch.name, "is at stage 2 in tank", batch.tank.name,
                   ", waiting to move onto stage 3.")
     elif stage == "3":
         for batch in batches_s3:
-            print(batch["batch"].name, "is at stage 3 in tank", batch["tank"].name,
+            print(batch.batch.name, "is at stage 3 in tank", batch.tank.name,
                   ", waiting to move onto stage 4.")
     elif stage == "4":
         for batch in batches_s4:
             print(batch.name, "is at stage 4, waiting to be delivered.")
 
 
+@instrumentation.instrumented
 def view_all_batches_as_list(stage_4: bool = False) -> list:
     """
     A function which appends the names of every batch into one list.
 
     :return: all_batches: list
     """
-    all_batches = []
-    for batch in batches_s1:
-        all_batches.append(batch)
+    all_batches = list(batches_s1)
     for batch in batches_s2:
-        all_batches.append(batch["batch"])
+        all_batches.append(batch.batch)
     for batch in batches_s3:
-        all_batches.append(batch["batch"])
+        all_batches.append(batch.batch)
     if stage_4:
-        for batch in batches_s4:
-            all_batches.append(batch)
+        all_batches.extend(batches_s4)
     return all_batches
 
 
+def all_tanks() -> list:
+    """
+    A function which returns every tank in the brewery, both available and running.
+
+    :return: list
+    """
+    tanks = {tank.name: tank for tank in available_tanks}
+    for running in running_tanks:
+        tanks.setdefault(running.tank.name, running.tank)
+    return list(tanks.values())
+
+
+def find_batch(name: str) -> Batch:
+    """
+    A function which returns the batch with the given name, at any stage, or None if there is no
+    such batch.
+
+    :param name: str
+    :return: Batch
+    """
+    return BATCHES.get(name)
+
+
+def find_tank(name: str) -> Tank:
+    """
+    A function which returns the available tank with the given name, or None if there is no such
+    tank available.
+
+    :param name: str
+    :return: Tank
+    """
+    return available_tanks.get(name)
+
+
+@instrumentation.instrumented
 def move_to_stage_2(chosen_batch: str, chosen_tank: str, manual: bool = False):
     """
     A function which moves a batch from stage 1 to stage 2.
 
     This function asks the user to choose a batch from stage 1 which they would like to move to
     stage 2. It then displays all available tanks which can be used for stage 2 and asks the user to
-    choose one. A dictionary containing the batch and tank is then created and appended to
-    batches_s2 (a list of all batches at stage 2) and running_tanks (a list of all tanks that are
-    currently operating). The batch and tank are then removed from batches_s1 and available_tanks
-    respectively.
+    choose one. A Placement of the batch in the tank is then created and becomes the entry of
+    the batch in batches_s2 (the batches at stage 2) and running_tanks (the tanks that are currently
+    operating). The tank is then removed from available_tanks.
 
     :return: None
     """
@@ -302,36 +937,32 @@ def move_to_stage_2(chosen_batch: str, chosen_tank: str, manual: bool = False):
         chosen_batch = input(
             "Please input the name of the batch you would like to move to stage 2.\n>> "
         )
-    fermenter_dict = {}
-    for batch in batches_s1:
-        if batch.name == chosen_batch:
-            if manual:
-                chosen_tank = choose_tank("2", batch.volume)
+    batch = BATCHES.entry(chosen_batch, "1")
+    if batch is not None:
+        if manual:
+            chosen_tank = choose_tank("2", batch.volume)
 
-            for tank in available_tanks:
-                if tank.name == chosen_tank:
-                    batch.change_stage("2")
-                    batch.update_time()
-                    fermenter_dict.update({"batch": batch, "tank": tank})
-                    batches_s2.append(fermenter_dict)
-                    batches_s1.remove(batch)
-
-                    running_tanks.append(fermenter_dict)
-                    available_tanks.remove(tank)
+        tank = find_tank(chosen_tank)
+        if tank is not None:
+            available_tanks.remove(tank)
+            BATCHES.move(chosen_batch, "2", Placement(batch, tank))
+            save_batch_stage(batch, tank)
+            publish(STAGE_CHANGED, batch, tank)
+            publish(TANK_OCCUPIED, batch, tank)
 
 
+@instrumentation.instrumented
 def move_to_stage_3(chosen_batch: str, chosen_tank: str, manual: bool = False):
     """
     A function which moves a batch from stage 2 to stage 3.
 
     This function asks the user which batch from stage 2 they would like to move to stage 3. If said
     batch is in a tank with the ability to ferment and condition (stage 2 and stage 3), the batch is
-    not moved out of the tank; it is instead updated to stage 3 and moved into batches_s3 (list of
+    not moved out of the tank; it is instead updated to stage 3 and moved into batches_s3 (the
     batches at stage 3). The tank it is in is not changed. If the tank it is in is not able to
     condition (stage 3), any available tanks are displayed and the user is asked to choose one. The
-    original tank is moved back into available_tanks and a new dictionary containing the batch and
-    new tank is created. This dictionary is appended to batches_s3 (list of all batches at stage 3)
-    and added to the list of running_tanks.
+    original tank is moved back into available_tanks and a new Placement of the batch in the new
+    tank becomes the entry of the batch in batches_s3 and running_tanks.
 
     :return: None
     """
@@ -339,34 +970,29 @@ def move_to_stage_3(chosen_batch: str, chosen_tank: str, manual: bool = False):
         chosen_batch = input(
             "Please input the name of the batch you would like to move to stage 3.\n>> "
         )
-    conditioner_dict = {}
-    for batch in batches_s2[:]:
-        if batch["batch"].name == chosen_batch:
-            if manual:
-                chosen_tank = choose_tank("3", batch["batch"].volume)
-
-            if batch["tank"].capability in [FERMENTER_CONDITIONER]:
-                batch["batch"].change_stage("3")
-                batch["batch"].update_time()
-                conditioner_dict.update({"batch": batch["batch"], "tank": batch["tank"]})
-                batches_s3.append(conditioner_dict)
-                batches_s2.remove(batch)
-
-            else:
-                for tank in available_tanks:
-                    if tank.name == chosen_tank:
-                        batches_s2.remove(batch)
-                        batch["batch"].change_stage("3")
-                        batch["batch"].update_time()
-
-                        conditioner_dict.update({"batch": batch["batch"], "tank": tank})
-
-                        available_tanks.remove(tank)
-                        running_tanks.append(conditioner_dict)
-
-                        batches_s3.append(conditioner_dict)
+    batch = BATCHES.entry(chosen_batch, "2")
+    if batch is not None:
+        if manual:
+            chosen_tank = choose_tank("3", batch.batch.volume)
 
+        if batch.tank.capability_code == FERMENTER_CONDITIONER_CODE:
+            BATCHES.move(chosen_batch, "3", Placement(batch.batch, batch.tank))
+            save_batch_stage(batch.batch, batch.tank)
+            publish(STAGE_CHANGED, batch.batch, batch.tank)
 
+        else:
+            tank = find_tank(chosen_tank)
+            if tank is not None:
+                available_tanks.remove(tank)
+                BATCHES.move(chosen_batch, "3", Placement(batch.batch, tank))
+                available_tanks.add(batch.tank)
+                save_batch_stage(batch.batch, tank)
+                publish(STAGE_CHANGED, batch.batch, tank)
+                publish(TANK_FREED, batch.batch, batch.tank)
+                publish(TANK_OCCUPIED, batch.batch, tank)
+
+
+@instrumentation.instrumented
 def move_to_stage_4(chosen_batch: str, manual: bool = False):
     """
     A function which moves batches from stage 3 to stage 4.
@@ -378,16 +1004,70 @@ def move_to_stage_4(chosen_batch: str, manual: bool = False):
             "Please input the name of the batch you would like to move to stage 3.\n>> "
         )
 
-    for batch in batches_s3:
-        if batch["batch"].name == chosen_batch:
-            batch["batch"].change_stage("4")
-            batch["batch"].update_time()
-            available_tanks.append(batch["tank"])
-            running_tanks.remove(batch)
-            batches_s4.append(batch["batch"])
-            batches_s3.remove(batch)
+    batch = BATCHES.entry(chosen_batch, "3")
+    if batch is not None:
+        BATCHES.move(chosen_batch, "4")
+        available_tanks.add(batch.tank)
+        save_batch_stage(batch.batch)
+        publish(STAGE_CHANGED, batch.batch)
+        publish(TANK_FREED, batch.batch, batch.tank)
+
+
+@instrumentation.instrumented
+def auto_move_batch(chosen_batch: str) -> str:
+    """
+    A function which moves a batch on to the next stage, putting it in the best fitting available
+    tank (the smallest one that can hold it) if it needs one.
 
+    A batch at stage 2 that is already in a tank which can condition stays in that tank. The name of
+    the tank the batch is in afterwards is returned, or None if the batch was not moved because no
+    tank was big enough, or if it is not in a tank (stage 4).
+
+    :param chosen_batch: str
+    :return: str
+    """
+    batch = find_batch(chosen_batch)
+    if batch is None:
+        return None
+
+    if batch.stage_code == 1:
+        tank = best_fit_tank("2", batch.volume)
+        if tank is not None:
+            move_to_stage_2(chosen_batch, tank.name)
+            return tank.name
+    elif batch.stage_code == 2:
+        tank = BATCHES.entry(chosen_batch, "2").tank
+        if tank.capability_code != FERMENTER_CONDITIONER_CODE:
+            tank = best_fit_tank("3", batch.volume)
+        if tank is not None:
+            move_to_stage_3(chosen_batch, tank.name)
+            return tank.name
+    elif batch.stage_code == 3:
+        move_to_stage_4(chosen_batch)
+    return None
+
+
+@instrumentation.instrumented
+def auto_allocate_batches() -> dict:
+    """
+    A function which moves as many batches as possible from stage 1 into fermenting tanks, without
+    the user choosing each tank. The largest batches are placed first, each in the smallest
+    available tank that can hold it (best fit decreasing), which leaves the larger tanks free for
+    as long as possible.
 
+    :return: placed: dict - the name of the tank each batch was moved into, keyed by batch name
+    """
+    placed = {}
+    with state_transaction():
+        for batch in sorted(batches_s1, key=lambda waiting: waiting.volume, reverse=True):
+            tank = best_fit_tank("2", batch.volume)
+            if tank is not None:
+                move_to_stage_2(batch.name, tank.name)
+                placed[batch.name] = tank.name
+    return placed
+
+
+@instrumentation.instrumented
 def suggest_next_beer(file_name: str):
     """
     A function which suggests which beer to make next, based on a prediction of the current months
@@ -396,6 +1076,8 @@ def suggest_next_beer(file_name: str):
     :param file_name: str
     :return: None
     """
+    import csv_prediction as predict
+
     current_month = datetime.now().strftime("%b")
     pilsner_predict = predict.predict_for_given_month("Organic Pilsner", current_month, file_name)
     helles_predict = predict.predict_for_given_month("Organic Red Helles", current_month, file_name)
@@ -409,6 +1091,7 @@ def suggest_next_beer(file_name: str):
         print("Dunkel could be the most wanted beer this month.")
 
 
+@instrumentation.instrumented
 def time_at_stage(chosen_batch: str) -> tuple:
     """
     A function which returns the number of weeks and hours a batch has been at a stage for.
@@ -416,23 +1099,24 @@ def time_at_stage(chosen_batch: str) -> tuple:
     :param chosen_batch: str
     :return: weeks, hours: tuple
     """
-    for batch in view_all_batches_as_list():
-        if batch.name == chosen_batch:
-            time_now = datetime.now()
-
-            time_difference = time_now - batch.time_started
-            seconds = time_difference.seconds
-            weeks = seconds / (86400 * 7)
-            hours = seconds / 3600
-            if weeks < 1:
-                if hours < 1:
-                    return 0, 0
-                else:
-                    return 0, hours
+    batch = BATCHES.get(chosen_batch)
+    if batch is not None and batch.stage_code != 4:
+        time_now = datetime.now()
+
+        time_difference = time_now - batch.time_started
+        seconds = time_difference.seconds
+        weeks = seconds / (86400 * 7)
+        hours = seconds / 3600
+        if weeks < 1:
+            if hours < 1:
+                return 0, 0
             else:
-                return weeks, hours
+                return 0, hours
+        else:
+            return weeks, hours
 
 
+@instrumentation.instrumented
 def upload_csv():
     """
     A function which allows the ability to upload a new CSV file with sales data.
@@ -445,6 +1129,9 @@ def upload_csv():
 
     :return: None
     """
+    import csv
+    import csv_prediction as predict
+
     file_name = input(
         "Please input the file name of the csv file you would like to use for predictions.\n>> "
     )
@@ -462,6 +1149,7 @@ def upload_csv():
                 "Gyle Number",
                 "Quantity ordered"
             ]
+            instrumentation.count_file_open()
             with open(file_name, mode="r") as csv_file:
                 csv_reader = csv.reader(csv_file, delimiter=",")
                 headings = next(csv_reader)
@@ -475,7 +1163,10 @@ def upload_csv():
                     csv_file.close()
                     raise ValueError("One or more of the required columns are missing.")
                 else:
+                    # The chosen file may be the same one, changed since it was last read.
+                    sales_data.invalidate_cache(CSV_FILE[0])
                     CSV_FILE[0] = file_name
+                    predict.convert_to_sidecar(file_name)
         except ValueError as e:
             print(e)
         except FileNotFoundError:
@@ -0,0 +1,359 @@
+"""
+This module is responsible for saving the tanks and batches of the brewery to an SQLite database, so
+that they are not lost when the program is closed. The database is opened in WAL mode, every change
+is a single small transaction (or part of a larger one, if several changes are made together), and
+the same SQL statements are reused so that SQLite only prepares each of them once.
+
+The store only deals with rows of plain values; brewery_monitoring turns them back into Tank and
+Batch objects.
+
+Every change is also written as an event to an append-only journal in the same transaction, so there
+is a full history of what happened and when. Every SNAPSHOT_INTERVAL events a compacted snapshot of
+all tanks and batches is taken, so the state of the brewery at any point in time can be rebuilt by
+loading the latest snapshot before it and replaying only the events after that snapshot.
+"""
+# Imports
+import json
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+# Constants
+SCHEMA: tuple = (
+    "CREATE TABLE IF NOT EXISTS tanks ("
+    " name TEXT PRIMARY KEY, max_volume INTEGER NOT NULL, capability TEXT NOT NULL,"
+    " current_state TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS batches ("
+    " name TEXT PRIMARY KEY, recipe TEXT NOT NULL, quantity INTEGER NOT NULL, stage TEXT NOT NULL,"
+    " time_started TEXT NOT NULL, tank TEXT)",
+    "CREATE INDEX IF NOT EXISTS batches_by_stage ON batches (stage)",
+    "CREATE TABLE IF NOT EXISTS events ("
+    " seq INTEGER PRIMARY KEY AUTOINCREMENT, time TEXT NOT NULL, kind TEXT NOT NULL,"
+    " subject TEXT NOT NULL, data TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS events_by_subject ON events (subject)",
+    "CREATE TABLE IF NOT EXISTS snapshots ("
+    " seq INTEGER PRIMARY KEY, time TEXT NOT NULL, state TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS gyles (gyle INTEGER PRIMARY KEY, batch TEXT NOT NULL UNIQUE)",
+)
+# How many events are journalled between two snapshots.
+SNAPSHOT_INTERVAL: int = 500
+SAVE_TANK: str = "INSERT OR REPLACE INTO tanks VALUES (?, ?, ?, ?)"
+SAVE_BATCH: str = "INSERT OR REPLACE INTO batches VALUES (?, ?, ?, ?, ?, ?)"
+MOVE_BATCH: str = "UPDATE batches SET stage = ?, time_started = ?, tank = ? WHERE name = ?"
+SELECT_TANKS: str = "SELECT name, max_volume, capability, current_state FROM tanks ORDER BY rowid"
+SELECT_ACTIVE_BATCHES: str = (
+    "SELECT name, recipe, quantity, stage, time_started, tank FROM batches WHERE stage != '4'"
+    " ORDER BY time_started, rowid"
+)
+SELECT_DELIVERED_BATCHES: str = (
+    "SELECT name, recipe, quantity, stage, time_started, tank FROM batches WHERE stage = '4'"
+    " ORDER BY time_started, rowid"
+)
+SELECT_BATCH: str = (
+    "SELECT name, recipe, quantity, stage, time_started, tank FROM batches WHERE name = ?"
+)
+SELECT_BATCH_TANK: str = "SELECT tank FROM batches WHERE name = ?"
+SELECT_ALL_BATCHES: str = (
+    "SELECT name, recipe, quantity, stage, time_started, tank FROM batches ORDER BY rowid"
+)
+SAVE_EVENT: str = "INSERT INTO events (time, kind, subject, data) VALUES (?, ?, ?, ?)"
+SELECT_LAST_EVENT: str = "SELECT COALESCE(MAX(seq), 0) FROM events"
+SELECT_EVENTS: str = "SELECT seq, time, kind, subject, data FROM events WHERE seq > ? ORDER BY seq"
+SELECT_SUBJECT_EVENTS: str = (
+    "SELECT seq, time, kind, subject, data FROM events WHERE subject = ? AND seq > ? ORDER BY seq"
+)
+SAVE_SNAPSHOT: str = "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)"
+SELECT_LAST_SNAPSHOT: str = "SELECT COALESCE(MAX(seq), -1) FROM snapshots"
+SAVE_GYLE: str = "INSERT INTO gyles VALUES (?, ?)"
+SELECT_GYLES: str = "SELECT gyle, batch FROM gyles ORDER BY gyle"
+SELECT_SNAPSHOT_BEFORE: str = (
+    "SELECT seq, state FROM snapshots WHERE time <= ? ORDER BY seq DESC LIMIT 1"
+)
+
+
+# Classes
+class StateStore:
+    """
+    This class is used to define an SQLite database that holds the tanks and batches of the brewery.
+
+    attributes:
+    path: str - the path of the database file
+    connection: sqlite3.Connection - the open connection to the database
+    depth: int - how many transaction blocks are currently open
+    snapshot_seq: int - the number of the last event included in the latest snapshot
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path, isolation_level=None, cached_statements=32)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.depth: int = 0
+        with self.transaction():
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+            self.snapshot_seq: int = self.connection.execute(SELECT_LAST_SNAPSHOT).fetchone()[0]
+            if self.snapshot_seq < 0:
+                # The first snapshot holds whatever was saved before the journal was started.
+                self.take_snapshot()
+
+    @contextmanager
+    def transaction(self):
+        """
+        A class method which groups every change made inside a with block into one transaction.
+        Blocks can be nested; the transaction is committed when the outermost block ends, or rolled
+        back if it ends with an exception.
+
+        :return: None
+        """
+        if self.depth == 0:
+            self.connection.execute("BEGIN")
+        self.depth += 1
+        try:
+            yield
+        except BaseException:
+            self.depth -= 1
+            if self.depth == 0:
+                self.connection.execute("ROLLBACK")
+            raise
+        self.depth -= 1
+        if self.depth == 0:
+            self.connection.execute("COMMIT")
+
+    def save_tank(self, name: str, max_volume: int, capability: str, current_state: str):
+        """
+        A class method which saves a tank, replacing any tank with the same name.
+
+        :param name: str
+        :param max_volume: int
+        :param capability: str
+        :param current_state: str
+        :return: None
+        """
+        with self.transaction():
+            self.connection.execute(SAVE_TANK, (name, max_volume, capability, current_state))
+            self.record("tank_saved", name, [max_volume, capability, current_state])
+
+    def save_batch(
+            self, name: str, recipe: str, quantity: int, stage: str, time_started: datetime,
+            tank: str = None):
+        """
+        A class method which saves a batch, replacing any batch with the same name.
+
+        :param name: str
+        :param recipe: str
+        :param quantity: int
+        :param stage: str
+        :param time_started: datetime
+        :param tank: str = None - the name of the tank the batch is in, if any
+        :return: None
+        """
+        with self.transaction():
+            self.connection.execute(
+                SAVE_BATCH, (name, recipe, quantity, stage, time_started.isoformat(), tank)
+            )
+            self.record(
+                "batch_saved", name, [recipe, quantity, stage, time_started.isoformat(), tank]
+            )
+            if tank is not None:
+                self.record("tank_assigned", tank, [name])
+
+    def move_batch(self, name: str, stage: str, time_started: datetime, tank: str = None):
+        """
+        A class method which saves the new stage, time started and tank of a batch.
+
+        :param name: str
+        :param stage: str
+        :param time_started: datetime
+        :param tank: str = None
+        :return: None
+        """
+        with self.transaction():
+            row = self.connection.execute(SELECT_BATCH_TANK, (name,)).fetchone()
+            old_tank = None if row is None else row[0]
+            self.connection.execute(MOVE_BATCH, (stage, time_started.isoformat(), tank, name))
+            self.record("batch_moved", name, [stage, time_started.isoformat(), tank])
+            if old_tank != tank:
+                if old_tank is not None:
+                    self.record("tank_released", old_tank, [name])
+                if tank is not None:
+                    self.record("tank_assigned", tank, [name])
+
+    def record(self, kind: str, subject: str, data: list):
+        """
+        A class method which appends an event to the journal, and takes a snapshot if enough events
+        have been journalled since the last one. It must be called inside a transaction block, so
+        that the event is saved together with the change it describes.
+
+        :param kind: str - what happened, such as "batch_moved"
+        :param subject: str - the name of the tank or batch it happened to
+        :param data: list - the new values, which must be JSON serialisable
+        :return: None
+        """
+        seq = self.connection.execute(
+            SAVE_EVENT, (now_text(), kind, subject, json.dumps(data, separators=(",", ":")))
+        ).lastrowid
+        if seq - self.snapshot_seq >= SNAPSHOT_INTERVAL:
+            self.take_snapshot()
+
+    def take_snapshot(self):
+        """
+        A class method which saves a compacted snapshot of every tank and batch, tagged with the
+        number of the last journalled event.
+
+        :return: None
+        """
+        with self.transaction():
+            seq = self.connection.execute(SELECT_LAST_EVENT).fetchone()[0]
+            state = {
+                "tanks": self.connection.execute(SELECT_TANKS).fetchall(),
+                "batches": self.connection.execute(SELECT_ALL_BATCHES).fetchall(),
+            }
+            self.connection.execute(
+                SAVE_SNAPSHOT, (seq, now_text(), json.dumps(state, separators=(",", ":")))
+            )
+            self.snapshot_seq = seq
+
+    def iter_events(self, subject: str = None, after: int = 0):
+        """
+        A generator which yields the journalled events in order, as (seq, time, kind, subject, data)
+        rows, with time as a datetime and data as a list.
+
+        :param subject: str = None - only yield the events of the tank or batch with this name
+        :param after: int = 0 - only yield the events with a larger seq than this
+        :return: Generator of tuple
+        """
+        if subject is None:
+            rows = self.connection.execute(SELECT_EVENTS, (after,))
+        else:
+            rows = self.connection.execute(SELECT_SUBJECT_EVENTS, (subject, after))
+        for seq, time, kind, name, data in rows:
+            yield seq, datetime.fromisoformat(time), kind, name, json.loads(data)
+
+    def state_at(self, when: datetime = None) -> tuple:
+        """
+        A class method which rebuilds the tanks and batches as they were at a point in time, by
+        loading the latest snapshot taken before it and replaying the events journalled after that
+        snapshot, up to that time.
+
+        :param when: datetime = None - by default now
+        :return: (tanks, batches): tuple - tanks is a dict of name to
+        (max_volume, capability, current_state), and batches is a dict of name to
+        (recipe, quantity, stage, time_started, tank), with time_started as a datetime
+        """
+        limit = now_text() if when is None else when.isoformat(timespec="microseconds")
+        tanks: dict = {}
+        batches: dict = {}
+        seq = 0
+        row = self.connection.execute(SELECT_SNAPSHOT_BEFORE, (limit,)).fetchone()
+        if row is not None:
+            seq, state = row[0], json.loads(row[1])
+            for name, max_volume, capability, current_state in state["tanks"]:
+                tanks[name] = (max_volume, capability, current_state)
+            for name, recipe, quantity, stage, time_started, tank in state["batches"]:
+                batches[name] = (recipe, quantity, stage, time_started, tank)
+
+        for row in self.connection.execute(SELECT_EVENTS, (seq,)):
+            _seq, time, kind, subject, data = row
+            if time > limit:
+                break
+            data = json.loads(data)
+            if kind == "tank_saved":
+                tanks[subject] = tuple(data)
+            elif kind == "batch_saved":
+                batches[subject] = tuple(data)
+            elif kind == "batch_moved" and subject in batches:
+                batches[subject] = batches[subject][:2] + tuple(data)
+
+        for name, (recipe, quantity, stage, time_started, tank) in batches.items():
+            batches[name] = (recipe, quantity, stage, datetime.fromisoformat(time_started), tank)
+        return tanks, batches
+
+    def load_tanks(self) -> list:
+        """
+        A class method which returns every tank as a (name, max_volume, capability, current_state)
+        row, in the order they were first saved.
+
+        :return: list
+        """
+        return self.connection.execute(SELECT_TANKS).fetchall()
+
+    def load_active_batches(self) -> list:
+        """
+        A class method which returns every batch that has not reached stage 4 as a
+        (name, recipe, quantity, stage, time_started, tank) row.
+
+        :return: list
+        """
+        return [convert_batch_row(row) for row in self.connection.execute(SELECT_ACTIVE_BATCHES)]
+
+    def iter_delivered_batches(self):
+        """
+        A generator which yields every batch at stage 4 as a
+        (name, recipe, quantity, stage, time_started, tank) row.
+
+        :return: Generator of tuple
+        """
+        for row in self.connection.execute(SELECT_DELIVERED_BATCHES):
+            yield convert_batch_row(row)
+
+    def load_batch(self, name: str) -> tuple:
+        """
+        A class method which returns the batch with the given name as a
+        (name, recipe, quantity, stage, time_started, tank) row, or None if there is no such batch.
+
+        :param name: str
+        :return: tuple
+        """
+        row = self.connection.execute(SELECT_BATCH, (name,)).fetchone()
+        return None if row is None else convert_batch_row(row)
+
+    def save_gyle(self, gyle: int, batch: str):
+        """
+        A class method which saves the gyle number given to a batch. An sqlite3.IntegrityError is
+        raised if the gyle or the batch already has one.
+
+        :param gyle: int
+        :param batch: str
+        :return: None
+        """
+        with self.transaction():
+            self.connection.execute(SAVE_GYLE, (gyle, batch))
+            self.record("gyle_assigned", batch, [gyle])
+
+    def load_gyles(self) -> list:
+        """
+        A class method which returns the gyle number of every batch that has one, as
+        (gyle, batch) rows.
+
+        :return: list
+        """
+        return self.connection.execute(SELECT_GYLES).fetchall()
+
+    def close(self):
+        """
+        A class method which closes the connection to the database.
+
+        :return: None
+        """
+        self.connection.close()
+
+
+# Functions
+def now_text() -> str:
+    """
+    A function which returns the current time as text that sorts in time order.
+
+    :return: str
+    """
+    return datetime.now().isoformat(timespec="microseconds")
+
+
+def convert_batch_row(row: tuple) -> tuple:
+    """
+    A function which converts the time started of a batch row from text back into a datetime.
+
+    :param row: tuple
+    :return: tuple
+    """
+    name, recipe, quantity, stage, time_started, tank = row
+    return name, recipe, quantity, stage, datetime.fromisoformat(time_started), tank
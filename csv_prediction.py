@@ -2,19 +2,156 @@
 This module is responsible for handling the data found within the provided CSV, to make predictions
 about sales in any given month in the future. It can also sort the data by month, by recipe and
 calculate figures such as percentage growth between months and the Average Annual Growth Rate.
+
+The results of the functions which only depend on the sales file are memoized, so asking for the
+same prediction again is a dictionary lookup. Each result is kept for the version of the file it
+was worked out from, found from the path, size and modification time of the file, so a file that
+has changed since is never answered from the memo. The memo is bounded to MEMO_SIZE results,
+dropping the least recently used, and is emptied whenever the cached sales data changes: when a
+file is chosen with brewery_monitoring.upload_csv, when new sales are read with ingest_new_sales,
+or when sales_data.invalidate_cache is called.
 """
 # Imports
 import csv
-from datetime import datetime
-import brewery_monitoring as b_m
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from functools import wraps
+import instrumentation
+import sales_data
+import sales_query
+
+# Global cache
+# The memoized results, keyed by (function name, arguments, size and modification time of the sales
+# file), least recently used first.
+MEMO: OrderedDict = OrderedDict()
+# The sales_data.GENERATION that the results in MEMO were worked out from.
+MEMO_GENERATION: list = [0]
+# Held while MEMO or MEMO_GENERATION is read or changed, as predictions are made on the thread of
+# the GUI and on its worker thread.
+MEMO_LOCK = threading.Lock()
 
 # Constants
 VALID_RECIPE: set = {"Organic Pilsner", "Organic Red Helles", "Organic Dunkel"}
 VALID_MONTH: list = [
     "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"
 ]
+# The number of months of sales, up to the latest month with orders, that the Average Annual
+# Growth Rate is worked out from.
+GROWTH_MONTHS: int = 12
+# The most results kept in MEMO.
+MEMO_SIZE: int = 256
+
+
+# Functions
+def memoized(function):
+    """
+    A decorator which keeps the results of a function that only depends on the sales file in MEMO,
+    so it is only worked out again when the sales file or the sales data changes. The function must
+    have a file_name parameter. Errors are not kept. A list or dictionary result is copied each
+    time it is returned, so that changing it cannot change the result kept in MEMO.
+
+    :param function: the function to memoize
+    :return: the memoized function
+    """
+    name = function.__name__
+    # The position of file_name among the arguments, as the parameters come first in co_varnames.
+    position = function.__code__.co_varnames.index("file_name")
+
+    @wraps(function)
+    def remembered(*args, **kwargs):
+        # The file name is already one of the arguments, so only its size and time are added.
+        stat = os.stat(args[position] if len(args) > position else kwargs["file_name"])
+        key = (name, args, tuple(sorted(kwargs.items())), stat.st_size, stat.st_mtime_ns)
+        with MEMO_LOCK:
+            forget_old_results()
+            if key in MEMO:
+                MEMO.move_to_end(key)
+                return copy_of(MEMO[key])
+
+        # The lock is not held while the result is worked out, as it may call other memoized
+        # functions.
+        result = function(*args, **kwargs)
+        with MEMO_LOCK:
+            # The sales data may have been read for the first time while working out the result.
+            forget_old_results()
+            MEMO[key] = result
+            if len(MEMO) > MEMO_SIZE:
+                MEMO.popitem(last=False)
+        return copy_of(result)
+
+    return remembered
+
+
+def copy_of(result):
+    """
+    A function which returns a copy of a list or dictionary result, or any other result as it is.
+    Tuples are returned as they are, so a memoized function whose result holds lists returns them
+    as tuples instead.
+
+    :param result: the result of a memoized function
+    :return: the result or its copy
+    """
+    if isinstance(result, list):
+        return list(result)
+    elif isinstance(result, dict):
+        return dict(result)
+    return result
+
+
+def forget_old_results():
+    """
+    A function which throws away every memoized result if the sales data has changed since they
+    were worked out. MEMO_LOCK must be held.
+
+    :return: None
+    """
+    if MEMO_GENERATION[0] != sales_data.GENERATION[0]:
+        MEMO.clear()
+        MEMO_GENERATION[0] = sales_data.GENERATION[0]
+
+
+def clear_memo():
+    """
+    A function which throws away every memoized result.
+
+    :return: None
+    """
+    with MEMO_LOCK:
+        MEMO.clear()
+        MEMO_GENERATION[0] = sales_data.GENERATION[0]
+
 
+def growth_keys(end_key: int) -> range:
+    """
+    A function which returns the month keys of the GROWTH_MONTHS months up to and including
+    end_key, the months that growth rates and predictions are worked out from.
+
+    :param end_key: int - the month key of the latest month with orders
+    :return: range
+    """
+    return range(end_key - GROWTH_MONTHS + 1, end_key + 1)
+
+
+def growth_year(month: str, file_name: str) -> int:
+    """
+    A function which finds the year of the latest month with the given name among the months that
+    growth rates and predictions are worked out from, so that a month named on its own means the
+    same sales as it does to forecast_matrix.
 
+    :param month: str
+    :param file_name: str
+    :return: int - the year, or None if the file has no orders in that month of the period
+    """
+    end_key = sales_data.load_dataset(file_name).last_key
+    if end_key is None:
+        return None
+    keys: list = [key for key in growth_keys(end_key) if key % 12 == sales_data.MONTH_INDEX[month]]
+    return keys[-1] // 12 if keys else None
+
+
+@instrumentation.instrumented
 def import_to_dicts(file_name: str = "Barnabys_sales_fabriacted_data.csv") -> list:
     """
     A function which imports the chosen CSV file into a list of dictionaries.
@@ -23,6 +160,7 @@ def import_to_dicts(file_name: str = "Barnabys_sales_fabriacted_data.csv") -> li
 
     :return: orders: list
     """
+    instrumentation.count_file_open()
     with open(file_name, mode="r") as csv_file:
         csv_reader = csv.reader(csv_file, delimiter=",")
         orders: list = []
@@ -31,97 +169,105 @@ def import_to_dicts(file_name: str = "Barnabys_sales_fabriacted_data.csv") -> li
             order: dict = {"date": row[2], "quantity": row[5], "recipe": row[3]}
             orders.append(order)
 
+        instrumentation.count_rows(len(orders))
         return orders
 
 
+@instrumentation.instrumented
+def convert_to_sidecar(file_name: str):
+    """
+    A function which converts the chosen CSV file into a binary columnar sidecar, so that later
+    predictions can read the sidecar instead of parsing the text. Nothing is done if the file
+    already has a sidecar that is up to date. If the sidecar cannot be written, the error is printed
+    and predictions carry on reading the CSV file.
+
+    :param file_name: str
+    :return: None
+    """
+    try:
+        sales_data.convert_to_sidecar(file_name)
+    except OSError as e:
+        print(e)
+
+
+@instrumentation.instrumented
 def sort_by_month(orders: list) -> tuple:
     """
-    A function which sorts the contents of the CSV file into months.
+    A function which sorts the contents of the CSV file into months, with the orders of every year
+    of the same month together.
 
     :param orders: List
 
     :return: tuple
     """
-    jan: list = []
-    feb: list = []
-    mar: list = []
-    apr: list = []
-    may: list = []
-    jun: list = []
-    jul: list = []
-    aug: list = []
-    sep: list = []
-    _oct: list = []
-    nov: list = []
-    dec: list = []
+    months: tuple = tuple([] for _month in VALID_MONTH)
     for order in orders:
-        if "Jan" in order["date"]:
-            jan.append(order)
-        elif "Feb" in order["date"]:
-            feb.append(order)
-        elif "Mar" in order["date"]:
-            mar.append(order)
-        elif "Apr" in order["date"]:
-            apr.append(order)
-        elif "May" in order["date"]:
-            may.append(order)
-        elif "Jun" in order["date"]:
-            jun.append(order)
-        elif "Jul" in order["date"]:
-            jul.append(order)
-        elif "Aug" in order["date"]:
-            aug.append(order)
-        elif "Sep" in order["date"]:
-            sep.append(order)
-        elif "Oct" in order["date"]:
-            _oct.append(order)
-        elif "Nov" in order["date"]:
-            nov.append(order)
-        elif "Dec" in order["date"]:
-            dec.append(order)
-
-    return jan, feb, mar, apr, may, jun, jul, aug, sep, _oct, nov, dec
+        # Dates are in the format 02-Nov-18, so the month is found with one split instead of
+        # looking for the name of every month in turn. Rows without a date are left out.
+        parts: list = order["date"].split("-")
+        month_index = sales_data.MONTH_INDEX.get(parts[1]) if len(parts) == 3 else None
+        if month_index is not None:
+            months[month_index].append(order)
+
+    return months
 
 
+@instrumentation.instrumented
 def get_month_data(month: str, file_name: str) -> list:
     """
-    A month which gets the data for a specified month.
+    A function which gets the data for a specified month, as a list of orders in the same form as
+    import_to_dicts, in the order they are in the file. The file is streamed chunk by chunk, and
+    only orders of a recipe in VALID_RECIPE are returned.
 
     :param month: str
     :param file_name: str
     :return: list
     """
-    jan, feb, mar, apr, may, jun, jul, aug, sep, _oct, nov, dec = \
-        sort_by_month(import_to_dicts(file_name))
-    if month == "Jan":
-        return jan
-    elif month == "Feb":
-        return feb
-    elif month == "Mar":
-        return mar
-    elif month == "Apr":
-        return apr
-    elif month == "May":
-        return may
-    elif month == "Jun":
-        return jun
-    elif month == "Jul":
-        return jul
-    elif month == "Aug":
-        return aug
-    elif month == "Sep":
-        return sep
-    elif month == "Oct":
-        return _oct
-    elif month == "Nov":
-        return nov
-    elif month == "Dec":
-        return dec
+    month_index: int = sales_data.MONTH_INDEX[month]
+    month_data: list = []
+    for chunk in sales_data.iter_chunks(file_name):
+        for ordinal, key, recipe_index, quantity in zip(
+                chunk.dates, chunk.months, chunk.recipes, chunk.quantities):
+            if key % 12 == month_index and recipe_index != sales_data.UNKNOWN_RECIPE:
+                month_data.append({
+                    "date": date.fromordinal(ordinal).strftime("%d-%b-%y"),
+                    "quantity": str(quantity),
+                    "recipe": sales_data.RECIPES[recipe_index],
+                })
+
+    return month_data
+
+
+@instrumentation.instrumented
+def get_month_totals(month: str, file_name: str) -> dict:
+    """
+    A function which gets the total quantity of each recipe ordered in a specified month of each
+    year, read from the month partitions of the cached dataset rather than the file.
 
+    :param month: str
+    :param file_name: str
+    :return: dict - quantity keyed by (year, recipe), in date order
+    """
+    month_index: int = sales_data.MONTH_INDEX[month]
+    month_totals: dict = {}
+    partitions: dict = sales_data.load_dataset(file_name).partitions
+    for key in sorted(partitions):
+        year, key_month = divmod(key, 12)
+        if key_month == month_index:
+            for recipe_index, quantity in enumerate(partitions[key]):
+                if quantity:
+                    month_totals[year, sales_data.RECIPES[recipe_index]] = quantity
 
+    return month_totals
+
+
+@instrumentation.instrumented
+@memoized
 def calc_month_quantity_by_recipe(month: str, recipe: str, file_name: str) -> int:
     """
-    A function which calculates the quantity of a specific recipe for a specific month.
+    A function which calculates the quantity of a specific recipe for a specific month, in the year
+    found by growth_year. The query is answered from the month by recipe table built when the file
+    was parsed.
 
     :param month: str
     :param recipe: str
@@ -133,15 +279,18 @@ def calc_month_quantity_by_recipe(month: str, recipe: str, file_name: str) -> in
     elif recipe not in VALID_RECIPE:
         raise ValueError("Recipe must be one of %s." % VALID_RECIPE)
     else:
-        month_data: list = get_month_data(month, file_name)
-        total_quantity: int = 0
-        for order in month_data:
-            if order.get("recipe") == recipe:
-                total_quantity: float = total_quantity + int(order.get("quantity"))
+        year = growth_year(month, file_name)
+        if year is None:
+            return 0
+        total_quantity: int = sales_query.run_query(
+            file_name, where={"year": year, "month": month, "recipe": recipe}
+        )
 
         return total_quantity
 
 
+@instrumentation.instrumented
+@memoized
 def calc_recipe_quantity_ratio(
         first_month: str,
         first_recipe: str,
@@ -175,10 +324,13 @@ def calc_recipe_quantity_ratio(
         return ratio
 
 
+@instrumentation.instrumented
+@memoized
 def calc_percent_growth_rate(
         last_month: str, this_month: str, recipe: str, file_name: str) -> float:
     """
-    A function which calculates the percentage growth between two months.
+    A function which calculates the percentage growth between two months, each in the year found
+    by growth_year, as forecast_matrix does.
 
     :param last_month: str
     :param this_month: str
@@ -199,9 +351,12 @@ def calc_percent_growth_rate(
         return percent_growth_rate
 
 
+@instrumentation.instrumented
+@memoized
 def calc_annual_growth_rate(recipe: str, file_name: str) -> float:
     """
-    A function which calculates the Average Annual Growth Rate.
+    A function which calculates the Average Annual Growth Rate. The rate is read from the growth
+    rates worked out for every recipe at once by forecast_matrix.
 
     :param recipe: str
     :param file_name: str
@@ -210,28 +365,245 @@ def calc_annual_growth_rate(recipe: str, file_name: str) -> float:
     if recipe not in VALID_RECIPE:
         raise ValueError("Recipe must be one of %s." % VALID_RECIPE)
     else:
-        total_growth: float = (
-                    calc_percent_growth_rate("Nov", "Dec", recipe, file_name)
-                    + calc_percent_growth_rate("Dec", "Jan", recipe, file_name)
-                    + calc_percent_growth_rate("Jan", "Feb", recipe, file_name)
-                    + calc_percent_growth_rate("Feb", "Mar", recipe, file_name)
-                    + calc_percent_growth_rate("Mar", "Apr", recipe, file_name)
-                    + calc_percent_growth_rate("Apr", "May", recipe, file_name)
-                    + calc_percent_growth_rate("May", "Jun", recipe, file_name)
-                    + calc_percent_growth_rate("Jun", "Jul", recipe, file_name)
-                    + calc_percent_growth_rate("Jul", "Aug", recipe, file_name)
-                    + calc_percent_growth_rate("Aug", "Sep", recipe, file_name)
-                    + calc_percent_growth_rate("Sep", "Oct", recipe, file_name)
-        )
-
-        annual_growth_rate: float = round((total_growth / 11), 2)
+        growth_rates, _matrix = forecast_matrix(file_name)
+        annual_growth_rate: float = growth_rates[sales_data.RECIPE_INDEX[recipe]]
         return annual_growth_rate
 
 
+@instrumentation.instrumented
+@memoized
+def forecast_matrix(file_name: str) -> tuple:
+    """
+    A function which predicts the quantity of every recipe for every month in the next year at once.
+
+    The Average Annual Growth Rate of each recipe is worked out from the last GROWTH_MONTHS months
+    of sales, read from the month partitions of the dataset, and then the sales of every month in
+    that period are grown by that rate. Only those months are read, so a forecast takes the same
+    time however many years of sales the file holds. The rounding is the same as
+    calc_percent_growth_rate, calc_annual_growth_rate and predict_for_given_month. The result is
+    kept on the dataset, so it is only worked out once for each version of the file. When new rows
+    are appended to the file, only the recipes that the new rows are for are worked out again,
+    unless they are for a later month, which moves the period for every recipe.
+
+    :param file_name: str
+    :return: (growth_rates, matrix): tuple - growth_rates is a tuple with one rate per recipe and
+    matrix is a tuple of rows, one per recipe, each a tuple with one prediction per month. Recipes
+    are in the order of sales_data.RECIPES and months are in the order of VALID_MONTH. The forecast
+    kept on the dataset is changed in place when new rows are read, so a copy of it is returned.
+    """
+    dataset = sales_data.load_dataset(file_name)
+
+    if dataset.forecast is None:
+        recipe_count: int = len(sales_data.RECIPES)
+        dataset.forecast = ([0.0] * recipe_count, [None] * recipe_count)
+        dataset.stale_recipes = set(range(recipe_count))
+
+    if dataset.forecast_end != dataset.last_key:
+        dataset.forecast_end = dataset.last_key
+        dataset.stale_recipes = set(range(len(sales_data.RECIPES)))
+
+    if dataset.stale_recipes:
+        growth_rates, matrix = dataset.forecast
+        for recipe_index in sorted(dataset.stale_recipes):
+            growth_rates[recipe_index], matrix[recipe_index] = \
+                forecast_recipe(dataset.partitions, dataset.last_key, recipe_index)
+        dataset.stale_recipes.clear()
+
+    growth_rates, matrix = dataset.forecast
+    return tuple(growth_rates), tuple(tuple(predictions) for predictions in matrix)
+
+
+def forecast_recipe(partitions: dict, end_key: int, recipe_index: int) -> tuple:
+    """
+    A function which works out the Average Annual Growth Rate of one recipe from the GROWTH_MONTHS
+    months of sales up to and including end_key, and grows the sales of each of those months by it.
+    A month with no sales of the recipe adds no growth to the month after it, and is not counted in
+    the average.
+
+    :param partitions: dict - the quantity of each recipe ordered in each month, keyed by month key
+    :param end_key: int - the month key of the latest month with orders, or None if there are none
+    :param recipe_index: int - the position of the recipe in sales_data.RECIPES
+    :return: (annual_growth_rate, predictions): tuple - a float and a list with one prediction per
+    month, in the order of VALID_MONTH
+    """
+    if end_key is None:
+        return 0.0, [0] * len(VALID_MONTH)
+
+    keys: range = growth_keys(end_key)
+    quantities: list = [
+        partitions[key][recipe_index] if key in partitions else 0 for key in keys
+    ]
+    growths: list = [
+        round(((this_quantity / last_quantity) - 1), 2)
+        for last_quantity, this_quantity in zip(quantities, quantities[1:])
+        if last_quantity
+    ]
+    annual_growth_rate: float = round((sum(growths) / len(growths)), 2) if growths else 0.0
+
+    month_quantities: list = [0] * len(VALID_MONTH)
+    for key, quantity in zip(keys, quantities):
+        month_quantities[key % 12] = quantity
+    predictions: list = [
+        round(month_quantity + (month_quantity * annual_growth_rate))
+        for month_quantity in month_quantities
+    ]
+    return annual_growth_rate, predictions
+
+
+def forecast_site(file_name: str) -> tuple:
+    """
+    A function which loads the sales file of one site and works out its forecast. It is run in a
+    worker process by forecast_sites, so it only returns plain lists and tuples.
+
+    :param file_name: str
+    :return: (partitions, forecast): tuple - the month partitions of the file and the
+    (growth_rates, matrix) returned by forecast_matrix
+    """
+    forecast = forecast_matrix(file_name)
+    return sales_data.load_dataset(file_name).partitions, forecast
+
+
+@instrumentation.instrumented
+def forecast_sites(file_names: list, workers: int = None) -> tuple:
+    """
+    A function which works out the forecast of several sites, each with its own sales file, at
+    once. The files are loaded and forecast in parallel, one process per CPU core (or workers
+    processes), and the forecast of all the sites together is worked out from the sum of their
+    month partitions, in the same way as the forecast of a single file.
+
+    If a file cannot be read, the error is printed and the site is left out.
+
+    :param file_names: list - the sales file of each site
+    :param workers: int = None - the number of processes to use, or None for one per CPU core
+    :return: (site_forecasts, combined): tuple - site_forecasts is a dict of the
+    (growth_rates, matrix) of each file, keyed by file name, and combined is the
+    (growth_rates, matrix) of all the sites together, or None if no file could be read
+    """
+    file_names = list(dict.fromkeys(file_names))
+    results: dict = {}
+
+    if len(file_names) <= 1 or workers == 1:
+        for file_name in file_names:
+            try:
+                results[file_name] = forecast_site(file_name)
+            except (OSError, ValueError) as e:
+                print(e)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                file_name: executor.submit(forecast_site, file_name) for file_name in file_names
+            }
+            for file_name, future in futures.items():
+                try:
+                    results[file_name] = future.result()
+                except (OSError, ValueError) as e:
+                    print(e)
+
+    if not results:
+        return {}, None
+
+    recipe_count: int = len(sales_data.RECIPES)
+    combined: dict = {}
+    for partitions, _forecast in results.values():
+        for key, partition in partitions.items():
+            if key not in combined:
+                combined[key] = [0] * recipe_count
+            for recipe_index in range(recipe_count):
+                combined[key][recipe_index] += partition[recipe_index]
+    end_key = max(combined, default=None)
+
+    growth_rates: list = []
+    matrix: list = []
+    for recipe_index in range(recipe_count):
+        annual_growth_rate, predictions = forecast_recipe(combined, end_key, recipe_index)
+        growth_rates.append(annual_growth_rate)
+        matrix.append(predictions)
+
+    site_forecasts = {file_name: forecast for file_name, (_totals, forecast) in results.items()}
+    return site_forecasts, (growth_rates, matrix)
+
+
+@instrumentation.instrumented
+def ingest_new_sales(file_name: str = None) -> int:
+    """
+    A function which reads only the sales that have been appended to the CSV file since it was last
+    read, so that the next prediction includes them without the whole file being read again. The
+    file defaults to the one chosen with brewery_monitoring.upload_csv.
+
+    :param file_name: str = None
+    :return: the number of new orders: int
+    """
+    if file_name is None:
+        file_name = sales_data.CSV_FILE[0]
+    return sales_data.ingest_new_rows(file_name)
+
+
+def refresh_forecast(file_name: str) -> tuple:
+    """
+    A function which reads any sales appended to the CSV file since it was last read, and then
+    returns its forecast, so that a forecast that is asked for again includes the new sales.
+
+    :param file_name: str
+    :return: (growth_rates, matrix): tuple - as returned by forecast_matrix
+    """
+    ingest_new_sales(file_name)
+    return forecast_matrix(file_name)
+
+
+@instrumentation.instrumented
+@memoized
+def top_customers(
+        recipe: str, file_name: str, count: int = 5, year: int = None, quarter: int = None) -> list:
+    """
+    A function which finds the customers who ordered the most of a recipe, read from the customer
+    rollup of the dataset. If a year is given, only orders from that year are counted, and if a
+    quarter (1 to 4) is given as well, only orders from that quarter of the year.
+
+    :param recipe: str
+    :param file_name: str
+    :param count: int = 5 - the most customers returned
+    :param year: int = None
+    :param quarter: int = None
+    :return: list - (customer, quantity) of each customer, the largest quantity first
+    """
+    if recipe not in VALID_RECIPE:
+        raise ValueError("Recipe must be one of %s." % VALID_RECIPE)
+    elif quarter is not None and (year is None or quarter not in (1, 2, 3, 4)):
+        raise ValueError("A quarter must be 1, 2, 3 or 4, and be given with a year.")
+    else:
+        where: dict = {"recipe": recipe}
+        if year is not None:
+            where["year"] = year
+        if quarter is not None:
+            where["quarter"] = quarter
+
+        quantities: dict = sales_query.run_query(file_name, group_by=("customer",), where=where)
+        ranked: list = sorted(quantities.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:count]
+
+
+@instrumentation.instrumented
+@memoized
+def invoice_totals(customer: str, file_name: str) -> dict:
+    """
+    A function which returns the total quantity of every invoice of a customer, read from the
+    invoice totals of the dataset.
+
+    :param customer: str
+    :param file_name: str
+    :return: dict - quantity keyed by invoice number
+    """
+    return sales_data.load_dataset(file_name).invoice_totals(customer)
+
+
+@instrumentation.instrumented
+@memoized
 def predict_for_given_month(recipe: str, month: str, file_name: str) -> float:
     """
     A function which predicts a quantity for a specific recipe for a specific month in the next
-    year.
+    year. The prediction is read from the matrix made by forecast_matrix.
 
     :param recipe: str
     :param month: str
@@ -243,19 +615,26 @@ def predict_for_given_month(recipe: str, month: str, file_name: str) -> float:
     elif month not in VALID_MONTH:
         raise ValueError("Month must be one of %s." % VALID_MONTH)
     else:
-        annual_growth_rate: float = calc_annual_growth_rate(recipe, file_name)
-        month_quantity: int = calc_month_quantity_by_recipe(month, recipe, file_name)
-
-        predict_quantity: float = round(month_quantity + (month_quantity * annual_growth_rate))
+        _growth_rates, matrix = forecast_matrix(file_name)
+        predict_quantity: float = \
+            matrix[sales_data.RECIPE_INDEX[recipe]][sales_data.MONTH_INDEX[month]]
 
         return predict_quantity
 
 
-def predict_on_current_stock() -> tuple:
+@instrumentation.instrumented
+def predict_on_current_stock(batches: list = None, forecast: tuple = None) -> tuple:
     """
     A function which can predict which beer should be made next based on sales figures and current
     batches of beer.
 
+    The forecast can be worked out beforehand, for example on a background thread, so that only the
+    quick comparison with the current batches is left to do.
+
+    :param batches: list = None - the current batches, which are taken from
+    brewery_monitoring.view_all_batches_as_list if not given
+    :param forecast: tuple = None - (growth_rates, matrix) as returned by forecast_matrix, which is
+    worked out from the current CSV file if not given
     :return: tuple
     """
     dunkel = 0
@@ -271,16 +650,22 @@ def predict_on_current_stock() -> tuple:
     else:
         in_two_month_index = current_month_index + 2
 
-    in_two_month = VALID_MONTH[in_two_month_index]
-
-    helles_predict = predict_for_given_month("Organic Red Helles", in_two_month, b_m.CSV_FILE[0])
-    dunkel_predict = predict_for_given_month("Organic Dunkel", in_two_month, b_m.CSV_FILE[0])
-    pilsner_predict = predict_for_given_month("Organic Pilsner", in_two_month, b_m.CSV_FILE[0])
+    if batches is None:
+        # brewery_monitoring imports this module in its own functions, so it is only imported here
+        # when the batches are not given.
+        import brewery_monitoring as b_m
+        batches = b_m.view_all_batches_as_list()
+    if forecast is None:
+        forecast = forecast_matrix(sales_data.CSV_FILE[0])
+    _growth_rates, matrix = forecast
+    helles_predict = matrix[sales_data.RECIPE_INDEX["Organic Red Helles"]][in_two_month_index]
+    dunkel_predict = matrix[sales_data.RECIPE_INDEX["Organic Dunkel"]][in_two_month_index]
+    pilsner_predict = matrix[sales_data.RECIPE_INDEX["Organic Pilsner"]][in_two_month_index]
 
     predict_stock = [helles_predict, dunkel_predict, pilsner_predict]
     print(predict_stock[0])
 
-    for batch in b_m.view_all_batches_as_list():
+    for batch in batches:
         if batch.recipe == "Organic Pilsner":
             pilsner = pilsner + batch.quantity
         elif batch.recipe == "Organic Dunkel":
@@ -322,6 +707,8 @@ def predict_on_current_stock() -> tuple:
 
 
 if __name__ == "__main__":
+    import brewery_monitoring as b_m
+
     b_m.create_new_batch("Batch 1", "Organic Dunkel", 100)
     b_m.create_new_batch("Batch 2", "Organic Dunkel", 100)
     b_m.create_new_batch("Batch 3", "Organic Dunkel", 100)
@@ -0,0 +1,278 @@
+"""
+This module is responsible for measuring how the prediction and monitoring code is used while the
+program runs. Functions are marked with the instrumented decorator, and once enable() has been
+called every call of those functions records how long it took, along with how many sales rows were
+scanned and how many files were opened while it ran (including by the functions it called).
+
+When instrumentation is not enabled, the decorator leaves the functions exactly as they are, so
+there is no cost at all. enable() replaces each marked function in its module with a measuring
+version and disable() puts the original back, so code which looks a function up in its module when
+calling it (as all the code in this program does) is measured.
+
+The measurements can be exported as a Prometheus text snapshot or as JSON:
+
+    import instrumentation
+    instrumentation.enable()
+    ...
+    print(instrumentation.export_prometheus())
+"""
+# Imports
+import sys
+import time
+from collections import deque
+from functools import wraps
+
+# Constants
+# The number of recent call times kept for each function, used to work out percentiles.
+SAMPLE_SIZE: int = 1024
+PERCENTILES: tuple = (0.5, 0.9, 0.99)
+METRIC_PREFIX: str = "brewery"
+
+# Global lists
+ENABLED: list = [False]
+# Every instrumented function, keyed by "module.name".
+REGISTERED: dict = {}
+# The FunctionMetrics of every instrumented function that has been called, keyed by "module.name".
+METRICS: dict = {}
+# The lock that guards METRICS, and the per-thread stacks of running functions, made by enable.
+STATE: dict = {"lock": None, "local": None}
+
+
+# Classes
+class FunctionMetrics:
+    """
+    This class is used to define the measurements of one instrumented function.
+
+    attributes:
+    name: str - "module.name" of the function
+    calls: int - how many times the function has been called
+    seconds: float - the total time spent in the function
+    samples: deque - the time taken by each of the most recent calls, at most SAMPLE_SIZE
+    rows: int - how many sales rows were scanned while the function ran
+    file_opens: int - how many files were opened while the function ran
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.calls: int = 0
+        self.seconds: float = 0.0
+        self.samples: deque = deque(maxlen=SAMPLE_SIZE)
+        self.rows: int = 0
+        self.file_opens: int = 0
+
+    def percentile(self, fraction: float) -> float:
+        """
+        A class method which returns a percentile of the recent call times.
+
+        :param fraction: float - from 0 to 1
+        :return: float
+        """
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def to_dict(self) -> dict:
+        """
+        A class method which returns the measurements as a dictionary.
+
+        :return: dict
+        """
+        summary = {
+            "calls": self.calls,
+            "total_seconds": self.seconds,
+            "rows_scanned": self.rows,
+            "file_opens": self.file_opens,
+        }
+        for fraction in PERCENTILES:
+            summary["p%g_seconds" % (fraction * 100)] = self.percentile(fraction)
+        return summary
+
+
+# Functions
+def instrumented(function):
+    """
+    A decorator which marks a function to be measured when instrumentation is enabled. The function
+    itself is returned unchanged.
+
+    :param function: the function to mark
+    :return: the same function
+    """
+    REGISTERED[function.__module__ + "." + function.__name__] = function
+    return function
+
+
+def measuring(name: str, function):
+    """
+    A function which makes the measuring version of an instrumented function.
+
+    :param name: str - "module.name" of the function
+    :param function: the function to measure
+    :return: the measuring function
+    """
+    clock = time.perf_counter
+
+    @wraps(function)
+    def measured(*args, **kwargs):
+        local = STATE["local"]
+        stack = getattr(local, "stack", None)
+        if stack is None:
+            stack = local.stack = []
+        with STATE["lock"]:
+            metrics = METRICS.get(name)
+            if metrics is None:
+                metrics = METRICS[name] = FunctionMetrics(name)
+        stack.append(metrics)
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = clock() - start
+            stack.pop()
+            with STATE["lock"]:
+                metrics.calls += 1
+                metrics.seconds += elapsed
+                metrics.samples.append(elapsed)
+
+    measured.instrumented_original = function
+    return measured
+
+
+def enable():
+    """
+    A function which starts measuring every instrumented function.
+
+    :return: None
+    """
+    import threading
+
+    if ENABLED[0]:
+        return
+    STATE["lock"] = threading.Lock()
+    STATE["local"] = threading.local()
+    for name, function in REGISTERED.items():
+        module = sys.modules.get(function.__module__)
+        if module is not None and getattr(module, function.__name__, None) is function:
+            setattr(module, function.__name__, measuring(name, function))
+    ENABLED[0] = True
+
+
+def disable():
+    """
+    A function which stops measuring, putting every instrumented function back as it was. The
+    measurements made so far are kept.
+
+    :return: None
+    """
+    for function in REGISTERED.values():
+        module = sys.modules.get(function.__module__)
+        current = getattr(module, function.__name__, None)
+        if getattr(current, "instrumented_original", None) is function:
+            setattr(module, function.__name__, function)
+    ENABLED[0] = False
+
+
+def reset():
+    """
+    A function which throws away every measurement made so far.
+
+    :return: None
+    """
+    METRICS.clear()
+
+
+def add_to_running(attribute: str, amount: int):
+    """
+    A function which adds an amount to a count of every instrumented function that is running on
+    this thread.
+
+    :param attribute: str - "rows" or "file_opens"
+    :param amount: int
+    :return: None
+    """
+    stack = getattr(STATE["local"], "stack", None)
+    if stack:
+        with STATE["lock"]:
+            # A function which is running more than once (such as upload_csv, which calls itself)
+            # is only counted once.
+            for metrics in {id(metrics): metrics for metrics in stack}.values():
+                setattr(metrics, attribute, getattr(metrics, attribute) + amount)
+
+
+def count_rows(amount: int):
+    """
+    A function which records that sales rows have been scanned. It does nothing unless
+    instrumentation is enabled.
+
+    :param amount: int
+    :return: None
+    """
+    if ENABLED[0]:
+        add_to_running("rows", amount)
+
+
+def count_file_open():
+    """
+    A function which records that a file has been opened. It does nothing unless instrumentation is
+    enabled.
+
+    :return: None
+    """
+    if ENABLED[0]:
+        add_to_running("file_opens", 1)
+
+
+def snapshot() -> dict:
+    """
+    A function which returns the measurements of every function that has been called, keyed by
+    "module.name".
+
+    :return: dict
+    """
+    if STATE["lock"] is None:
+        return {name: metrics.to_dict() for name, metrics in sorted(METRICS.items())}
+    with STATE["lock"]:
+        return {name: metrics.to_dict() for name, metrics in sorted(METRICS.items())}
+
+
+def export_json() -> str:
+    """
+    A function which returns the measurements as JSON.
+
+    :return: str
+    """
+    import json
+
+    return json.dumps({"enabled": ENABLED[0], "functions": snapshot()}, indent=2)
+
+
+def export_prometheus() -> str:
+    """
+    A function which returns the measurements in the Prometheus text format, with the time taken by
+    each function as a summary and the other measurements as counters.
+
+    :return: str
+    """
+    measurements = snapshot()
+    lines = []
+    counters = [
+        ("calls_total", "calls", "Number of calls of each instrumented function."),
+        ("rows_scanned_total", "rows_scanned", "Sales rows scanned during each function."),
+        ("file_opens_total", "file_opens", "Files opened during each function."),
+    ]
+    for metric, key, description in counters:
+        lines.append("# HELP %s_%s %s" % (METRIC_PREFIX, metric, description))
+        lines.append("# TYPE %s_%s counter" % (METRIC_PREFIX, metric))
+        for name, summary in measurements.items():
+            lines.append('%s_%s{function="%s"} %d' % (METRIC_PREFIX, metric, name, summary[key]))
+
+    metric = METRIC_PREFIX + "_call_seconds"
+    lines.append("# HELP %s Time taken by each instrumented function." % metric)
+    lines.append("# TYPE %s summary" % metric)
+    for name, summary in measurements.items():
+        for fraction in PERCENTILES:
+            lines.append('%s{function="%s",quantile="%g"} %.9f' % (
+                metric, name, fraction, summary["p%g_seconds" % (fraction * 100)]
+            ))
+        lines.append('%s_sum{function="%s"} %.9f' % (metric, name, summary["total_seconds"]))
+        lines.append('%s_count{function="%s"} %d' % (metric, name, summary["calls"]))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,366 @@
+"""
+This module is responsible for planning when and in which tank each waiting batch of beer will be
+fermented and conditioned. It takes the batches at stage 1, how long each recipe is expected to
+spend at stages 2 and 3, and the tanks of the brewery, and produces a plan of time slots for every
+tank over a planning horizon.
+
+Each batch is placed in turn, largest first. For every tank that could hold it, the earliest gap in
+that tank's timeline which is long enough is found (interval scheduling), and the batch is given the
+slot that finishes soonest, choosing the smallest suitable tank when slots finish at the same time
+(best fit bin packing). This keeps the tanks as busy as possible while leaving the larger tanks free
+for the larger batches.
+"""
+# Imports
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+import brewery_monitoring as b_m
+
+# Constants
+# Expected (fermenting, conditioning) time of each recipe.
+EXPECTED_DURATIONS: dict = {
+    "Organic Pilsner": (timedelta(weeks=2), timedelta(weeks=4)),
+    "Organic Red Helles": (timedelta(weeks=2), timedelta(weeks=3)),
+    "Organic Dunkel": (timedelta(weeks=2), timedelta(weeks=3)),
+}
+DEFAULT_HORIZON: timedelta = timedelta(weeks=12)
+HOUR: timedelta = timedelta(hours=1)
+# How many hours a tank is kept busy for a batch that has been in it longer than expected, since the
+# batch is still in the tank until it is moved.
+OVERDUE_HOURS: float = 1.0
+
+
+# Classes
+class TankTimeline:
+    """
+    This class is used to define the time slots at which a tank is busy during the plan.
+
+    attributes:
+    tank: Tank - the tank
+    starts: list - the start of each busy slot, in hours from the start of the plan, sorted
+    ends: list - the end of each busy slot, in the same order as starts
+    """
+    def __init__(self, tank):
+        self.tank = tank
+        self.starts: list = []
+        self.ends: list = []
+
+    def earliest_gap(self, release: float, duration: float) -> float:
+        """
+        A class method which returns the earliest time, no earlier than release, at which the tank
+        is free for the whole of duration.
+
+        :param release: float
+        :param duration: float
+        :return: float
+        """
+        start = release
+        # Slots are never overlapping, so the ends are sorted too and every slot that ends before
+        # release can be skipped.
+        for index in range(bisect_right(self.ends, release), len(self.starts)):
+            if self.starts[index] >= start + duration:
+                break
+            start = max(start, self.ends[index])
+        return start
+
+    def book(self, start: float, end: float):
+        """
+        A class method which marks the tank as busy between two times.
+
+        :param start: float
+        :param end: float
+        :return: None
+        """
+        index = bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+
+    def busy_hours(self, horizon: float) -> float:
+        """
+        A class method which returns how many hours the tank is busy before the horizon.
+
+        :param horizon: float
+        :return: float
+        """
+        return sum(
+            max(0.0, min(end, horizon) - max(start, 0.0))
+            for start, end in zip(self.starts, self.ends)
+        )
+
+
+class PlannedSlot:
+    """
+    This class is used to define one stage of one batch in the plan.
+
+    attributes:
+    batch: str - the name of the batch
+    recipe: str - the recipe of the batch
+    tank: str - the name of the tank the batch is in
+    stage: str - the stage of the batch in this slot, "2" (fermenting) or "3" (conditioning)
+    start: datetime - when the batch goes into the tank for this stage
+    end: datetime - when this stage is expected to finish
+    """
+    def __init__(
+            self, batch: str, recipe: str, tank: str, stage: str, start: datetime, end: datetime):
+        self.batch = batch
+        self.recipe = recipe
+        self.tank = tank
+        self.stage = stage
+        self.start = start
+        self.end = end
+
+    def __repr__(self) -> str:
+        return "PlannedSlot(%s, stage %s, %s, %s - %s)" % (
+            self.batch, self.stage, self.tank, self.start, self.end
+        )
+
+
+class ProductionPlan:
+    """
+    This class is used to define a plan made by plan_production.
+
+    attributes:
+    start: datetime - when the plan starts
+    horizon: timedelta - how far ahead the plan looks
+    slots: list - every PlannedSlot, in order of start time
+    unscheduled: list - the names of the batches that could not be finished within the horizon
+    utilisation: float - the share of tank time within the horizon that is used, from 0 to 1
+    """
+    def __init__(self, start: datetime, horizon: timedelta):
+        self.start = start
+        self.horizon = horizon
+        self.slots: list = []
+        self.unscheduled: list = []
+        self.utilisation: float = 0.0
+
+    def by_tank(self) -> dict:
+        """
+        A class method which groups the slots of the plan by tank name.
+
+        :return: dict
+        """
+        tanks: dict = {}
+        for slot in self.slots:
+            tanks.setdefault(slot.tank, []).append(slot)
+        return tanks
+
+
+# Functions
+def hours(duration: timedelta) -> float:
+    """
+    A function which converts a timedelta into hours.
+
+    :param duration: timedelta
+    :return: float
+    """
+    return duration / HOUR
+
+
+def can_ferment(tank) -> bool:
+    """
+    A function which checks whether a tank can be used for stage 2.
+
+    :param tank: Tank
+    :return: bool
+    """
+    return tank.capability_code in b_m.STAGE_CAPABILITY_CODES["2"]
+
+
+def can_condition(tank) -> bool:
+    """
+    A function which checks whether a tank can be used for stage 3.
+
+    :param tank: Tank
+    :return: bool
+    """
+    return tank.capability_code in b_m.STAGE_CAPABILITY_CODES["3"]
+
+
+def book_running_batches(timelines: dict, durations: dict, start: datetime):
+    """
+    A function which marks the tanks that already hold a batch as busy until that batch is expected
+    to leave them, or for OVERDUE_HOURS if it should already have left. A batch that is fermenting
+    in a tank that cannot condition must move to another tank to be conditioned, so once every
+    occupied tank has been booked, the tank it can be conditioned in soonest is booked for it as
+    well, from when it is expected to leave.
+
+    :param timelines: dict
+    :param durations: dict
+    :param start: datetime
+    :return: None
+    """
+    moving: list = []
+    for running in b_m.running_tanks:
+        batch, tank = running.batch, running.tank
+        if tank.name not in timelines:
+            continue
+        fermenting, conditioning = durations[batch.recipe]
+        if batch.stage_code == 2 and tank.capability_code == b_m.FERMENTER_CONDITIONER_CODE:
+            remaining = fermenting + conditioning
+        elif batch.stage_code == 2:
+            remaining = fermenting
+        else:
+            remaining = conditioning
+        leaves = max(hours(batch.time_started + remaining - start), OVERDUE_HOURS)
+        timelines[tank.name].book(0.0, leaves)
+        if batch.stage_code == 2 and not can_condition(tank):
+            moving.append((batch, tank, leaves, hours(conditioning)))
+
+    for batch, tank, leaves, conditioning in moving:
+        conditioner, condition_start = best_slot(
+            [timeline for timeline in timelines.values()
+             if can_condition(timeline.tank) and timeline.tank is not tank and
+             timeline.tank.max_volume >= batch.volume],
+            leaves, conditioning
+        )
+        if conditioner is not None:
+            conditioner.book(condition_start, condition_start + conditioning)
+
+
+def best_slot(candidates: list, release: float, duration: float) -> tuple:
+    """
+    A function which finds the tank that can fit a stage soonest, choosing the smallest tank when
+    two tanks are free at the same time.
+
+    :param candidates: list - TankTimelines of the tanks that can be used
+    :param release: float
+    :param duration: float
+    :return: (timeline, start): tuple - (None, None) if there are no candidates
+    """
+    best = (None, None)
+    best_key = None
+    for timeline in candidates:
+        start = timeline.earliest_gap(release, duration)
+        key = (start, timeline.tank.max_volume)
+        if best_key is None or key < best_key:
+            best, best_key = (timeline, start), key
+    return best
+
+
+def plan_production(
+        batches: list = None,
+        tanks: list = None,
+        durations: dict = None,
+        start: datetime = None,
+        horizon: timedelta = DEFAULT_HORIZON) -> ProductionPlan:
+    """
+    A function which plans the fermenting and conditioning of waiting batches across the tanks of
+    the brewery.
+
+    A batch is either fermented and conditioned in one fermenter/conditioner, or fermented in a
+    tank that can ferment and then moved to a tank that can condition. Both ways are tried for each
+    batch, and the one that finishes first is kept. Tanks that already hold a batch are busy until
+    that batch is expected to leave them, and a batch fermenting in a tank that cannot condition
+    keeps a conditioning tank booked for when it leaves. Batches that cannot be finished within the
+    horizon are left out of the plan and listed as unscheduled.
+
+    :param batches: list = None - the batches to plan, by default every batch at stage 1
+    :param tanks: list = None - the tanks to use, by default every tank in the brewery
+    :param durations: dict = None - the (fermenting, conditioning) timedeltas of each recipe, by
+    default EXPECTED_DURATIONS
+    :param start: datetime = None - when the plan starts, by default now
+    :param horizon: timedelta = DEFAULT_HORIZON
+    :return: plan: ProductionPlan
+    """
+    if batches is None:
+        batches = list(b_m.batches_s1)
+    if tanks is None:
+        tanks = b_m.all_tanks()
+    if durations is None:
+        durations = EXPECTED_DURATIONS
+    if start is None:
+        start = datetime.now()
+
+    plan = ProductionPlan(start, horizon)
+    limit = hours(horizon)
+    timelines = {tank.name: TankTimeline(tank) for tank in tanks}
+    book_running_batches(timelines, durations, start)
+
+    # Sorted by volume, so that the largest batches are placed first and fitting tanks can be found
+    # by skipping the tanks that are too small.
+    by_volume = sorted(timelines.values(), key=lambda timeline: timeline.tank.max_volume)
+    volumes = [timeline.tank.max_volume for timeline in by_volume]
+
+    for batch in sorted(batches, key=lambda waiting: waiting.volume, reverse=True):
+        fermenting, conditioning = (hours(duration) for duration in durations[batch.recipe])
+        fitting = by_volume[bisect_left(volumes, batch.volume):]
+
+        # Fermented and conditioned in the same fermenter/conditioner.
+        both = [
+            timeline for timeline in fitting
+            if timeline.tank.capability_code == b_m.FERMENTER_CONDITIONER_CODE
+        ]
+        same_tank, same_start = best_slot(both, 0.0, fermenting + conditioning)
+        same_end = None if same_tank is None else same_start + fermenting + conditioning
+
+        # Fermented in one tank, then moved to another to be conditioned.
+        fermenter, ferment_start = best_slot(
+            [timeline for timeline in fitting if can_ferment(timeline.tank)], 0.0, fermenting
+        )
+        conditioner, condition_start, moved_end = None, None, None
+        if fermenter is not None:
+            conditioner, condition_start = best_slot(
+                [timeline for timeline in fitting
+                 if can_condition(timeline.tank) and timeline is not fermenter],
+                ferment_start + fermenting, conditioning
+            )
+            if conditioner is not None:
+                moved_end = condition_start + conditioning
+
+        if same_end is not None and (moved_end is None or same_end <= moved_end) and \
+                same_end <= limit:
+            same_tank.book(same_start, same_end)
+            plan.slots.append(PlannedSlot(
+                batch.name, batch.recipe, same_tank.tank.name, "2",
+                start + same_start * HOUR, start + (same_start + fermenting) * HOUR
+            ))
+            plan.slots.append(PlannedSlot(
+                batch.name, batch.recipe, same_tank.tank.name, "3",
+                start + (same_start + fermenting) * HOUR, start + same_end * HOUR
+            ))
+        elif moved_end is not None and moved_end <= limit:
+            fermenter.book(ferment_start, ferment_start + fermenting)
+            conditioner.book(condition_start, moved_end)
+            plan.slots.append(PlannedSlot(
+                batch.name, batch.recipe, fermenter.tank.name, "2",
+                start + ferment_start * HOUR, start + (ferment_start + fermenting) * HOUR
+            ))
+            plan.slots.append(PlannedSlot(
+                batch.name, batch.recipe, conditioner.tank.name, "3",
+                start + condition_start * HOUR, start + moved_end * HOUR
+            ))
+        else:
+            plan.unscheduled.append(batch.name)
+
+    plan.slots.sort(key=lambda slot: (slot.start, slot.tank))
+    if timelines and limit > 0:
+        busy = sum(timeline.busy_hours(limit) for timeline in timelines.values())
+        plan.utilisation = busy / (limit * len(timelines))
+
+    return plan
+
+
+def print_plan(plan: ProductionPlan):
+    """
+    A function which prints a plan, one line per slot.
+
+    :param plan: ProductionPlan
+    :return: None
+    """
+    for slot in plan.slots:
+        print(
+            slot.batch, "in", slot.tank, "at stage", slot.stage, "from",
+            slot.start.strftime("%d-%b-%y %H:%M"), "to", slot.end.strftime("%d-%b-%y %H:%M")
+        )
+    for name in plan.unscheduled:
+        print(name, "cannot be finished within the planning horizon.")
+    print("Tank utilisation: %.0f%%" % (plan.utilisation * 100))
+
+
+if __name__ == "__main__":
+    b_m.create_required_tanks()
+    b_m.create_new_batch("Batch 1", "Organic Dunkel", 1500)
+    b_m.create_new_batch("Batch 2", "Organic Pilsner", 2000)
+    b_m.create_new_batch("Batch 3", "Organic Red Helles", 1200)
+    b_m.create_new_batch("Batch 4", "Organic Pilsner", 600)
+
+    print_plan(plan_production())
@@ -0,0 +1,851 @@
+"""
+This module is responsible for loading the sales CSV into memory. The file is parsed once into a
+SalesDataset and kept in a process-wide cache, keyed by the path, size and modification time of the
+file, so that every calculation in csv_prediction reads from the same parsed copy instead of
+re-opening the file.
+
+The file is read as a stream of fixed-size chunks. Each chunk holds the columns of its orders as
+compact arrays, and is totalled by month and recipe before the next chunk is read, so only the
+totals are kept in memory however large the file is. The date of each order is parsed once into a
+month key that counts months across years, and the totals are partitioned by month key, so that
+questions about a period of time only look at the months in it, however many years of sales the
+file holds.
+
+A CSV file can also be converted into a binary columnar sidecar, saved next to it with the
+SIDECAR_SUFFIX extension. The sidecar holds the same chunks as fixed-width arrays, so later runs can
+memory-map it and skip parsing the text. A sidecar is rebuilt whenever the CSV file changes.
+
+Sales files only grow, as new invoices are appended to the end. The dataset remembers how many bytes
+of the file it has read, along with the last few of those bytes. When the file has grown and those
+bytes are unchanged, only the new rows at the end of the file are read and added to the totals (and
+to the sidecar, if there is one), rather than reading the whole file again.
+
+Alongside the month by recipe totals, each dataset keeps a rollup of the quantity ordered by each
+customer in each month of each recipe, the total quantity of each invoice of each customer, and
+the quantity of each gyle sold to each customer.
+They are filled in by the same pass over the file, so questions about customers and invoices are
+answered without reading the file again.
+"""
+# Imports
+# csv and json are imported by the functions which use them, as they are slow to import and are not
+# needed to read the columns of a sidecar.
+import mmap
+import os
+import struct
+import sys
+from array import array
+from datetime import date
+from itertools import islice
+import instrumentation
+
+# Global cache
+DATASET_CACHE: dict = {}
+# Counts every change to the cached datasets (a file parsed or extended, or a dataset removed),
+# so that results worked out from them, such as memoized predictions, can tell they are out of date.
+GENERATION: list = [0]
+# The sales CSV file used for predictions.
+CSV_FILE: list = ["Barnabys_sales_fabriacted_data.csv"]
+
+# Constants
+VALID_MONTH: list = [
+    "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"
+]
+MONTH_INDEX: dict = {month: index for index, month in enumerate(VALID_MONTH)}
+RECIPES: tuple = ("Organic Pilsner", "Organic Red Helles", "Organic Dunkel")
+RECIPE_INDEX: dict = {recipe: index for index, recipe in enumerate(RECIPES)}
+# Recipe code given to orders of a recipe that is not in RECIPES.
+UNKNOWN_RECIPE: int = -1
+# Gyle number given to orders without one.
+UNKNOWN_GYLE: int = -1
+# Invoice number given to orders without one.
+UNKNOWN_INVOICE: int = -1
+# Number of CSV rows parsed into each SalesChunk.
+CHUNK_SIZE: int = 10000
+# Sidecar file layout. The header is followed by one block per chunk, each padded to a multiple of 8
+# bytes, and then the customer names.
+SIDECAR_SUFFIX: str = ".cols"
+SIDECAR_MAGIC: bytes = b"BRWC"
+SIDECAR_VERSION: int = 3
+SIDECAR_HEADER: struct.Struct = struct.Struct("<4sHHqqqqqH64s6x")
+SIDECAR_BLOCK: struct.Struct = struct.Struct("<q")
+# (attribute of SalesChunk, array type code) of each column, in the order they are saved.
+SIDECAR_COLUMNS: tuple = (
+    ("dates", "i"), ("months", "i"), ("customers", "i"), ("gyles", "i"), ("quantities", "i"),
+    ("invoices", "i"), ("recipes", "b"),
+)
+BYTE_ORDER: int = 1 if sys.byteorder == "little" else 2
+# Number of bytes before the end of the data that has been read which are kept to check that the
+# file has only been appended to.
+TAIL_SIZE: int = 64
+
+
+# Classes
+class SalesChunk:
+    """
+    This class is used to define a chunk of orders read from a sales CSV file, stored column by
+    column in compact arrays rather than as one object per order.
+
+    attributes:
+    dates: array - the date each order is required, as a proleptic Gregorian ordinal
+    months: array - the month each order is required, as year * 12 + month index (see month_key)
+    recipes: array - the index into RECIPES of each order, or UNKNOWN_RECIPE
+    customers: array - the code of the customer of each order (see iter_chunks)
+    gyles: array - the gyle number of each order, or UNKNOWN_GYLE
+    invoices: array - the invoice number of each order, or UNKNOWN_INVOICE
+    quantities: array - the quantity of each order
+    end: int - the byte offset in the CSV file just after the last row of the chunk
+
+    The columns of a chunk read from a sidecar are memoryviews of the mapped file instead of arrays.
+    """
+    def __init__(self):
+        for column, type_code in SIDECAR_COLUMNS:
+            setattr(self, column, array(type_code))
+        self.end: int = 0
+
+    def __len__(self) -> int:
+        return len(self.quantities)
+
+
+class SalesDataset:
+    """
+    This class is used to define a sales CSV file that has been parsed into memory.
+
+    attributes:
+    file_name: str - the path of the CSV file
+    size: int - the number of bytes of the file that have been read
+    mtime: int - the modification time of the file (in nanoseconds) when it was last read
+    tail: bytes - the last TAIL_SIZE (or fewer) bytes of the file that have been read
+    rows: int - the number of orders that have been read from the file
+    customers: dict - the code of each customer (name: code) seen in the file
+    totals: list - a dense table of total quantity, indexed by [month][recipe], where month is the
+    index into VALID_MONTH and recipe is the index into RECIPES
+    partitions: dict - for each month key (see month_key) with orders, a list of the total quantity
+    of each recipe ordered in that month
+    last_key: int = None - the latest month key with orders
+    rollup: dict - for each month key (see month_key), a list with one dictionary per recipe of
+    the total quantity ordered by each customer, keyed by customer code
+    invoices: dict - for each customer code, a dictionary of the total quantity of each invoice,
+    keyed by invoice number
+    gyle_orders: dict - for each gyle number, a dictionary of the quantity sold to each customer,
+    keyed by customer code
+    gyle_totals: dict - the total quantity sold of each gyle, keyed by gyle number
+    names: list - the customer names in order of their codes, brought up to date by customer_names
+    forecast: tuple = None - the annual growth rates and recipe by month forecast matrix, filled in
+    by csv_prediction.forecast_matrix the first time a prediction is made from this dataset
+    forecast_end: int = None - the last month key of the sales the forecast was worked out from
+    stale_recipes: set - the indexes of the recipes whose totals have changed since the forecast
+    was last worked out
+    """
+    def __init__(self, file_name: str, mtime: int):
+        self.file_name = file_name
+        self.size: int = 0
+        self.mtime = mtime
+        self.tail: bytes = b""
+        self.rows: int = 0
+        self.customers: dict = {}
+        self.totals: list = empty_table()
+        self.partitions: dict = {}
+        self.last_key: int = None
+        self.rollup: dict = {}
+        self.invoices: dict = {}
+        self.gyle_orders: dict = {}
+        self.gyle_totals: dict = {}
+        self.names: list = []
+        self.forecast: tuple = None
+        self.forecast_end: int = None
+        self.stale_recipes: set = set()
+
+    def add_chunk(self, chunk: SalesChunk):
+        """
+        A class method which adds the quantities of a chunk of orders to the month by recipe totals,
+        the customer rollup and the invoice and gyle totals. Orders of a recipe that is not in
+        RECIPES are counted as rows and added to their invoice and gyle, but not totalled by month.
+
+        :param chunk: SalesChunk
+        :return: None
+        """
+        totals = self.totals
+        partitions = self.partitions
+        rollup = self.rollup
+        invoices = self.invoices
+        gyle_orders = self.gyle_orders
+        gyle_totals = self.gyle_totals
+
+        for key, recipe_index, customer, invoice, gyle, quantity in zip(
+                chunk.months, chunk.recipes, chunk.customers, chunk.invoices, chunk.gyles,
+                chunk.quantities):
+            customer_invoices = invoices.get(customer)
+            if customer_invoices is None:
+                customer_invoices = invoices[customer] = {}
+            customer_invoices[invoice] = customer_invoices.get(invoice, 0) + quantity
+
+            if gyle != UNKNOWN_GYLE:
+                gyle_customers = gyle_orders.get(gyle)
+                if gyle_customers is None:
+                    gyle_customers = gyle_orders[gyle] = {}
+                gyle_customers[customer] = gyle_customers.get(customer, 0) + quantity
+                gyle_totals[gyle] = gyle_totals.get(gyle, 0) + quantity
+
+            if recipe_index == UNKNOWN_RECIPE:
+                continue
+            totals[key % 12][recipe_index] += quantity
+            partition = partitions.get(key)
+            if partition is None:
+                partition = partitions[key] = [0] * len(RECIPES)
+            partition[recipe_index] += quantity
+
+            month_rollup = rollup.get(key)
+            if month_rollup is None:
+                month_rollup = rollup[key] = [{} for _ in RECIPES]
+            by_customer = month_rollup[recipe_index]
+            by_customer[customer] = by_customer.get(customer, 0) + quantity
+
+        if len(chunk):
+            last_key = max(chunk.months)
+            if self.last_key is None or last_key > self.last_key:
+                self.last_key = last_key
+        self.stale_recipes.update(set(chunk.recipes) - {UNKNOWN_RECIPE})
+        self.rows += len(chunk)
+        self.size = max(self.size, chunk.end)
+
+    def read_from(self, chunks) -> int:
+        """
+        A class method which adds every chunk from an iterable of chunks, and then records the
+        bytes at the end of the data that has been read. The number of orders added is returned.
+
+        :param chunks: Iterable of SalesChunk
+        :return: int
+        """
+        rows = self.rows
+        for chunk in chunks:
+            self.add_chunk(chunk)
+        self.tail = read_bytes(self.file_name, max(self.size - TAIL_SIZE, 0), self.size)
+        return self.rows - rows
+
+    def can_extend(self, size: int, mtime: int) -> bool:
+        """
+        A class method which checks whether the file has only been appended to since it was last
+        read, so that the new rows can be read on their own. The file must have grown (a file of
+        the same size with a new modification time has been rewritten), the last row that was read
+        must have been a whole line, and the bytes before the end of the data that was read must be
+        unchanged. Changes elsewhere in the file are not looked for, so a file that has been edited
+        in place and grown must be removed from the cache with invalidate_cache.
+
+        :param size: int
+        :param mtime: int
+        :return: bool
+        """
+        if size < self.size or (size == self.size and mtime != self.mtime):
+            return False
+        if self.size == 0:
+            return True
+        if not self.tail.endswith(b"\n"):
+            return False
+        return read_bytes(self.file_name, self.size - len(self.tail), self.size) == self.tail
+
+    def quantity(self, month: str, recipe: str, year: int = None) -> int:
+        """
+        A class method which returns the total quantity of a recipe ordered in a month. If a year is
+        given, only orders from that year are counted.
+
+        :param month: str
+        :param recipe: str
+        :param year: int = None
+        :return: int
+        """
+        if year is None:
+            return self.totals[MONTH_INDEX[month]][RECIPE_INDEX[recipe]]
+        partition = self.partitions.get(month_key(year, MONTH_INDEX[month]))
+        return 0 if partition is None else partition[RECIPE_INDEX[recipe]]
+
+    def customer_names(self) -> list:
+        """
+        A class method which returns the customer names in order of their codes. The list is only
+        made again when customers have been added since it was last made.
+
+        :return: list
+        """
+        if len(self.names) != len(self.customers):
+            self.names = list(self.customers)
+        return self.names
+
+    def gyle_customers(self, gyle: int) -> dict:
+        """
+        A class method which returns the quantity of a gyle sold to each customer, or an empty
+        dictionary if none of it has been sold.
+
+        :param gyle: int
+        :return: dict - quantity keyed by customer name
+        """
+        names = self.customer_names()
+        return {
+            names[customer]: quantity
+            for customer, quantity in self.gyle_orders.get(gyle, {}).items()
+        }
+
+    def invoice_totals(self, customer: str) -> dict:
+        """
+        A class method which returns the total quantity of every invoice of a customer, or an empty
+        dictionary if the customer has no orders.
+
+        :param customer: str
+        :return: dict - quantity keyed by invoice number
+        """
+        code = self.customers.get(customer)
+        if code is None:
+            return {}
+        return dict(self.invoices.get(code, {}))
+
+
+# Functions
+def empty_table() -> list:
+    """
+    A function which returns a month by recipe table of zeros.
+
+    :return: list
+    """
+    return [[0] * len(RECIPES) for _ in VALID_MONTH]
+
+
+def month_key(year: int, month_index: int) -> int:
+    """
+    A function which returns a single integer for a month of a year, so that months sort and compare
+    in date order across years.
+
+    :param year: int
+    :param month_index: int
+    :return: int
+    """
+    return year * 12 + month_index
+
+
+def parse_date(date_required: str) -> tuple:
+    """
+    A function which parses a date in the format used by the sales CSV, such as 02-Nov-18.
+
+    :param date_required: str
+    :return: (ordinal, month_key): tuple
+    """
+    day, month, year = date_required.split("-")
+    month_index = MONTH_INDEX[month]
+    year = 2000 + int(year)
+    ordinal = date(year, month_index + 1, int(day)).toordinal()
+    return ordinal, month_key(year, month_index)
+
+
+def iter_chunks(
+        file_name: str, chunk_size: int = CHUNK_SIZE, customers: dict = None, offset: int = 0):
+    """
+    A generator which reads the chosen CSV file, starting at the byte offset given, and yields its
+    orders as SalesChunks of at most chunk_size orders.
+
+    Rows with a date that cannot be parsed, such as the heading row, are skipped. Each distinct date
+    is only parsed once. Customers are given codes in the order they are first seen, and the codes
+    are added to the customers dictionary (name: code) if one is given.
+
+    :param file_name: str
+    :param chunk_size: int = CHUNK_SIZE
+    :param customers: dict = None
+    :param offset: int = 0
+    :return: Generator of SalesChunk
+    """
+    import csv
+
+    parsed_dates: dict = {}
+    if customers is None:
+        customers = {}
+    consumed: list = [offset]
+
+    def decode_lines(csv_file):
+        for line in csv_file:
+            consumed[0] += len(line)
+            yield line.decode("utf-8")
+
+    instrumentation.count_file_open()
+    with open(file_name, mode="rb") as csv_file:
+        csv_file.seek(offset)
+        csv_reader = csv.reader(decode_lines(csv_file), delimiter=",")
+        while True:
+            rows = list(islice(csv_reader, chunk_size))
+            if not rows:
+                break
+
+            chunk = SalesChunk()
+            chunk.end = consumed[0]
+            for row in rows:
+                date_required = row[2]
+                parsed = parsed_dates.get(date_required)
+                if parsed is None:
+                    try:
+                        parsed = parse_date(date_required)
+                    except (ValueError, KeyError):
+                        continue
+                    parsed_dates[date_required] = parsed
+
+                customer = customers.get(row[1])
+                if customer is None:
+                    customer = customers[row[1]] = len(customers)
+                try:
+                    gyle = int(row[4])
+                except ValueError:
+                    gyle = UNKNOWN_GYLE
+                try:
+                    invoice = int(row[0])
+                except ValueError:
+                    invoice = UNKNOWN_INVOICE
+
+                chunk.dates.append(parsed[0])
+                chunk.months.append(parsed[1])
+                chunk.recipes.append(RECIPE_INDEX.get(row[3], UNKNOWN_RECIPE))
+                chunk.customers.append(customer)
+                chunk.gyles.append(gyle)
+                chunk.invoices.append(invoice)
+                chunk.quantities.append(int(row[5]))
+
+            instrumentation.count_rows(len(rows))
+            yield chunk
+
+
+def iter_orders(file_name: str):
+    """
+    A generator which yields each order of the chosen CSV file as a
+    (date ordinal, month key, recipe index, quantity) tuple, reading the file chunk by chunk.
+
+    :param file_name: str
+    :return: Generator of tuple
+    """
+    for chunk in iter_chunks(file_name):
+        yield from zip(chunk.dates, chunk.months, chunk.recipes, chunk.quantities)
+
+
+def sidecar_path(file_name: str) -> str:
+    """
+    A function which returns the path of the sidecar of a CSV file.
+
+    :param file_name: str
+    :return: str
+    """
+    return file_name + SIDECAR_SUFFIX
+
+
+def read_sidecar_header(file_name: str) -> tuple:
+    """
+    A function which reads the header of the sidecar of a CSV file. None is returned if there is no
+    sidecar, or if it was written by a different version or on a machine with a different byte
+    order.
+
+    :param file_name: str
+    :return: (source_size, source_mtime, rows, blocks, table_offset, tail): tuple
+    """
+    try:
+        instrumentation.count_file_open()
+        with open(sidecar_path(file_name), mode="rb") as sidecar:
+            header = sidecar.read(SIDECAR_HEADER.size)
+    except OSError:
+        return None
+
+    if len(header) != SIDECAR_HEADER.size:
+        return None
+    magic, version, byte_order, *fields, tail_length, tail = SIDECAR_HEADER.unpack(header)
+    if magic != SIDECAR_MAGIC or version != SIDECAR_VERSION or byte_order != BYTE_ORDER:
+        return None
+    return (*fields, tail[:tail_length])
+
+
+def pack_sidecar_header(dataset: SalesDataset, blocks: int, table_offset: int) -> bytes:
+    """
+    A function which packs the header of a sidecar that holds every row of a dataset.
+
+    :param dataset: SalesDataset
+    :param blocks: int
+    :param table_offset: int
+    :return: bytes
+    """
+    return SIDECAR_HEADER.pack(
+        SIDECAR_MAGIC, SIDECAR_VERSION, BYTE_ORDER, dataset.size, dataset.mtime, dataset.rows,
+        blocks, table_offset, len(dataset.tail), dataset.tail
+    )
+
+
+def write_sidecar_block(sidecar, chunk: SalesChunk):
+    """
+    A function which writes a chunk to a sidecar as one block, padded to a multiple of 8 bytes.
+
+    :param sidecar: A binary file
+    :param chunk: SalesChunk
+    :return: None
+    """
+    sidecar.write(SIDECAR_BLOCK.pack(len(chunk)))
+    for column, _type_code in SIDECAR_COLUMNS:
+        getattr(chunk, column).tofile(sidecar)
+    sidecar.write(bytes(-sidecar.tell() % 8))
+
+
+def write_sidecar_table(sidecar, dataset: SalesDataset):
+    """
+    A function which writes the customer names of a dataset to a sidecar, in order of their codes.
+
+    :param sidecar: A binary file
+    :param dataset: SalesDataset
+    :return: None
+    """
+    import json
+
+    sidecar.write(json.dumps(list(dataset.customers)).encode("utf-8"))
+
+
+def sidecar_is_fresh(file_name: str) -> bool:
+    """
+    A function which checks whether the sidecar of a CSV file exists and was built from the current
+    version of the file.
+
+    :param file_name: str
+    :return: bool
+    """
+    header = read_sidecar_header(file_name)
+    if header is None:
+        return False
+    _path, size, mtime = file_key(file_name)
+    return header[0] == size and header[1] == mtime
+
+
+@instrumentation.instrumented
+def build_sidecar(file_name: str) -> SalesDataset:
+    """
+    A function which converts a CSV file into a sidecar, while parsing it into a SalesDataset in the
+    same pass.
+
+    The sidecar is written to a temporary file which replaces the old sidecar once it is complete,
+    so a sidecar is never left half written. If the sidecar cannot be written, an OSError is raised.
+
+    :param file_name: str
+    :return: dataset: SalesDataset
+    """
+    _path, _size, mtime = file_key(file_name)
+    dataset = SalesDataset(file_name, mtime)
+    blocks: list = [0]
+    temp_path = sidecar_path(file_name) + ".tmp"
+
+    def write_blocks(sidecar):
+        for chunk in iter_chunks(file_name, customers=dataset.customers):
+            write_sidecar_block(sidecar, chunk)
+            blocks[0] += 1
+            yield chunk
+
+    try:
+        instrumentation.count_file_open()
+        with open(temp_path, mode="wb") as sidecar:
+            sidecar.write(bytes(SIDECAR_HEADER.size))
+            dataset.read_from(write_blocks(sidecar))
+            table_offset = sidecar.tell()
+            write_sidecar_table(sidecar, dataset)
+            sidecar.seek(0)
+            sidecar.write(pack_sidecar_header(dataset, blocks[0], table_offset))
+        os.replace(temp_path, sidecar_path(file_name))
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return dataset
+
+
+@instrumentation.instrumented
+def load_sidecar(file_name: str, header: tuple) -> SalesDataset:
+    """
+    A function which reads the sidecar of a CSV file into a SalesDataset, without reading the CSV
+    file itself.
+
+    :param file_name: str
+    :param header: tuple - the header of the sidecar, as returned by read_sidecar_header
+    :return: dataset: SalesDataset
+    """
+    size, mtime, _rows, _blocks, _table_offset, tail = header
+    dataset = SalesDataset(file_name, mtime)
+    dataset.customers = {name: code for code, name in enumerate(read_sidecar_customers(file_name))}
+
+    for chunk in iter_sidecar_chunks(file_name):
+        dataset.add_chunk(chunk)
+
+    dataset.size = size
+    dataset.tail = tail
+    return dataset
+
+
+@instrumentation.instrumented
+def extend_dataset(dataset: SalesDataset, mtime: int) -> int:
+    """
+    A function which reads only the rows that have been appended to a CSV file since the dataset
+    last read it, and adds them to the dataset. If the sidecar of the file was up to date before
+    the rows were appended, the new rows are added to the end of the sidecar as well. The number of
+    new orders is returned.
+
+    The sidecar is only changed if there are new orders, and while it is being appended to its
+    header is blanked, so that a sidecar which is only partly updated is rebuilt rather than read.
+    If the sidecar cannot be written, the dataset is still updated and the sidecar is left to be
+    rebuilt.
+
+    :param dataset: SalesDataset
+    :param mtime: int
+    :return: int
+    """
+    file_name = dataset.file_name
+    header = read_sidecar_header(file_name)
+    chunks = iter_chunks(file_name, customers=dataset.customers, offset=dataset.size)
+    previous = (dataset.size, dataset.mtime, dataset.rows)
+    dataset.mtime = mtime
+
+    if header is None or header[:3] != previous:
+        return dataset.read_from(chunks)
+
+    try:
+        instrumentation.count_file_open()
+        sidecar = open(sidecar_path(file_name), mode="r+b")
+    except OSError:
+        return dataset.read_from(chunks)
+
+    _size, _mtime, _rows, blocks, table_offset, _tail = header
+    blocks: list = [blocks]
+    writable: list = [True]
+    started: list = [False]
+
+    def write_blocks():
+        for chunk in chunks:
+            if len(chunk) and writable[0]:
+                try:
+                    if not started[0]:
+                        started[0] = True
+                        sidecar.write(bytes(SIDECAR_HEADER.size))
+                        sidecar.seek(table_offset)
+                        sidecar.truncate()
+                    write_sidecar_block(sidecar, chunk)
+                    blocks[0] += 1
+                except OSError:
+                    writable[0] = False
+            yield chunk
+
+    with sidecar:
+        new_rows = dataset.read_from(write_blocks())
+
+        if started[0] and writable[0]:
+            try:
+                table_offset = sidecar.tell()
+                write_sidecar_table(sidecar, dataset)
+                sidecar.seek(0)
+                sidecar.write(pack_sidecar_header(dataset, blocks[0], table_offset))
+            except OSError:
+                pass
+
+    return new_rows
+
+
+def iter_sidecar_chunks(file_name: str):
+    """
+    A generator which memory-maps the sidecar of a CSV file and yields its blocks as SalesChunks.
+    The columns of each chunk are views of the mapped file, so nothing is copied or parsed, and they
+    must not be kept once the generator has moved on.
+
+    :param file_name: str
+    :return: Generator of SalesChunk
+    """
+    _size, _mtime, _rows, blocks, _table_offset, _tail = read_sidecar_header(file_name)
+
+    instrumentation.count_file_open()
+    with open(sidecar_path(file_name), mode="rb") as sidecar, \
+            mmap.mmap(sidecar.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        columns: list = []
+        offset = SIDECAR_HEADER.size
+        try:
+            for _block in range(blocks):
+                (length,) = SIDECAR_BLOCK.unpack_from(view, offset)
+                offset += SIDECAR_BLOCK.size
+                chunk = SalesChunk()
+                for column, type_code in SIDECAR_COLUMNS:
+                    width = length * array(type_code).itemsize
+                    with view[offset:offset + width] as block:
+                        columns.append(block.cast(type_code))
+                    setattr(chunk, column, columns[-1])
+                    offset += width
+                offset += -offset % 8
+                instrumentation.count_rows(len(chunk))
+                yield chunk
+                release_views(columns)
+        finally:
+            release_views(columns)
+            view.release()
+
+
+def release_views(views: list):
+    """
+    A function which releases a list of memoryviews and empties the list.
+
+    :param views: list
+    :return: None
+    """
+    for view in views:
+        view.release()
+    views.clear()
+
+
+def read_sidecar_customers(file_name: str) -> list:
+    """
+    A function which reads the customer names saved in the sidecar of a CSV file. The code of each
+    customer is its index in the list.
+
+    :param file_name: str
+    :return: list
+    """
+    import json
+
+    table_offset = read_sidecar_header(file_name)[4]
+    instrumentation.count_file_open()
+    with open(sidecar_path(file_name), mode="rb") as sidecar:
+        sidecar.seek(table_offset)
+        return json.loads(sidecar.read().decode("utf-8"))
+
+
+def file_key(file_name: str) -> tuple:
+    """
+    A function which returns the key used to decide whether a cached dataset is still valid.
+
+    :param file_name: str
+    :return: (path, size, mtime): tuple
+    """
+    stat = os.stat(file_name)
+    return os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns
+
+
+def read_bytes(file_name: str, start: int, end: int) -> bytes:
+    """
+    A function which reads the bytes of a file between two offsets.
+
+    :param file_name: str
+    :param start: int
+    :param end: int
+    :return: bytes
+    """
+    instrumentation.count_file_open()
+    with open(file_name, mode="rb") as file:
+        file.seek(start)
+        return file.read(end - start)
+
+
+@instrumentation.instrumented
+def parse_dataset(file_name: str) -> SalesDataset:
+    """
+    A function which reads the chosen CSV file once, chunk by chunk, into a SalesDataset.
+
+    If the file has a sidecar that is up to date, the sidecar is read instead of the text. If the
+    file has only been appended to since the sidecar was written, the sidecar is read and then only
+    the new rows are read from the text. If it has a sidecar that is out of date or cannot be read,
+    the sidecar is rebuilt while the text is read.
+
+    :param file_name: str
+    :return: dataset: SalesDataset
+    """
+    _path, size, mtime = file_key(file_name)
+    header = read_sidecar_header(file_name)
+
+    if header is not None:
+        dataset = load_sidecar(file_name, header)
+        if dataset.size == size and dataset.mtime == mtime:
+            return dataset
+        if dataset.can_extend(size, mtime):
+            extend_dataset(dataset, mtime)
+            return dataset
+
+    if os.path.exists(sidecar_path(file_name)):
+        try:
+            return build_sidecar(file_name)
+        except OSError:
+            pass
+
+    dataset = SalesDataset(file_name, mtime)
+    dataset.read_from(iter_chunks(file_name, customers=dataset.customers))
+
+    return dataset
+
+
+@instrumentation.instrumented
+def convert_to_sidecar(file_name: str) -> SalesDataset:
+    """
+    A function which converts a CSV file into a sidecar, unless it already has one that is up to
+    date, and caches the parsed dataset.
+
+    :param file_name: str
+    :return: dataset: SalesDataset
+    """
+    if sidecar_is_fresh(file_name):
+        return load_dataset(file_name)
+
+    dataset = build_sidecar(file_name)
+    DATASET_CACHE[os.path.abspath(file_name)] = dataset
+    return dataset
+
+
+@instrumentation.instrumented
+def load_dataset(file_name: str) -> SalesDataset:
+    """
+    A function which returns the parsed dataset for the chosen CSV file.
+
+    The file is only read if it has not been seen before, or if its size or modification time has
+    changed since it was last read. If it has only been appended to, just the new rows are read
+    into the cached SalesDataset. Otherwise, such as when it has been rewritten without changing
+    its size, the whole file is parsed again (and its sidecar rebuilt, if it has one).
+
+    :param file_name: str
+    :return: dataset: SalesDataset
+    """
+    path, size, mtime = file_key(file_name)
+    dataset = DATASET_CACHE.get(path)
+
+    if dataset is not None and (dataset.size != size or dataset.mtime != mtime):
+        GENERATION[0] += 1
+        if dataset.can_extend(size, mtime):
+            extend_dataset(dataset, mtime)
+        else:
+            dataset = None
+
+    if dataset is None:
+        GENERATION[0] += 1
+        dataset = parse_dataset(file_name)
+        DATASET_CACHE[path] = dataset
+
+    return dataset
+
+
+@instrumentation.instrumented
+def ingest_new_rows(file_name: str) -> int:
+    """
+    A function which reads any rows that have been appended to a CSV file since it was last loaded
+    into the cache, and returns how many orders were added. If the file was not already cached, or
+    has been changed other than by appending to it, the whole file is read and every order is
+    counted as new.
+
+    :param file_name: str
+    :return: int
+    """
+    path, _size, _mtime = file_key(file_name)
+    dataset = DATASET_CACHE.get(path)
+    rows = 0 if dataset is None else dataset.rows
+
+    new_dataset = load_dataset(file_name)
+    if new_dataset is not dataset:
+        return new_dataset.rows
+    return new_dataset.rows - rows
+
+
+def invalidate_cache(file_name: str = None):
+    """
+    A function which removes a dataset from the cache, so that it is parsed again the next time it
+    is used. If no file name is given, every cached dataset is removed.
+
+    :param file_name: str = None
+    :return: None
+    """
+    GENERATION[0] += 1
+    if file_name is None:
+        DATASET_CACHE.clear()
+    else:
+        DATASET_CACHE.pop(os.path.abspath(file_name), None)
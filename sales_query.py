@@ -0,0 +1,318 @@
+"""
+This module is responsible for answering questions about the sales data with one general query
+instead of a function per question. A query filters the orders of a sales file, groups them by any
+of the columns in QUERY_COLUMNS and adds up each group:
+
+    run_query(file_name, group_by=("customer",), where={"recipe": "Organic Dunkel", "year": 2019})
+
+Queries work column by column on the compact columns of the sales data, and filters and groups use
+the integer codes of the columns, so names are only looked up for the groups in the result. A query
+is answered from the smallest table that holds what it needs: the month by recipe totals of the
+dataset (or its month partitions, if it involves years) if it only involves months, years and
+recipes, the customer rollup if it also involves quarters or customers, and otherwise a pass over
+the columns of every order (read from the sidecar if it is up to date). The totals and the rollup
+are both kept per month key, so when a query filters by year, quarter or month only the months
+that match are read. Only orders of a recipe in sales_data.RECIPES are counted.
+"""
+# Imports
+from datetime import date
+from itertools import compress
+from operator import and_
+import instrumentation
+import sales_data
+
+# Constants
+# The chunk column each query column is read from, and the function which turns a value of that
+# chunk column into the code of the query column (None if the value is already the code).
+QUERY_COLUMNS: dict = {
+    "date": ("dates", None),
+    "year": ("months", lambda key: key // 12),
+    "quarter": ("months", lambda key: key % 12 // 3 + 1),
+    "month": ("months", lambda key: key % 12),
+    "year_month": ("months", None),
+    "recipe": ("recipes", None),
+    "customer": ("customers", None),
+    "gyle": ("gyles", None),
+    "invoice": ("invoices", None),
+}
+AGGREGATES: tuple = ("sum", "count", "mean", "growth")
+# The columns that can be worked out from the month by recipe totals, and from the customer rollup.
+TOTALS_COLUMNS: set = {"year", "month", "recipe"}
+ROLLUP_COLUMNS: set = {"year", "quarter", "month", "year_month", "recipe", "customer"}
+
+
+# Classes
+class Block:
+    """
+    This class is used to define a block of pre-aggregated quantities, read from the totals or the
+    rollup of a dataset, with the same columns as a SalesChunk so that both are queried the same
+    way. Each entry is the total quantity of a group of orders rather than one order.
+
+    attributes:
+    months: list - the month key of each entry, or just the month index if years are not needed
+    recipes: list - the recipe index of each entry
+    customers: list - the customer code of each entry
+    quantities: list - the total quantity of each entry
+    """
+    def __init__(self):
+        self.months: list = []
+        self.recipes: list = []
+        self.customers: list = []
+        self.quantities: list = []
+
+
+# Functions
+def encode(dataset, column: str, value) -> int:
+    """
+    A function which turns a value of a query column into its code. A ValueError is raised if the
+    value is not valid for the column. A customer who is not in the data has the code None, which
+    matches no orders.
+
+    :param dataset: SalesDataset
+    :param column: str
+    :param value: the value, such as "Jan" for the month column
+    :return: int
+    """
+    try:
+        if column == "date":
+            return value.toordinal()
+        elif column == "month":
+            return sales_data.MONTH_INDEX[value]
+        elif column == "year_month":
+            year, month = value
+            return sales_data.month_key(year, sales_data.MONTH_INDEX[month])
+        elif column == "recipe":
+            return sales_data.RECIPE_INDEX[value]
+        elif column == "customer":
+            return dataset.customers.get(value)
+        return int(value)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise ValueError("%r is not a valid %s." % (value, column))
+
+
+def decode(dataset, column: str, code: int):
+    """
+    A function which turns the code of a query column back into its value.
+
+    :param dataset: SalesDataset
+    :param column: str
+    :param code: int
+    :return: the value, such as "Jan" for the month column
+    """
+    if column == "date":
+        return date.fromordinal(code)
+    elif column == "month":
+        return sales_data.VALID_MONTH[code]
+    elif column == "year_month":
+        year, month_index = divmod(code, 12)
+        return year, sales_data.VALID_MONTH[month_index]
+    elif column == "recipe":
+        return sales_data.RECIPES[code]
+    elif column == "customer":
+        return dataset.customer_names()[code]
+    return code
+
+
+def month_matches(key: int, filters: list) -> bool:
+    """
+    A function which checks whether a month key passes every filter on a column that is worked out
+    from the month, so that the months that do not can be skipped without reading them.
+
+    :param key: int - a month key, or a month index
+    :param filters: list - (column, allowed codes) pairs
+    :return: bool
+    """
+    for column, allowed in filters:
+        source, function = QUERY_COLUMNS[column]
+        if source == "months" and (key if function is None else function(key)) not in allowed:
+            return False
+    return True
+
+
+def totals_blocks(dataset, by_year: bool, filters: list) -> list:
+    """
+    A function which makes a block of the month by recipe totals of a dataset, read from its month
+    partitions if by_year, or from the totals of every year together. Months that do not match the
+    filters are left out.
+
+    :param dataset: SalesDataset
+    :param by_year: bool
+    :param filters: list - (column, allowed codes) pairs
+    :return: list of Block
+    """
+    tables = dataset.partitions.items() if by_year else enumerate(dataset.totals)
+    block = Block()
+    for key, month_totals in tables:
+        if not month_matches(key, filters):
+            continue
+        for recipe_index, quantity in enumerate(month_totals):
+            # Months without orders are left out, as they would be by a pass over the orders.
+            if not quantity:
+                continue
+            block.months.append(key)
+            block.recipes.append(recipe_index)
+            block.quantities.append(quantity)
+    return [block]
+
+
+def rollup_blocks(dataset, filters: list) -> list:
+    """
+    A function which makes a block of the customer rollup of a dataset. Months that do not match
+    the filters are left out.
+
+    :param dataset: SalesDataset
+    :param filters: list - (column, allowed codes) pairs
+    :return: list of Block
+    """
+    block = Block()
+    for key, month_rollup in dataset.rollup.items():
+        if not month_matches(key, filters):
+            continue
+        for recipe_index, by_customer in enumerate(month_rollup):
+            for customer, quantity in by_customer.items():
+                block.months.append(key)
+                block.recipes.append(recipe_index)
+                block.customers.append(customer)
+                block.quantities.append(quantity)
+    return [block]
+
+
+def scan_blocks(dataset):
+    """
+    A generator which yields every order of the file of a dataset as SalesChunks, read from the
+    sidecar if it is up to date and from the CSV file otherwise.
+
+    :param dataset: SalesDataset
+    :return: Generator of SalesChunk
+    """
+    if sales_data.sidecar_is_fresh(dataset.file_name):
+        yield from sales_data.iter_sidecar_chunks(dataset.file_name)
+    else:
+        # A copy of the customer codes, which are given in the same order as when the dataset was
+        # read, so the codes match without changing the dataset.
+        customers = dict(dataset.customers)
+        yield from sales_data.iter_chunks(dataset.file_name, customers=customers)
+
+
+def choose_blocks(dataset, columns: set, aggregate: str, filters: list):
+    """
+    A function which chooses the smallest table of a dataset that a query can be answered from.
+
+    :param dataset: SalesDataset
+    :param columns: set - every column the query filters or groups by
+    :param aggregate: str
+    :param filters: list - (column, allowed codes) pairs
+    :return: Iterable of Block or SalesChunk
+    """
+    if aggregate in ("sum", "growth"):
+        if columns <= TOTALS_COLUMNS:
+            return totals_blocks(dataset, "year" in columns, filters)
+        if columns <= ROLLUP_COLUMNS:
+            return rollup_blocks(dataset, filters)
+    return scan_blocks(dataset)
+
+
+def codes_of(block, column: str) -> list:
+    """
+    A function which returns the codes of a query column for every entry of a block.
+
+    :param block: Block or SalesChunk
+    :param column: str
+    :return: list
+    """
+    source, function = QUERY_COLUMNS[column]
+    values = getattr(block, source)
+    return values if function is None else list(map(function, values))
+
+
+def group_growth(sums: dict) -> dict:
+    """
+    A function which turns the sums of each group into the growth of each group from the one
+    before it, in the order of the last column grouped by, among the groups with the same values of
+    the other columns. The growth is rounded in the same way as calc_percent_growth_rate, and is
+    None for the first group, or a group after one that is zero.
+
+    :param sums: dict - the sum of each group, keyed by tuple of codes, in order
+    :return: dict
+    """
+    growth: dict = {}
+    previous = (None, None)
+    for key, total in sums.items():
+        last_key, last_total = previous
+        if last_key is not None and last_key[:-1] == key[:-1] and last_total:
+            growth[key] = round(((total / last_total) - 1), 2)
+        else:
+            growth[key] = None
+        previous = (key, total)
+    return growth
+
+
+@instrumentation.instrumented
+def run_query(file_name: str, group_by: tuple = (), where: dict = None, aggregate: str = "sum"):
+    """
+    A function which filters the orders of a sales file, groups them and aggregates each group.
+
+    The aggregate is the total quantity ("sum"), the number of orders ("count"), the average
+    quantity of an order ("mean"), or the growth of the total quantity of each group from the group
+    before it ("growth"), as worked out by group_growth.
+
+    :param file_name: str
+    :param group_by: tuple = () - the columns to group by, from QUERY_COLUMNS
+    :param where: dict = None - for each column to filter by, the value orders must have, or a list,
+    tuple or set of the values they may have
+    :param aggregate: str = "sum"
+    :return: the aggregate of every order when nothing is grouped by, or else a dict of the
+    aggregate of each group, in order, keyed by the value of the column grouped by (or a tuple of
+    values when grouping by more than one column)
+    """
+    group_by = tuple(group_by)
+    where = where or {}
+    for column in group_by + tuple(where):
+        if column not in QUERY_COLUMNS:
+            raise ValueError("Column must be one of %s." % list(QUERY_COLUMNS))
+    if aggregate not in AGGREGATES:
+        raise ValueError("Aggregate must be one of %s." % list(AGGREGATES))
+    if aggregate == "growth" and not group_by:
+        raise ValueError("Growth needs at least one column to group by.")
+
+    dataset = sales_data.load_dataset(file_name)
+    filters: list = []
+    for column, values in where.items():
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        filters.append((column, {encode(dataset, column, value) for value in values}))
+
+    sums: dict = {}
+    counts: dict = {}
+    for block in choose_blocks(dataset, set(group_by) | set(where), aggregate, filters):
+        keep = [recipe != sales_data.UNKNOWN_RECIPE for recipe in block.recipes]
+        for column, allowed in filters:
+            keep = list(map(and_, keep, [code in allowed for code in codes_of(block, column)]))
+
+        quantities = compress(block.quantities, keep)
+        if group_by:
+            keys = zip(*[compress(codes_of(block, column), keep) for column in group_by])
+        else:
+            keys = ((),) * len(keep)
+        for key, quantity in zip(keys, quantities):
+            sums[key] = sums.get(key, 0) + quantity
+            counts[key] = counts.get(key, 0) + 1
+
+    if aggregate == "sum" or aggregate == "growth":
+        results = sums
+    elif aggregate == "count":
+        results = counts
+    else:
+        results = {key: sums[key] / counts[key] for key in sums}
+    results = {key: results[key] for key in sorted(results)}
+    if aggregate == "growth":
+        results = group_growth(results)
+
+    if not group_by:
+        return results.get((), None if aggregate == "mean" else 0)
+    if len(group_by) == 1:
+        return {decode(dataset, group_by[0], key[0]): value for key, value in results.items()}
+    return {
+        tuple(decode(dataset, column, code) for column, code in zip(group_by, key)): value
+        for key, value in results.items()
+    }
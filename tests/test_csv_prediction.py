@@ -0,0 +1,88 @@
+"""
+Tests for the memoized predictions of csv_prediction.
+"""
+# Imports
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+import csv_prediction as predict
+import sales_data
+
+# Constants
+SALES_FILE: str = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "Barnabys_sales_fabriacted_data.csv"
+)
+
+
+# Classes
+class MemoTest(unittest.TestCase):
+    """
+    This class is used to test that memoized results follow changes to the sales file.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, "sales.csv")
+        shutil.copyfile(SALES_FILE, self.file_name)
+        sales_data.invalidate_cache()
+
+    def tearDown(self):
+        sales_data.invalidate_cache()
+        shutil.rmtree(self.directory)
+
+    def test_edited_file_is_not_answered_from_memo(self):
+        quantity = predict.calc_month_quantity_by_recipe("Jan", "Organic Dunkel", self.file_name)
+
+        with open(self.file_name, mode="r", newline="") as csv_file:
+            rows = list(csv.reader(csv_file))
+        for row in rows[1:]:
+            row[5] = str(int(row[5]) * 2)
+        mtime = os.stat(self.file_name).st_mtime_ns + 10 ** 9
+        with open(self.file_name, mode="w", newline="") as csv_file:
+            csv.writer(csv_file).writerows(rows)
+        os.utime(self.file_name, ns=(mtime, mtime))
+
+        self.assertEqual(
+            predict.calc_month_quantity_by_recipe("Jan", "Organic Dunkel", self.file_name),
+            quantity * 2
+        )
+
+    def test_results_are_not_shared(self):
+        ranked = predict.top_customers("Organic Dunkel", self.file_name)
+        ranked.clear()
+        self.assertNotEqual(predict.top_customers("Organic Dunkel", self.file_name), [])
+
+        growth_rates, matrix = predict.forecast_matrix(self.file_name)
+        with open(self.file_name, mode="ab") as csv_file:
+            csv_file.write(b"999,Jaded Palates,03-Nov-19,Organic Dunkel,112,4000\r\n")
+        mtime = os.stat(self.file_name).st_mtime_ns + 10 ** 9
+        os.utime(self.file_name, ns=(mtime, mtime))
+
+        self.assertNotEqual(predict.forecast_matrix(self.file_name), (growth_rates, matrix))
+        self.assertEqual(predict.forecast_matrix(SALES_FILE), (growth_rates, matrix))
+
+    def test_months_are_read_from_the_forecast_period(self):
+        with open(self.file_name, mode="ab") as csv_file:
+            csv_file.write(b"999,Jaded Palates,01-Nov-19,Organic Dunkel,112,40\r\n")
+
+        # November 2018 has dropped out of the period that forecast_matrix works from.
+        self.assertEqual(
+            predict.calc_month_quantity_by_recipe("Nov", "Organic Dunkel", self.file_name), 40
+        )
+        months = predict.VALID_MONTH[11:] + predict.VALID_MONTH[:11]
+        growths = [
+            predict.calc_percent_growth_rate(
+                last_month, this_month, "Organic Dunkel", self.file_name
+            )
+            for last_month, this_month in zip(months, months[1:])
+        ]
+        self.assertEqual(
+            predict.calc_annual_growth_rate("Organic Dunkel", self.file_name),
+            round(sum(growths) / len(growths), 2)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Tests for the production plans made by production_scheduler.
+"""
+# Imports
+import unittest
+from datetime import datetime, timedelta
+import brewery_monitoring as b_m
+import production_scheduler
+
+
+# Classes
+class RunningBatchTest(unittest.TestCase):
+    """
+    This class is used to test how the batches already in tanks are taken into account when
+    waiting batches are planned.
+    """
+    def setUp(self):
+        b_m.clear_brewery()
+        self.start = datetime(2019, 10, 16, 9, 0)
+        b_m.create_new_tank("F1", 1000, b_m.FERMENTER)
+        b_m.create_new_tank("C1", 1000, b_m.CONDITIONER)
+
+    def tearDown(self):
+        b_m.clear_brewery()
+
+    def test_fermenting_batch_keeps_its_conditioner(self):
+        b_m.create_new_batch("X", "Organic Dunkel", 1000)
+        b_m.move_to_stage_2("X", "F1")
+        b_m.find_batch("X").time_started = self.start
+        b_m.create_new_batch("Y", "Organic Dunkel", 1000)
+
+        plan = production_scheduler.plan_production(start=self.start + timedelta(days=3))
+
+        fermenting, conditioning = production_scheduler.EXPECTED_DURATIONS["Organic Dunkel"]
+        x_conditioned = self.start + fermenting + conditioning
+        y_slots = {slot.stage: slot for slot in plan.slots if slot.batch == "Y"}
+        self.assertEqual(plan.unscheduled, [])
+        self.assertEqual(y_slots["3"].tank, "C1")
+        self.assertGreaterEqual(y_slots["3"].start, x_conditioned)
+
+    def test_overdue_batch_keeps_its_tank(self):
+        b_m.create_new_tank("FC1", 1000, b_m.FERMENTER_CONDITIONER)
+        b_m.create_new_batch("X", "Organic Dunkel", 1000)
+        b_m.move_to_stage_2("X", "FC1")
+        b_m.find_batch("X").time_started = self.start - timedelta(weeks=10)
+        b_m.create_new_batch("Y", "Organic Dunkel", 1000)
+
+        plan = production_scheduler.plan_production(
+            batches=[b_m.find_batch("Y")],
+            tanks=[tank for tank in b_m.all_tanks() if tank.name == "FC1"], start=self.start
+        )
+
+        self.assertEqual(plan.unscheduled, [])
+        self.assertEqual(
+            plan.slots[0].start,
+            self.start + production_scheduler.OVERDUE_HOURS * production_scheduler.HOUR
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Tests for the dataset cache and sidecar of sales_data, and how they notice changes to the CSV file.
+"""
+# Imports
+import os
+import shutil
+import tempfile
+import unittest
+import sales_data
+
+# Constants
+SALES_FILE: str = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "Barnabys_sales_fabriacted_data.csv"
+)
+
+
+# Classes
+class ChangedFileTest(unittest.TestCase):
+    """
+    This class is used to test that the cached dataset and the sidecar of a copy of the sales file
+    follow the changes made to it.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, "sales.csv")
+        shutil.copyfile(SALES_FILE, self.file_name)
+        sales_data.invalidate_cache()
+        sales_data.convert_to_sidecar(self.file_name)
+
+    def tearDown(self):
+        sales_data.invalidate_cache()
+        shutil.rmtree(self.directory)
+
+    def fresh_totals(self) -> list:
+        """
+        A class method which parses the file from scratch, without the cache or the sidecar.
+
+        :return: list
+        """
+        dataset = sales_data.SalesDataset(self.file_name, 0)
+        dataset.read_from(sales_data.iter_chunks(self.file_name))
+        return dataset.totals
+
+    def touch_later(self):
+        """
+        A class method which moves the modification time of the file on by a second, so that the
+        change is seen however coarse the clock of the file system is.
+
+        :return: None
+        """
+        mtime = os.stat(self.file_name).st_mtime_ns + 10 ** 9
+        os.utime(self.file_name, ns=(mtime, mtime))
+
+    def test_same_size_edit_is_parsed_again(self):
+        with open(self.file_name, mode="rb") as csv_file:
+            text = csv_file.read()
+        edited = text.replace(b"Organic Red Helles,90,12\r\n", b"Organic Red Helles,90,21\r\n", 1)
+        self.assertNotEqual(edited, text)
+        self.assertEqual(len(edited), len(text))
+        with open(self.file_name, mode="wb") as csv_file:
+            csv_file.write(edited)
+        self.touch_later()
+
+        expected = self.fresh_totals()
+        self.assertEqual(sales_data.load_dataset(self.file_name).totals, expected)
+
+        # A new process reads the sidecar, which must have been rebuilt from the edited file.
+        sales_data.invalidate_cache()
+        self.assertTrue(sales_data.sidecar_is_fresh(self.file_name))
+        self.assertEqual(sales_data.load_dataset(self.file_name).totals, expected)
+
+    def test_appended_rows_are_added(self):
+        dataset = sales_data.load_dataset(self.file_name)
+        with open(self.file_name, mode="ab") as csv_file:
+            csv_file.write(b"999,Jaded Palates,03-Nov-19,Organic Dunkel,112,40\r\n")
+        self.touch_later()
+
+        self.assertIs(sales_data.load_dataset(self.file_name), dataset)
+        self.assertEqual(dataset.totals, self.fresh_totals())
+        sales_data.invalidate_cache()
+        self.assertEqual(sales_data.load_dataset(self.file_name).totals, self.fresh_totals())
+
+
+if __name__ == "__main__":
+    unittest.main()
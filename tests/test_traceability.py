@@ -0,0 +1,68 @@
+"""
+Tests for the gyle numbers given to batches by traceability.
+"""
+# Imports
+import os
+import unittest
+import brewery_monitoring as b_m
+import sales_data
+import traceability
+
+# Constants
+SALES_FILE: str = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "Barnabys_sales_fabriacted_data.csv"
+)
+
+
+# Classes
+class GyleTest(unittest.TestCase):
+    """
+    This class is used to test that batches reaching stage 4 are given gyle numbers that follow on
+    from the ones in the sales file.
+    """
+    def setUp(self):
+        b_m.clear_brewery()
+        traceability.GYLES.clear()
+        traceability.SOLD_GYLE[0] = None
+        sales_data.invalidate_cache()
+        b_m.create_new_tank("T1", 1000, b_m.FERMENTER_CONDITIONER)
+
+    def tearDown(self):
+        traceability.stop_tracing()
+        traceability.GYLES.clear()
+        traceability.SOLD_GYLE[0] = None
+        del traceability.PENDING_BATCHES[:]
+        b_m.clear_brewery()
+        sales_data.invalidate_cache()
+
+    def bottle(self, name: str):
+        """
+        A class method which brews a batch and moves it through every stage to stage 4.
+
+        :param name: str
+        :return: None
+        """
+        b_m.create_new_batch(name, "Organic Dunkel", 100)
+        b_m.move_to_stage_2(name, "T1")
+        b_m.move_to_stage_3(name, "")
+        b_m.move_to_stage_4(name)
+
+    def test_gyle_waits_for_the_sales_file(self):
+        traceability.start_tracing(read_sales=False)
+        self.bottle("X")
+
+        # The sales file is not read when the batch reaches stage 4.
+        self.assertEqual(sales_data.DATASET_CACHE, {})
+        self.assertIsNone(traceability.GYLES.gyle_of("X"))
+
+        sold = traceability.sold_gyle(SALES_FILE)
+        traceability.note_sold_gyle(sold)
+        self.assertEqual(traceability.GYLES.gyle_of("X"), sold + 1)
+
+        self.bottle("Y")
+        self.assertEqual(traceability.GYLES.gyle_of("Y"), sold + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
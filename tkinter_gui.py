@@ -6,81 +6,358 @@ The user can also choose when to move a batch from one stage to the next, as the
 knows when the batch is ready is the user.
 """
 # Imports
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import ttk
 import brewery_monitoring as b_m
 import csv_prediction as predict
+import traceability
 
-# Tkinter Frame init
-MASTER = tk.Tk()
-MASTER.title("Data Dashboard")
-MASTER.resizable(True, True)
+# Constants
+# The number of rows each table shows at once, and the number of grid rows it is spread over.
+TABLE_HEIGHT = 12
+TABLE_ROWSPAN = 10
+# How often, in milliseconds, the GUI checks whether background work has finished.
+POLL_INTERVAL = 50
+# How long, in milliseconds, changes are gathered for before the tables are repainted once.
+REPAINT_INTERVAL = 16
 
 # Global Lists
 LIST_OF_BATCHES = []
+# The names of the batches and tanks that have changed since the tables were last repainted.
+CHANGED_BATCHES = set()
+CHANGED_TANKS = set()
+REPAINT_SCHEDULED = [False]
+# The key of the background task the shown prediction is waiting for, or None.
+PREDICTION_TASK = [None]
+
+
+# Classes
+class DiffTable:
+    """
+    This class is used to define a table on the GUI which is refreshed by only inserting, updating
+    or deleting the rows that have changed, rather than by making new widgets for every cell. The
+    table is a ttk.Treeview, which only draws the rows that can be seen, so it stays quick to
+    refresh and does not use more memory over time, however many rows it has.
+
+    attributes:
+    tree: ttk.Treeview - the table
+    rows: dict - the values shown in each row, keyed by row id, in the order they are shown
+    shown: bool - whether the table has been filled in yet
+    """
+    def __init__(
+            self, frame, headings: list, widths: list, column: int, columnspan: int,
+            padx: int = 0):
+        holder = ttk.Frame(frame)
+        self.tree = ttk.Treeview(
+            holder, columns=headings, show="headings", height=TABLE_HEIGHT, selectmode="browse"
+        )
+        for heading, width in zip(headings, widths):
+            self.tree.heading(heading, text=heading + ":")
+            self.tree.column(heading, width=width, anchor=tk.CENTER)
+        scrollbar = ttk.Scrollbar(holder, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.grid(column=0, row=0, sticky=tk.NSEW)
+        scrollbar.grid(column=1, row=0, sticky=tk.NS)
+        holder.grid(
+            column=column, row=2, columnspan=columnspan, rowspan=TABLE_ROWSPAN, padx=padx,
+            sticky=tk.N
+        )
+        self.rows: dict = {}
+        self.shown: bool = False
+
+    def update(self, rows: list):
+        """
+        A class method which makes the table show the given rows, in the given order.
+
+        :param rows: list - (row id, values) tuples, where the row id is a unique name
+        :return: None
+        """
+        new_rows = {}
+        for row_id, values in rows:
+            if row_id:
+                new_rows[str(row_id)] = tuple(str(value) for value in values)
+
+        removed = [row_id for row_id in self.rows if row_id not in new_rows]
+        if removed:
+            self.tree.delete(*removed)
+
+        # Rows which are kept are only moved if their order has changed, and new rows are inserted
+        # in order, so that each one goes straight to its final position.
+        kept = [row_id for row_id in self.rows if row_id in new_rows]
+        new_order = list(new_rows)
+        if kept != [row_id for row_id in new_order if row_id in self.rows]:
+            for index, row_id in enumerate(row_id for row_id in new_order if row_id in self.rows):
+                self.tree.move(row_id, "", index)
+
+        for index, row_id in enumerate(new_order):
+            values = new_rows[row_id]
+            old_values = self.rows.get(row_id)
+            if old_values is None:
+                self.tree.insert("", index, iid=row_id, values=values)
+            elif old_values != values:
+                self.tree.item(row_id, values=values)
+
+        self.rows = new_rows
+        self.shown = True
+
+    def patch(self, changes: dict):
+        """
+        A class method which changes only the given rows of the table. New rows are added to the
+        end of the table.
+
+        :param changes: dict - the new values of each changed row, or None if the row should be
+        removed, keyed by row id
+        :return: None
+        """
+        for row_id, values in changes.items():
+            row_id = str(row_id)
+            if values is None:
+                if self.rows.pop(row_id, None) is not None:
+                    self.tree.delete(row_id)
+                continue
+            values = tuple(str(value) for value in values)
+            old_values = self.rows.get(row_id)
+            if old_values is None:
+                self.tree.insert("", tk.END, iid=row_id, values=values)
+            elif old_values != values:
+                self.tree.item(row_id, values=values)
+            self.rows[row_id] = values
+
+
+class BackgroundWorker:
+    """
+    This class is used to define a worker which runs slow tasks, such as reading the sales CSV and
+    making predictions, on a background thread so that the GUI never freezes. Finished results are
+    passed back to the main thread by polling with MASTER.after, as Tkinter widgets must only be
+    used from the main thread.
+
+    Each task has a key. Submitting a task with the same key as one which has not finished yet does
+    not start it again; the new callback is just given the result of the task already running. If a
+    task raises an error, the error is given to its error callbacks instead, or printed if it has
+    none.
+
+    attributes:
+    master: tk.Tk - the window whose event loop results are passed back to
+    executor: ThreadPoolExecutor - runs the tasks one at a time, in the order they were submitted
+    tasks: dict - the future of each task which has not finished, keyed by task key
+    callbacks: dict - the (callback, error callback) pairs of each task, keyed by task key
+    polling: bool - whether a check for finished tasks has been scheduled
+    """
+    def __init__(self, master):
+        self.master = master
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.tasks: dict = {}
+        self.callbacks: dict = {}
+        self.polling: bool = False
+
+    def submit(self, key, function, args: tuple = (), callback=None, error_callback=None):
+        """
+        A class method which runs a function in the background, unless a task with the same key is
+        already waiting or running, and calls callback with its result on the main thread, or
+        error_callback with the error if it fails.
+
+        :param key: any hashable value which names the task
+        :param function: the function to run
+        :param args: tuple = () - the arguments to run it with
+        :param callback: = None - a function taking the result, or None to just run the task
+        :param error_callback: = None - a function taking the error, or None to print it
+        :return: None
+        """
+        if key not in self.tasks:
+            self.tasks[key] = self.executor.submit(function, *args)
+            self.callbacks[key] = []
+        if callback is not None or error_callback is not None:
+            self.callbacks[key].append((callback, error_callback))
+        if not self.polling:
+            self.polling = True
+            self.master.after(POLL_INTERVAL, self.poll)
+
+    def cancel(self, key):
+        """
+        A class method which cancels a task. A task which has not started is not run at all, and
+        the result of a task which is already running is thrown away.
+
+        :param key: the key of the task
+        :return: None
+        """
+        future = self.tasks.pop(key, None)
+        self.callbacks.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def poll(self):
+        """
+        A class method which calls the callbacks of every finished task, and checks again later if
+        any tasks have not finished.
+
+        :return: None
+        """
+        finished = [key for key, future in self.tasks.items() if future.done()]
+        results = [(self.tasks.pop(key), self.callbacks.pop(key)) for key in finished]
+        self.polling = bool(self.tasks)
+        if self.polling:
+            self.master.after(POLL_INTERVAL, self.poll)
+
+        for future, callbacks in results:
+            try:
+                result = future.result()
+            except Exception as e:
+                # Any error is caught, so that one failed task cannot stop the results of the others
+                # from being passed back.
+                error_callbacks = [on_error for _callback, on_error in callbacks if on_error]
+                if not error_callbacks:
+                    print(e)
+                for on_error in error_callbacks:
+                    on_error(e)
+                continue
+            for callback, _on_error in callbacks:
+                if callback is not None:
+                    callback(result)
+
+    def shutdown(self):
+        """
+        A class method which cancels every task that has not started, and stops the worker.
+
+        :return: None
+        """
+        for key in list(self.tasks):
+            self.cancel(key)
+        self.executor.shutdown(wait=False)
 
 
 # Functions
-def make_a_label(frame, text: str, column: int = 0, row: int = 0):
+def batch_row(batch) -> tuple:
+    """
+    A function which returns the values shown for a batch in the table of all batches.
+
+    :param batch: Batch
+    :return: tuple
+    """
+    weeks, hours = b_m.time_at_stage(batch.name)
+    time = ("Weeks: " + str(weeks) + " Hours: " + str(hours))
+    return batch.name, batch.stage, time, batch.quantity, batch.recipe
+
+
+def tank_row(tank) -> tuple:
+    """
+    A function which returns the values shown for a tank in the table of available tanks.
+
+    :param tank: Tank
+    :return: tuple
+    """
+    return tank.name, tank.capability, str(tank.max_volume) + "L"
+
+
+def running_row(running) -> tuple:
+    """
+    A function which returns the values shown for a tank in the table of running tanks.
+
+    :param running: Placement
+    :return: tuple
     """
-    A function which makes a new label using arguments.
+    return running.tank.name, running.batch.name, running.batch.stage
 
-    This function makes a new Label widget inside the specified ttk frame, using the specified text,
-    column and row arguments. Anything else about this Label cannot be changed, so new Labels that
-    need to have textwrap or other features must be stated independently.
 
-    :param frame: A ttk GUI frame
-    :param text: str
-    :param column: int = 0
-    :param row: int = 0
+def delivery_row(batch) -> tuple:
+    """
+    A function which returns the values shown for a batch in the table of deliveries.
+
+    :param batch: Batch
+    :return: tuple
+    """
+    return batch.name, batch.quantity, batch.recipe
+
+
+def on_change(event):
+    """
+    A function which is called by brewery_monitoring every time a tank or batch changes. It notes
+    what changed and schedules one repaint, so that a burst of changes (such as allocating many
+    batches at once) only repaints the tables once.
+
+    :param event: b_m.ChangeEvent
+    :return: None
+    """
+    if event.batch is not None:
+        CHANGED_BATCHES.add(event.batch.name)
+    if event.tank is not None:
+        CHANGED_TANKS.add(event.tank.name)
+    if not REPAINT_SCHEDULED[0]:
+        REPAINT_SCHEDULED[0] = True
+        MASTER.after(REPAINT_INTERVAL, repaint_changes)
+
+
+def repaint_changes():
+    """
+    A function which updates only the rows of the tables that belong to a changed tank or batch.
+
     :return: None
     """
-    ttk.Label(frame, text=text).grid(column=column, row=row)
+    REPAINT_SCHEDULED[0] = False
+    changed_batches = list(CHANGED_BATCHES)
+    changed_tanks = list(CHANGED_TANKS)
+    CHANGED_BATCHES.clear()
+    CHANGED_TANKS.clear()
+
+    batch_changes = {}
+    delivery_changes = {}
+    for name in changed_batches:
+        batch = b_m.find_batch(name)
+        if batch is None:
+            continue
+        if batch.stage_code == 4:
+            batch_changes[name] = None
+            delivery_changes[name] = delivery_row(batch)
+            if name in LIST_OF_BATCHES:
+                LIST_OF_BATCHES.remove(name)
+        else:
+            batch_changes[name] = batch_row(batch)
+            if name not in LIST_OF_BATCHES:
+                LIST_OF_BATCHES.append(name)
+
+    running_by_tank = {}
+    if changed_tanks:
+        running_by_tank = {running.tank.name: running for running in b_m.running_tanks}
+    tank_changes = {}
+    running_changes = {}
+    for name in changed_tanks:
+        running = running_by_tank.get(name)
+        tank = b_m.available_tanks.get(name)
+        running_changes[name] = None if running is None else running_row(running)
+        tank_changes[name] = None if tank is None else tank_row(tank)
+
+    BATCH_TABLE.patch(batch_changes)
+    # Deliveries are only loaded once the user has asked to see them.
+    if DELIVERY_TABLE.shown:
+        DELIVERY_TABLE.patch(delivery_changes)
+    TANK_TABLE.patch(tank_changes)
+    RUNNING_TABLE.patch(running_changes)
+    BATCH_STAGE_NAME_ENTERED["values"] = LIST_OF_BATCHES
 
 
 def show_all_batches():
     """
     A function which shows all batches on the GUI.
 
-    This function creates a list of all current batches, making new Label widgets for each batch.
-    Any previous versions of the list are removed and then shown again, to act as a list refresh.
+    This function updates the table of all current batches, so that only the rows of batches which
+    have been added, removed or changed since the last refresh are redrawn.
 
     :return: None
     """
     SHOW_ALL_BUTTON.configure(text="Update batch list")
-    ttk.Label(MASTER, text="Name:").grid(column=0, row=2)
-    ttk.Label(MASTER, text="Stage:").grid(column=1, row=2)
-    ttk.Label(MASTER, text="Time:").grid(column=2, row=2)
-    ttk.Label(MASTER, text="Quantity:").grid(column=3, row=2)
-    ttk.Label(MASTER, text="Recipe:").grid(column=4, row=2)
 
     all_batches = b_m.view_all_batches_as_list()
-    all_batch_names = []
-
-    for b in all_batches:
-        all_batch_names.append(b.name)
+    known_batches = set(LIST_OF_BATCHES)
+    rows = []
 
-    iterator = 3
-
-    for label in MASTER.grid_slaves():
-        if int(label.grid_info()["row"]) > 2 and int(label.grid_info()["column"]) in \
-                [0, 1, 2, 3, 4]:
-            label.grid_forget()
     for batch in all_batches:
-        if batch.name not in LIST_OF_BATCHES:
+        if batch.name not in known_batches:
             LIST_OF_BATCHES.append(batch.name)
+            known_batches.add(batch.name)
 
-        weeks, hours = b_m.time_at_stage(batch.name)
-        time = ("Weeks: " + str(weeks) + " Hours: " + str(hours))
-        make_a_label(MASTER, batch.name, 0, iterator)
-        make_a_label(MASTER, batch.stage, 1, iterator)
-        make_a_label(MASTER, time, 2, iterator)
-        make_a_label(MASTER, batch.quantity, 3, iterator)
-        ttk.Label(MASTER, text=str(batch.recipe), wraplength=100, justify=tk.CENTER).grid(
-            column=4, row=iterator
-        )
-        iterator += 1
+        rows.append((batch.name, batch_row(batch)))
 
+    BATCH_TABLE.update(rows)
     BATCH_STAGE_NAME_ENTERED["values"] = LIST_OF_BATCHES
 
 
@@ -94,19 +371,8 @@ def show_all_tanks():
 
     :return: None
     """
-    for label in MASTER.grid_slaves():
-        if int(label.grid_info()["row"]) > 2 and int(label.grid_info()["column"]) in [8, 9, 10]:
-            label.grid_forget()
     SHOW_TANKS_BUTTON.configure(text="Update tank list")
-    ttk.Label(MASTER, text="Name:").grid(column=8, row=2)
-    ttk.Label(MASTER, text="Capability:").grid(column=9, row=2)
-    ttk.Label(MASTER, text="Volume:").grid(column=10, row=2)
-    iterator = 3
-    for tank in b_m.available_tanks:
-        make_a_label(MASTER, tank.name, 8, iterator)
-        make_a_label(MASTER, tank.capability, 9, iterator)
-        make_a_label(MASTER, str(tank.max_volume) + "L", 10, iterator)
-        iterator += 1
+    TANK_TABLE.update([(tank.name, tank_row(tank)) for tank in b_m.available_tanks])
 
 
 def show_running_tanks():
@@ -121,19 +387,7 @@ def show_running_tanks():
     :return: None
     """
     SHOW_RUNNING_BUTTON.configure(text="Update running tank list")
-    ttk.Label(MASTER, text="Name:").grid(column=12, row=2)
-    ttk.Label(MASTER, text="Batch:").grid(column=13, row=2)
-    ttk.Label(MASTER, text="Stage:").grid(column=14, row=2)
-    iterator = 3
-    for label in MASTER.grid_slaves():
-        if int(label.grid_info()["row"]) > 2 and int(label.grid_info()["column"]) in [12, 13, 14]:
-            label.grid_forget()
-
-    for tank in b_m.running_tanks:
-        make_a_label(MASTER, tank["tank"].name, 12, iterator)
-        make_a_label(MASTER, tank["batch"].name, 13, iterator)
-        make_a_label(MASTER, str(tank["batch"].stage), 14, iterator)
-        iterator += 1
+    RUNNING_TABLE.update([(tank.tank.name, running_row(tank)) for tank in b_m.running_tanks])
 
 
 def add_new_batch_via_button():
@@ -156,27 +410,24 @@ def choose_batch_via_button():
     :return: None
     """
     available_tanks = []
-    for batch in b_m.view_all_batches_as_list():
-        if batch.name == BATCH_STAGE_NAME_ENTERED.get():
-            AVAILABLE_TANK_CHOSEN.configure(state="readonly")
-            MOVE_BATCH_BUTTON.configure(state="normal")
-            if batch.stage == "1" or batch.stage == "2":
-                if batch.stage == "1":
-                    for tank in b_m.available_tanks:
-                        if tank.max_volume >= batch.volume and tank.capability in [
-                            "Fermenter", "Fermenter/conditioner"
-                        ]:
-                            available_tanks.append(tank.name)
-                    AVAILABLE_TANK_CHOSEN["values"] = available_tanks
-                elif batch.stage == "2":
-                    for tank in b_m.running_tanks:
-                        if tank["batch"].name == batch.name and tank["tank"].capability in [
-                            "Conditioner", "Fermenter/conditioner"
-                        ]:
-                            available_tanks.append(tank["tank"].name)
-                    AVAILABLE_TANK_CHOSEN["values"] = available_tanks
-            elif batch.stage == "3":
-                AVAILABLE_TANK_CHOSEN.configure(state="disabled")
+    batch = b_m.find_batch(BATCH_STAGE_NAME_ENTERED.get())
+    if batch is not None and batch.stage_code != 4:
+        AVAILABLE_TANK_CHOSEN.configure(state="readonly")
+        MOVE_BATCH_BUTTON.configure(state="normal")
+        if batch.stage_code == 1 or batch.stage_code == 2:
+            if batch.stage_code == 1:
+                for tank in b_m.relevant_tanks("2", batch.volume):
+                    available_tanks.append(tank.name)
+                AVAILABLE_TANK_CHOSEN["values"] = available_tanks
+            elif batch.stage_code == 2:
+                for tank in b_m.running_tanks:
+                    if tank.batch.name == batch.name and tank.tank.capability_code in (
+                        b_m.STAGE_CAPABILITY_CODES["3"]
+                    ):
+                        available_tanks.append(tank.tank.name)
+                AVAILABLE_TANK_CHOSEN["values"] = available_tanks
+        elif batch.stage_code == 3:
+            AVAILABLE_TANK_CHOSEN.configure(state="disabled")
 
 
 def move_batch_via_button():
@@ -190,16 +441,15 @@ def move_batch_via_button():
     """
     chosen_tank = AVAILABLE_TANK_CHOSEN.get()
     chosen_batch = BATCH_STAGE_NAME_ENTERED.get()
-    all_batches = b_m.view_all_batches_as_list()
+    batch = b_m.find_batch(chosen_batch)
 
-    for batch in all_batches:
-        if batch.name == chosen_batch:
-            if batch.stage == "1":
-                b_m.move_to_stage_2(chosen_batch, chosen_tank)
-            elif batch.stage == "2":
-                b_m.move_to_stage_3(chosen_batch, chosen_tank)
-            elif batch.stage == "3":
-                b_m.move_to_stage_4(chosen_batch)
+    if batch is not None:
+        if batch.stage_code == 1:
+            b_m.move_to_stage_2(chosen_batch, chosen_tank)
+        elif batch.stage_code == 2:
+            b_m.move_to_stage_3(chosen_batch, chosen_tank)
+        elif batch.stage_code == 3:
+            b_m.move_to_stage_4(chosen_batch)
 
     AVAILABLE_TANK_CHOSEN.configure(state="disabled")
     MOVE_BATCH_BUTTON.configure(state="disabled")
@@ -220,52 +470,121 @@ def disable_enable_button():
         NEW_BATCH_BUTTON.configure(state="disabled")
 
 
+def forecast_key() -> tuple:
+    """
+    A function which returns the key of the background task that works out the forecast for the
+    current CSV file.
+
+    :return: tuple
+    """
+    return "forecast", b_m.CSV_FILE[0]
+
+
+def prediction_key() -> tuple:
+    """
+    A function which returns the key of the background task started by the prediction button for
+    the current CSV file. It is not the key of the forecast worked out at start up, so that
+    pressing the button while that is still running refreshes the forecast rather than joining it.
+
+    :return: tuple
+    """
+    return "prediction", b_m.CSV_FILE[0]
+
+
 def make_prediction():
+    """
+    A function which starts working out the sales prediction in the background, or cancels it if
+    it is already being worked out.
+
+    :return: None
+    """
+    if PREDICTION_TASK[0] is not None:
+        WORKER.cancel(PREDICTION_TASK[0])
+        PREDICTION_TASK[0] = None
+        PREDICTION_TEXT.set("Prediction cancelled.")
+        PREDICT_BUTTON.configure(text="Make prediction")
+        return
+
+    PREDICTION_TASK[0] = prediction_key()
+    PREDICTION_TEXT.set("Computing...")
+    PREDICT_BUTTON.configure(text="Cancel prediction")
+    WORKER.submit(
+        PREDICTION_TASK[0], predict.refresh_forecast, (b_m.CSV_FILE[0],), show_prediction,
+        show_prediction_error
+    )
+    # New sales may have been read for the prediction.
+    read_sold_gyles()
+
+
+def read_sold_gyles():
+    """
+    A function which finds the largest gyle number in the current CSV file in the background, and
+    then passes it to traceability on the main thread, so that the gyle numbers given to batches
+    follow on from it without reading the file on the main thread.
+
+    :return: None
+    """
+    WORKER.submit(
+        ("sold gyles", b_m.CSV_FILE[0]), traceability.sold_gyle, (b_m.CSV_FILE[0],),
+        traceability.note_sold_gyle
+    )
+
+
+def show_prediction(forecast: tuple):
     """
     A function which changes a label depending on the outcome of the sales prediction.
 
+    :param forecast: tuple - (growth_rates, matrix) as returned by predict.forecast_matrix
     :return: None
     """
-    predict_name, predict_current, predict_prediction = predict.predict_on_current_stock()
+    PREDICTION_TASK[0] = None
+    PREDICT_BUTTON.configure(text="Make prediction")
+    predict_name, predict_current, predict_prediction = predict.predict_on_current_stock(
+        b_m.view_all_batches_as_list(), forecast
+    )
     prediction1 = "You currently have a suitable amount of each recipe."
     prediction2 = "You should try brewing more Organic " + str(predict_name) + \
                   " as you currently have " + str(predict_current) + \
                   " bottles, with a prediction in two months of " + str(predict_prediction) + "."
 
     if predict_name is True and predict_current is False and predict_prediction is False:
-        ttk.Label(MASTER, text=prediction1, wraplength=150, justify=tk.LEFT).grid(column=6, row=11)
+        PREDICTION_TEXT.set(prediction1)
     else:
-        ttk.Label(MASTER, text=prediction2, wraplength=150, justify=tk.LEFT).grid(column=6, row=11)
+        PREDICTION_TEXT.set(prediction2)
 
 
-def view_all_deliveries():
+def show_prediction_error(error: Exception):
     """
-    A function that views all batches that are at stage 4 and outputs them as a list to the user.
+    A function which shows that the sales prediction could not be worked out, so that another one
+    can be asked for.
+
+    :param error: Exception
+    :return: None
+    """
+    PREDICTION_TASK[0] = None
+    PREDICT_BUTTON.configure(text="Make prediction")
+    PREDICTION_TEXT.set("The prediction could not be made: " + str(error))
+
+
+def close_window():
     """
-    all_batches = b_m.view_all_batches_as_list(True)
+    A function which stops any background work and closes the GUI.
 
-    ttk.Label(MASTER, text="Name:").grid(column=15, row=2)
-    ttk.Label(MASTER, text="Quantity:").grid(column=16, row=2)
-    ttk.Label(MASTER, text="Recipe:").grid(column=17, row=2)
+    :return: None
+    """
+    WORKER.shutdown()
+    MASTER.destroy()
 
-    for label in MASTER.grid_slaves():
-        if int(label.grid_info()["row"]) > 2 and int(label.grid_info()["column"]) in [15, 16, 17]:
-            label.grid_forget()
 
-    iterator = 3
-    for batch in all_batches:
-        if batch.stage == "4":
-            for _batch in LIST_OF_BATCHES:
-                if _batch == batch.name:
-                    LIST_OF_BATCHES.remove(_batch)
-
-            make_a_label(MASTER, batch.name, 15, iterator)
-            make_a_label(MASTER, batch.quantity, 16, iterator)
-            ttk.Label(MASTER, text=str(batch.recipe), wraplength=100, justify=tk.CENTER).grid(
-                column=17, row=iterator
-            )
-            iterator += 1
+def view_all_deliveries():
+    """
+    A function that views all batches that are at stage 4 and outputs them as a list to the user.
+    """
+    delivered = list(b_m.batches_s4)
+    delivered_names = {batch.name for batch in delivered}
+    LIST_OF_BATCHES[:] = [name for name in LIST_OF_BATCHES if name not in delivered_names]
 
+    DELIVERY_TABLE.update([(batch.name, delivery_row(batch)) for batch in delivered])
     BATCH_STAGE_NAME_ENTERED["values"] = LIST_OF_BATCHES
 
 
@@ -273,100 +592,163 @@ def main():
     """
     A function which starts the GUI.
     """
+    build_gui()
+    b_m.open_state_store()
+    # The largest gyle sold is found by read_sold_gyles, so the sales CSV is not read here.
+    traceability.start_tracing(read_sales=False)
     b_m.create_required_tanks()
+    show_all_batches()
+    show_all_tanks()
+    show_running_tanks()
+    b_m.subscribe(on_change)
+    # The sales CSV is read in the background straight away, so that the first prediction is quick.
+    WORKER.submit(forecast_key(), predict.forecast_matrix, (b_m.CSV_FILE[0],))
+    read_sold_gyles()
+    MASTER.protocol("WM_DELETE_WINDOW", close_window)
     MASTER.mainloop()
 
-# GUI widgets for adding a new batch.
-# Labels and Entry forms for Batch Name.
-ADD_NEW_BATCH_LABEL = ttk.Label(MASTER, text="Add new batch:").grid(
-    column=5, row=0, columnspan=2, sticky=tk.N
-)
-BATCH_NAME_LABEL = ttk.Label(MASTER, text="Batch Name:").grid(column=5, row=1)
-BATCH_NAME = tk.StringVar()
-BATCH_NAME_ENTERED = ttk.Entry(MASTER, width=18, textvariable=BATCH_NAME)
-BATCH_NAME_ENTERED.grid(column=6, row=1)
-# Checkbox to prevent empty name being submitted.
-NAME_CHECK = tk.StringVar()
-NAME_CHECK_BOX = tk.Checkbutton(
-    MASTER, text="Add with this name", variable=NAME_CHECK, command=disable_enable_button
-)
-NAME_CHECK_BOX.deselect()
-NAME_CHECK_BOX.grid(column=7, row=1)
-# Labels and Entry forms for Batch Recipe.
-BATCH_RECIPE_LABEL = ttk.Label(MASTER, text="Batch Recipe:").grid(column=5, row=2)
-BATCH_RECIPE = tk.StringVar()
-BATCH_RECIPE_ENTERED = ttk.Combobox(MASTER, width=15, textvariable=BATCH_RECIPE, state="readonly")
-BATCH_RECIPE_ENTERED["values"] = ["Organic Red Helles", "Organic Pilsner", "Organic Dunkel"]
-BATCH_RECIPE_ENTERED.current(0)
-BATCH_RECIPE_ENTERED.grid(column=6, row=2)
-# Labels and Entry forms for Batch Quantity.
-BATCH_QUANTITY_LABEL = ttk.Label(MASTER, text="Batch Quantity").grid(column=5, row=3)
-BATCH_QUANTITY = tk.IntVar()
-BATCH_QUANTITY_ENTERED = ttk.Entry(MASTER, width=18, textvariable=BATCH_QUANTITY)
-BATCH_QUANTITY_ENTERED.grid(column=6, row=3)
-# Button for adding new batch
-NEW_BATCH_BUTTON = ttk.Button(MASTER, text="Add Batch", command=add_new_batch_via_button)
-NEW_BATCH_BUTTON.grid(column=6, row=4)
-NEW_BATCH_BUTTON.configure(state="disabled")
-
-# GUI widgets for the list of all batches.
-ALL_BATCH_TITLE = ttk.Label(MASTER, text="All batches:").grid(
-    column=0, row=0, columnspan=5, sticky=tk.N
-)
-SHOW_ALL_BUTTON = ttk.Button(MASTER, text="Show all batches", command=show_all_batches)
-SHOW_ALL_BUTTON.grid(column=0, row=1, columnspan=5, sticky=tk.N)
-
-# GUI widgets for the list of available tanks.
-AVAILABLE_TANK_TITLE = ttk.Label(MASTER, text="Available Tanks:").grid(
-    column=8, row=0, columnspan=3, sticky=tk.N
-)
-SHOW_TANKS_BUTTON = ttk.Button(MASTER, text="Show all tanks", command=show_all_tanks)
-SHOW_TANKS_BUTTON.grid(column=8, row=1, columnspan=3, sticky=tk.N)
-
-# GUI widgets for the list of running tanks.
-RUNNING_TANK_TITLE = ttk.Label(MASTER, text="Running Tanks:").grid(
-    column=12, row=0, columnspan=3, sticky=tk.N
-)
-SHOW_RUNNING_BUTTON = ttk.Button(MASTER, text="Show running tanks", command=show_running_tanks)
-SHOW_RUNNING_BUTTON.grid(column=12, row=1, columnspan=3, sticky=tk.N)
-
-# GUI widgets for moving batches between stages and selecting tanks for them.
-MOVE_BATCH_STAGE_LABEL = ttk.Label(MASTER, text="Move batch stage:").grid(
-    column=5, row=6, columnspan=2, sticky=tk.N
-)
-BATCH_STAGE_NAME_LABEL = ttk.Label(MASTER, text="Batch Name:").grid(column=5, row=7)
-BATCH_STAGE_NAME = tk.StringVar()
-BATCH_STAGE_NAME_ENTERED = ttk.Combobox(
-    MASTER, width=18, textvariable=BATCH_STAGE_NAME, state="readonly"
-)
-BATCH_STAGE_NAME_ENTERED.grid(column=6, row=7)
-
-AVAILABLE_TANK_LABEL = ttk.Label(MASTER, text="Tanks:")
-AVAILABLE_TANK_LABEL.grid(column=5, row=8)
-AVAILABLE_TANK = tk.StringVar()
-AVAILABLE_TANK_CHOSEN = ttk.Combobox(
-    MASTER, width=18, textvariable=AVAILABLE_TANK, state="disabled"
-)
-AVAILABLE_TANK_CHOSEN.grid(column=6, row=8)
-
-CHOOSE_BATCH_BUTTON = ttk.Button(MASTER, text="Choose Batch", command=choose_batch_via_button)
-CHOOSE_BATCH_BUTTON.grid(column=7, row=7)
-
-MOVE_BATCH_BUTTON = ttk.Button(
-    MASTER, text="Move to next stage", command=move_batch_via_button, state="disabled"
-)
-MOVE_BATCH_BUTTON.grid(column=6, row=9)
-
-# GUI widgets for predictions.
-PREDICTION_TITLE = ttk.Label(MASTER, text="Prediction:").grid(column=5, row=11)
-PREDICT_BUTTON = ttk.Button(MASTER, text="Make prediction", command=make_prediction).grid(
-    column=7, row=11
-)
-
-DELIVERY_TITLE = ttk.Label(MASTER, text="Delivery").grid(column=15, row=0, padx=25, columnspan=4)
-DELIVERY_BUTTON = ttk.Button(MASTER, text="Show all deliveries", command=view_all_deliveries).grid(
-    column=15, row=1, columnspan=4, padx=25
-)
+
+# GUI widgets which are used by the functions above, made by build_gui.
+MASTER = None
+BATCH_NAME = None
+NAME_CHECK = None
+BATCH_RECIPE = None
+BATCH_QUANTITY = None
+NEW_BATCH_BUTTON = None
+SHOW_ALL_BUTTON = None
+BATCH_TABLE = None
+SHOW_TANKS_BUTTON = None
+TANK_TABLE = None
+SHOW_RUNNING_BUTTON = None
+RUNNING_TABLE = None
+BATCH_STAGE_NAME_ENTERED = None
+AVAILABLE_TANK_CHOSEN = None
+MOVE_BATCH_BUTTON = None
+WORKER = None
+PREDICT_BUTTON = None
+PREDICTION_TEXT = None
+DELIVERY_TABLE = None
+# The Tkinter variables of the comboboxes, which must be kept so that they are not deleted.
+BATCH_STAGE_NAME = None
+AVAILABLE_TANK = None
+
+
+def build_gui():
+    """
+    A function which makes the window and all of its widgets. It is only called when the GUI is
+    started, so that this module can be imported without a display.
+
+    :return: None
+    """
+    global MASTER, BATCH_NAME, NAME_CHECK, BATCH_RECIPE, BATCH_QUANTITY, NEW_BATCH_BUTTON, \
+        SHOW_ALL_BUTTON, BATCH_TABLE, SHOW_TANKS_BUTTON, TANK_TABLE, SHOW_RUNNING_BUTTON, \
+        RUNNING_TABLE, BATCH_STAGE_NAME_ENTERED, AVAILABLE_TANK_CHOSEN, MOVE_BATCH_BUTTON, WORKER, \
+        PREDICT_BUTTON, PREDICTION_TEXT, DELIVERY_TABLE, BATCH_STAGE_NAME, AVAILABLE_TANK
+
+    # Tkinter Frame init
+    MASTER = tk.Tk()
+    MASTER.title("Data Dashboard")
+    MASTER.resizable(True, True)
+
+    # GUI widgets for adding a new batch.
+    # Labels and Entry forms for Batch Name.
+    ttk.Label(MASTER, text="Add new batch:").grid(column=5, row=0, columnspan=2, sticky=tk.N)
+    ttk.Label(MASTER, text="Batch Name:").grid(column=5, row=1)
+    BATCH_NAME = tk.StringVar()
+    batch_name_entered = ttk.Entry(MASTER, width=18, textvariable=BATCH_NAME)
+    batch_name_entered.grid(column=6, row=1)
+    # Checkbox to prevent empty name being submitted.
+    NAME_CHECK = tk.StringVar()
+    name_check_box = tk.Checkbutton(
+        MASTER, text="Add with this name", variable=NAME_CHECK, command=disable_enable_button
+    )
+    name_check_box.deselect()
+    name_check_box.grid(column=7, row=1)
+    # Labels and Entry forms for Batch Recipe.
+    ttk.Label(MASTER, text="Batch Recipe:").grid(column=5, row=2)
+    BATCH_RECIPE = tk.StringVar()
+    batch_recipe_entered = ttk.Combobox(
+        MASTER, width=15, textvariable=BATCH_RECIPE, state="readonly"
+    )
+    batch_recipe_entered["values"] = ["Organic Red Helles", "Organic Pilsner", "Organic Dunkel"]
+    batch_recipe_entered.current(0)
+    batch_recipe_entered.grid(column=6, row=2)
+    # Labels and Entry forms for Batch Quantity.
+    ttk.Label(MASTER, text="Batch Quantity").grid(column=5, row=3)
+    BATCH_QUANTITY = tk.IntVar()
+    batch_quantity_entered = ttk.Entry(MASTER, width=18, textvariable=BATCH_QUANTITY)
+    batch_quantity_entered.grid(column=6, row=3)
+    # Button for adding new batch
+    NEW_BATCH_BUTTON = ttk.Button(MASTER, text="Add Batch", command=add_new_batch_via_button)
+    NEW_BATCH_BUTTON.grid(column=6, row=4)
+    NEW_BATCH_BUTTON.configure(state="disabled")
+
+    # GUI widgets for the list of all batches.
+    ttk.Label(MASTER, text="All batches:").grid(column=0, row=0, columnspan=5, sticky=tk.N)
+    SHOW_ALL_BUTTON = ttk.Button(MASTER, text="Show all batches", command=show_all_batches)
+    SHOW_ALL_BUTTON.grid(column=0, row=1, columnspan=5, sticky=tk.N)
+    BATCH_TABLE = DiffTable(
+        MASTER, ["Name", "Stage", "Time", "Quantity", "Recipe"], [90, 50, 200, 70, 130], 0, 5
+    )
+
+    # GUI widgets for the list of available tanks.
+    ttk.Label(MASTER, text="Available Tanks:").grid(column=8, row=0, columnspan=3, sticky=tk.N)
+    SHOW_TANKS_BUTTON = ttk.Button(MASTER, text="Show all tanks", command=show_all_tanks)
+    SHOW_TANKS_BUTTON.grid(column=8, row=1, columnspan=3, sticky=tk.N)
+    TANK_TABLE = DiffTable(MASTER, ["Name", "Capability", "Volume"], [90, 150, 70], 8, 3)
+
+    # GUI widgets for the list of running tanks.
+    ttk.Label(MASTER, text="Running Tanks:").grid(column=12, row=0, columnspan=3, sticky=tk.N)
+    SHOW_RUNNING_BUTTON = ttk.Button(
+        MASTER, text="Show running tanks", command=show_running_tanks
+    )
+    SHOW_RUNNING_BUTTON.grid(column=12, row=1, columnspan=3, sticky=tk.N)
+    RUNNING_TABLE = DiffTable(MASTER, ["Name", "Batch", "Stage"], [90, 90, 50], 12, 3)
+
+    # GUI widgets for moving batches between stages and selecting tanks for them.
+    ttk.Label(MASTER, text="Move batch stage:").grid(column=5, row=6, columnspan=2, sticky=tk.N)
+    ttk.Label(MASTER, text="Batch Name:").grid(column=5, row=7)
+    BATCH_STAGE_NAME = tk.StringVar()
+    BATCH_STAGE_NAME_ENTERED = ttk.Combobox(
+        MASTER, width=18, textvariable=BATCH_STAGE_NAME, state="readonly"
+    )
+    BATCH_STAGE_NAME_ENTERED.grid(column=6, row=7)
+
+    ttk.Label(MASTER, text="Tanks:").grid(column=5, row=8)
+    AVAILABLE_TANK = tk.StringVar()
+    AVAILABLE_TANK_CHOSEN = ttk.Combobox(
+        MASTER, width=18, textvariable=AVAILABLE_TANK, state="disabled"
+    )
+    AVAILABLE_TANK_CHOSEN.grid(column=6, row=8)
+
+    choose_batch_button = ttk.Button(MASTER, text="Choose Batch", command=choose_batch_via_button)
+    choose_batch_button.grid(column=7, row=7)
+
+    MOVE_BATCH_BUTTON = ttk.Button(
+        MASTER, text="Move to next stage", command=move_batch_via_button, state="disabled"
+    )
+    MOVE_BATCH_BUTTON.grid(column=6, row=9)
+
+    # Background worker for reading the sales CSV and making predictions.
+    WORKER = BackgroundWorker(MASTER)
+
+    # GUI widgets for predictions.
+    ttk.Label(MASTER, text="Prediction:").grid(column=5, row=11)
+    PREDICT_BUTTON = ttk.Button(MASTER, text="Make prediction", command=make_prediction)
+    PREDICT_BUTTON.grid(column=7, row=11)
+    PREDICTION_TEXT = tk.StringVar()
+    ttk.Label(
+        MASTER, textvariable=PREDICTION_TEXT, wraplength=150, justify=tk.LEFT
+    ).grid(column=6, row=11)
+
+    ttk.Label(MASTER, text="Delivery").grid(column=15, row=0, padx=25, columnspan=4)
+    ttk.Button(MASTER, text="Show all deliveries", command=view_all_deliveries).grid(
+        column=15, row=1, columnspan=4, padx=25
+    )
+    DELIVERY_TABLE = DiffTable(
+        MASTER, ["Name", "Quantity", "Recipe"], [90, 70, 130], 15, 3, padx=25
+    )
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,263 @@
+"""
+This module is responsible for tracing beer from the batch it was brewed in to the customers it was
+sold to. Every order in the sales CSV carries the gyle number of the brew it was filled from, and
+each batch is given a gyle number, either by hand or automatically when it reaches stage 4. The
+gyle numbers of the batches are kept in a GyleIndex (and in the state store, if one is open), and
+the quantity of each gyle sold to each customer is totalled by sales_data while the sales file is
+read, so every question is answered with a dictionary lookup.
+
+New gyle numbers follow on from the largest one found in the sales file, which is read once by
+start_tracing. Giving a batch its gyle never reads the sales file itself, so a program that must
+not wait for the file, such as the GUI, can pass read_sales=False and find the largest gyle with
+sold_gyle in the background instead, handing it to note_sold_gyle when it is known. Batches that
+reach stage 4 before then are given their gyles by note_sold_gyle.
+
+Tracing starts once start_tracing has been called:
+
+    import traceability
+    traceability.start_tracing()
+    traceability.customers_of_gyle(90)
+"""
+# Imports
+import brewery_monitoring as b_m
+import sales_data
+
+
+# Classes
+class GyleIndex:
+    """
+    This class is used to keep track of which batch each gyle number was given to. Each gyle
+    belongs to one batch and each batch has at most one gyle.
+
+    attributes:
+    batch_by_gyle: dict - the name of the batch of each gyle, keyed by gyle number
+    gyle_by_batch: dict - the gyle number of each batch, keyed by batch name
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """
+        A class method which removes every gyle from the index.
+
+        :return: None
+        """
+        self.batch_by_gyle: dict = {}
+        self.gyle_by_batch: dict = {}
+
+    def check(self, gyle: int, batch_name: str):
+        """
+        A class method which raises a ValueError if the gyle belongs to another batch, or if the
+        batch already has a different gyle.
+
+        :param gyle: int
+        :param batch_name: str
+        :return: None
+        """
+        owner = self.batch_by_gyle.get(gyle)
+        if owner is not None and owner != batch_name:
+            raise ValueError("Gyle %d already belongs to batch %s." % (gyle, owner))
+        current = self.gyle_by_batch.get(batch_name)
+        if current is not None and current != gyle:
+            raise ValueError("Batch %s already has gyle %d." % (batch_name, current))
+
+    def add(self, gyle: int, batch_name: str):
+        """
+        A class method which gives a gyle number to a batch.
+
+        :param gyle: int
+        :param batch_name: str
+        :return: None
+        """
+        self.check(gyle, batch_name)
+        self.batch_by_gyle[gyle] = batch_name
+        self.gyle_by_batch[batch_name] = gyle
+
+    def gyle_of(self, batch_name: str) -> int:
+        """
+        A class method which returns the gyle number of a batch, or None if it has none.
+
+        :param batch_name: str
+        :return: int
+        """
+        return self.gyle_by_batch.get(batch_name)
+
+    def batch_of(self, gyle: int) -> str:
+        """
+        A class method which returns the name of the batch of a gyle, or None if no batch has it.
+
+        :param gyle: int
+        :return: str
+        """
+        return self.batch_by_gyle.get(gyle)
+
+
+# Global lists
+GYLES: GyleIndex = GyleIndex()
+# The largest gyle number found in the sales file, or None until note_sold_gyle has been called.
+SOLD_GYLE: list = [None]
+# The names of the batches waiting for a gyle number until the largest sold gyle is known.
+PENDING_BATCHES: list = []
+
+
+# Functions
+def start_tracing(read_sales: bool = True):
+    """
+    A function which loads the gyle numbers saved in the state store, if one is open, and gives a
+    gyle number to every batch that reaches stage 4 from then on.
+
+    :param read_sales: bool = True - whether to read the largest gyle sold from the sales file now,
+    rather than leaving it to be passed to note_sold_gyle later
+    :return: None
+    """
+    store = b_m.STATE_STORE[0]
+    if store is not None:
+        for gyle, batch_name in store.load_gyles():
+            GYLES.add(gyle, batch_name)
+    b_m.subscribe(on_change)
+    if read_sales:
+        note_sold_gyle(sold_gyle())
+
+
+def stop_tracing():
+    """
+    A function which stops giving gyle numbers to batches as they reach stage 4.
+
+    :return: None
+    """
+    b_m.unsubscribe(on_change)
+
+
+def on_change(event):
+    """
+    A function which is called by brewery_monitoring every time a tank or batch changes, and gives
+    the next gyle number to a batch that has reached stage 4 without one. If the largest gyle sold
+    is not known yet, the batch is given its gyle by note_sold_gyle instead.
+
+    :param event: b_m.ChangeEvent
+    :return: None
+    """
+    if event.kind == b_m.STAGE_CHANGED and event.batch.stage_code == 4 and \
+            GYLES.gyle_of(event.batch.name) is None:
+        if SOLD_GYLE[0] is None:
+            PENDING_BATCHES.append(event.batch.name)
+        else:
+            assign_gyle(event.batch.name)
+
+
+def sold_gyle(file_name: str = None) -> int:
+    """
+    A function which reads the sales file and returns the largest gyle number sold, or 0 if there
+    are none or the file cannot be read. It only reads the sales data, so it can be run on a
+    background thread.
+
+    :param file_name: str = None - the sales file, or the current one if not given
+    :return: int
+    """
+    if file_name is None:
+        file_name = sales_data.CSV_FILE[0]
+    try:
+        return max(sales_data.load_dataset(file_name).gyle_totals, default=0)
+    except OSError:
+        return 0
+
+
+def note_sold_gyle(gyle: int):
+    """
+    A function which records the largest gyle number sold, as returned by sold_gyle, and gives a
+    gyle number to each batch that reached stage 4 while it was not known.
+
+    :param gyle: int
+    :return: None
+    """
+    SOLD_GYLE[0] = gyle
+    while PENDING_BATCHES:
+        batch_name = PENDING_BATCHES.pop(0)
+        if GYLES.gyle_of(batch_name) is None:
+            assign_gyle(batch_name)
+
+
+def next_gyle(file_name: str = None) -> int:
+    """
+    A function which returns the gyle number after the largest one given to a batch or found in
+    the sales file. The sales file is only read if a file name is given or the largest gyle sold
+    is not known yet; otherwise the one recorded by note_sold_gyle is used.
+
+    :param file_name: str = None - the sales file to read
+    :return: int
+    """
+    sold = SOLD_GYLE[0]
+    if file_name is not None or sold is None:
+        sold = sold_gyle(file_name)
+    return max(max(GYLES.batch_by_gyle, default=0), sold) + 1
+
+
+def assign_gyle(batch_name: str, gyle: int = None) -> int:
+    """
+    A function which gives a gyle number to a batch, and saves it to the state store if one is
+    open. If no gyle number is given, the next one is used. If the batch does not exist, or the
+    gyle or batch already has another, the error is printed and None is returned.
+
+    :param batch_name: str
+    :param gyle: int = None
+    :return: the gyle number given to the batch: int
+    """
+    try:
+        if b_m.find_batch(batch_name) is None:
+            raise ValueError("There is no batch called %s." % batch_name)
+        if gyle is None:
+            gyle = GYLES.gyle_of(batch_name) or next_gyle()
+        if GYLES.gyle_of(batch_name) == gyle:
+            return gyle
+        GYLES.check(gyle, batch_name)
+        if b_m.STATE_STORE[0] is not None:
+            b_m.STATE_STORE[0].save_gyle(gyle, batch_name)
+        GYLES.add(gyle, batch_name)
+        return gyle
+    except ValueError as e:
+        print(e)
+        return None
+
+
+def batch_of_gyle(gyle: int):
+    """
+    A function which returns the batch that a gyle number was given to, or None.
+
+    :param gyle: int
+    :return: Batch
+    """
+    batch_name = GYLES.batch_of(gyle)
+    return None if batch_name is None else b_m.find_batch(batch_name)
+
+
+def customers_of_gyle(gyle: int, file_name: str = None) -> dict:
+    """
+    A function which returns the quantity of a gyle that each customer received, according to the
+    sales file.
+
+    :param gyle: int
+    :param file_name: str = None - the sales file, or the current one if not given
+    :return: dict - quantity keyed by customer name
+    """
+    if file_name is None:
+        file_name = sales_data.CSV_FILE[0]
+    return sales_data.load_dataset(file_name).gyle_customers(gyle)
+
+
+def unsold_quantity(batch_name: str, file_name: str = None) -> int:
+    """
+    A function which returns how many bottles of a batch have not been sold yet, which is the
+    quantity of the batch less the quantity of its gyle in the sales file. None is returned if
+    there is no such batch, or it has no gyle number.
+
+    :param batch_name: str
+    :param file_name: str = None - the sales file, or the current one if not given
+    :return: int
+    """
+    batch = b_m.find_batch(batch_name)
+    gyle = GYLES.gyle_of(batch_name)
+    if batch is None or gyle is None:
+        return None
+    if file_name is None:
+        file_name = sales_data.CSV_FILE[0]
+    return batch.quantity - sales_data.load_dataset(file_name).gyle_totals.get(gyle, 0)
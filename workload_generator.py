@@ -0,0 +1,393 @@
+"""
+This module is responsible for making synthetic workloads, so that the brewery can be tested at a
+larger scale than the shipped sales file allows. It can write sales CSV files with the same six
+headings that upload_csv checks for, over any number of years, customers, recipes and orders, and
+it can make scripts of tank and batch operations to run against brewery_monitoring.
+
+Everything is made from a seeded random number generator, so the same arguments always give the
+same output. It is run from the command line:
+
+    python workload_generator.py sales sales.csv --rows 10000000 --years 5 --customers 2000
+    python workload_generator.py operations operations.jsonl --batches 10000 --tanks 100
+
+Sales files are written in date order, one block of orders at a time, so they can be far larger than
+the memory available. By default the orders follow the monthly pattern and recipe mix of the shipped
+file, with sales growing by ANNUAL_GROWTH each year.
+"""
+# Imports
+import argparse
+import calendar
+import csv
+import json
+import random
+from datetime import date
+import brewery_monitoring as b_m
+
+# Constants
+HEADINGS: list = [
+    "Invoice Number", "Customer", "Date Required", "Recipe", "Gyle Number", "Quantity ordered"
+]
+# How many orders each month has, relative to the others (January to December), taken from the
+# shipped sales file.
+SEASONALITY: list = [17, 41, 49, 48, 78, 60, 67, 95, 41, 76, 39, 51]
+# How often each recipe is ordered, relative to the others, taken from the shipped sales file.
+RECIPE_WEIGHTS: dict = {"Organic Pilsner": 342, "Organic Red Helles": 181, "Organic Dunkel": 139}
+ANNUAL_GROWTH: float = 1.1
+# The shipped sales file starts in November 2018.
+START_DATE: date = date(2018, 11, 1)
+FIRST_INVOICE: int = 200
+FIRST_GYLE: int = 87
+# The chance that an order is on a new invoice, rather than on the same invoice as the last order.
+NEW_INVOICE_CHANCE: float = 0.55
+# Most orders are of between 7 and 60 bottles, with the occasional large order.
+SMALL_ORDER: tuple = (7, 60)
+LARGE_ORDER: tuple = (100, 530)
+LARGE_ORDER_CHANCE: float = 0.02
+# The number of orders written to the file at a time.
+WRITE_BLOCK: int = 50000
+# The functions of brewery_monitoring that an operations script may call.
+OPERATIONS: set = {
+    "create_new_tank", "create_new_batch", "move_to_stage_2", "move_to_stage_3", "move_to_stage_4",
+    "auto_move_batch", "time_at_stage",
+}
+TANK_VOLUMES: list = [680, 800, 1000]
+# The most bottles in a generated batch, so that every batch fits in the smallest tank (680L).
+MAX_QUANTITY: int = 1360
+TANK_CAPABILITIES: list = [b_m.FERMENTER, b_m.CONDITIONER, b_m.FERMENTER_CONDITIONER]
+
+
+# Functions
+def split_rows(rows: int, weights: list) -> list:
+    """
+    A function which splits a number of rows between groups in proportion to their weights, so
+    that the numbers of rows add up exactly.
+
+    :param rows: int
+    :param weights: list
+    :return: list
+    """
+    total = sum(weights)
+    shares = [rows * weight / total for weight in weights]
+    counts = [int(share) for share in shares]
+    # The rows left over go to the groups that lost the most by rounding down.
+    by_remainder = sorted(range(len(shares)), key=lambda index: counts[index] - shares[index])
+    for index in by_remainder[:rows - sum(counts)]:
+        counts[index] += 1
+    return counts
+
+
+def month_starts(start: date, months: int) -> list:
+    """
+    A function which returns the first day of each month, starting with the month of start.
+
+    :param start: date
+    :param months: int
+    :return: list of date
+    """
+    starts = []
+    year, month = start.year, start.month
+    for _ in range(months):
+        starts.append(date(year, month, 1))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return starts
+
+
+def iter_sales_rows(
+        rows: int,
+        years: int = 1,
+        customers: int = 64,
+        recipes: dict = None,
+        seasonality: list = None,
+        growth: float = ANNUAL_GROWTH,
+        start: date = START_DATE,
+        seed: int = 0):
+    """
+    A generator which yields blocks of synthetic sales orders in date order, each order being a list
+    of the six columns of a sales CSV file.
+
+    :param rows: int - the total number of orders
+    :param years: int = 1 - how many years the orders cover
+    :param customers: int = 64 - how many different customers place orders
+    :param recipes: dict = None - how often each recipe is ordered, relative to the others, by
+    default RECIPE_WEIGHTS. Recipes that brewery_monitoring does not know about are ignored when
+    making predictions.
+    :param seasonality: list = None - how many orders each month from January to December has,
+    relative to the others, by default SEASONALITY
+    :param growth: float = ANNUAL_GROWTH - how much the number of orders grows by each year
+    :param start: date = START_DATE - the first month of orders
+    :param seed: int = 0
+    :return: Generator of list
+    """
+    if recipes is None:
+        recipes = RECIPE_WEIGHTS
+    if seasonality is None:
+        seasonality = SEASONALITY
+    generator = random.Random(seed)
+    recipe_names = list(recipes)
+    recipe_weights = list(recipes.values())
+    customer_names = ["Customer %d" % number for number in range(1, customers + 1)]
+    # A few customers place most of the orders.
+    customer_weights = [1 / number for number in range(1, customers + 1)]
+
+    months = month_starts(start, years * 12)
+    weights = [
+        seasonality[first.month - 1] * growth ** (index // 12)
+        for index, first in enumerate(months)
+    ]
+    invoice = FIRST_INVOICE
+    customer = customer_names[0]
+    block = []
+    for index, (first, count) in enumerate(zip(months, split_rows(rows, weights))):
+        if count == 0:
+            continue
+        days_in_month = calendar.monthrange(first.year, first.month)[1]
+        day_counts = [0] * (days_in_month + 1)
+        for day in generator.choices(range(1, days_in_month + 1), k=count):
+            day_counts[day] += 1
+        # Each recipe is brewed in a new gyle every month.
+        gyles = {name: FIRST_GYLE + index * len(recipe_names) + number
+                 for number, name in enumerate(recipe_names)}
+
+        for day in range(1, days_in_month + 1):
+            orders = day_counts[day]
+            if orders == 0:
+                continue
+            date_required = first.replace(day=day).strftime("%d-%b-%y")
+            new_customers = generator.choices(customer_names, customer_weights, k=orders)
+            order_recipes = generator.choices(recipe_names, recipe_weights, k=orders)
+            for number in range(orders):
+                if generator.random() < NEW_INVOICE_CHANCE:
+                    invoice += 1
+                    customer = new_customers[number]
+                if generator.random() < LARGE_ORDER_CHANCE:
+                    quantity = generator.randint(*LARGE_ORDER)
+                else:
+                    quantity = generator.randint(*SMALL_ORDER)
+                recipe = order_recipes[number]
+                block.append([invoice, customer, date_required, recipe, gyles[recipe], quantity])
+            if len(block) >= WRITE_BLOCK:
+                yield block
+                block = []
+    if block:
+        yield block
+
+
+def write_sales_file(file_name: str, rows: int, **options) -> int:
+    """
+    A function which writes a synthetic sales CSV file, with the same headings as the shipped file.
+    The options are those of iter_sales_rows.
+
+    :param file_name: str
+    :param rows: int
+    :return: written: int - the number of orders written
+    """
+    written = 0
+    with open(file_name, mode="w", newline="") as csv_file:
+        csv_writer = csv.writer(csv_file, lineterminator="\n")
+        csv_writer.writerow(HEADINGS)
+        for block in iter_sales_rows(rows, **options):
+            csv_writer.writerows(block)
+            written += len(block)
+    return written
+
+
+def generate_operations(
+        batches: int,
+        tanks: int = None,
+        recipes: list = None,
+        seed: int = 0) -> list:
+    """
+    A function which makes a script of operations for brewery_monitoring. The script first creates
+    the tanks, then mixes creating new batches with moving earlier batches on to their next stage
+    and checking their time at stage, until every batch has been created and moved to stage 4.
+
+    Each operation is a list of the name of a function in OPERATIONS followed by its arguments. The
+    script keeps track of which tanks are free, so every move names a tank that is free and able to
+    hold the batch at the time, and every operation changes the brewery when it is run.
+
+    :param batches: int - the number of batches to create
+    :param tanks: int = None - the number of tanks to create, by default the tanks of the client
+    :param recipes: list = None - the recipes of the batches, by default those of RECIPE_WEIGHTS
+    :param seed: int = 0
+    :return: operations: list
+    """
+    generator = random.Random(seed)
+    if recipes is None:
+        recipes = list(RECIPE_WEIGHTS)
+
+    if tanks is None:
+        tank_list = list(b_m.REQUIRED_TANKS)
+    else:
+        tank_list = [
+            ("Tank %d" % number, generator.choice(TANK_VOLUMES),
+             generator.choice(TANK_CAPABILITIES))
+            for number in range(1, tanks + 1)
+        ]
+    operations = [["create_new_tank"] + list(tank) for tank in tank_list]
+    free = {name: (max_volume, capability) for name, max_volume, capability in tank_list}
+    for stage in ["2", "3"]:
+        if not any(capability in b_m.STAGE_CAPABILITIES[stage] for _v, capability in free.values()):
+            raise ValueError("There must be a tank that can be used for stage %s." % stage)
+
+    def free_tank(stage: str, volume: float) -> str:
+        fitting = [
+            name for name, (max_volume, capability) in free.items()
+            if capability in b_m.STAGE_CAPABILITIES[stage] and max_volume >= volume
+        ]
+        return generator.choice(fitting) if fitting else None
+
+    # The batches at stage 1, and at stages 2 and 3, with the stage, tank and volume of each.
+    waiting: list = []
+    running: list = []
+    volumes: dict = {}
+    placed: dict = {}
+    stages: dict = {}
+    created = 0
+    while created < batches or waiting or running:
+        actions = ["create", "start", "advance", "check"]
+        generator.shuffle(actions)
+        for action in actions:
+            if action == "create" and created < batches:
+                created += 1
+                name = "Batch %d" % created
+                quantity = generator.randint(1, MAX_QUANTITY)
+                operations.append(["create_new_batch", name, generator.choice(recipes), quantity])
+                volumes[name] = quantity * b_m.Batch.bottle_vol
+                waiting.append(name)
+                break
+            if action == "start" and waiting:
+                tank = free_tank("2", volumes[waiting[0]])
+                if tank is not None:
+                    name = waiting.pop(0)
+                    operations.append(["move_to_stage_2", name, tank])
+                    placed[name] = (tank, free.pop(tank))
+                    stages[name] = "2"
+                    running.append(name)
+                    break
+            if action == "check" and running:
+                operations.append(["time_at_stage", generator.choice(running)])
+                break
+            if action == "advance" and running:
+                index = generator.randrange(len(running))
+                name = running[index]
+                tank, details = placed[name]
+                if stages[name] == "3":
+                    operations.append(["move_to_stage_4", name])
+                    free[tank] = details
+                    running[index] = running[-1]
+                    running.pop()
+                    break
+                if details[1] == b_m.FERMENTER_CONDITIONER:
+                    operations.append(["move_to_stage_3", name, ""])
+                    stages[name] = "3"
+                    break
+                new_tank = free_tank("3", volumes[name])
+                if new_tank is not None:
+                    operations.append(["move_to_stage_3", name, new_tank])
+                    placed[name] = (new_tank, free.pop(new_tank))
+                    free[tank] = details
+                    stages[name] = "3"
+                    break
+        else:
+            raise ValueError("The batches cannot all be moved through these tanks.")
+    return operations
+
+
+def run_operations(operations) -> int:
+    """
+    A function which runs a script of operations against brewery_monitoring.
+
+    :param operations: an iterable of operations, as made by generate_operations
+    :return: count: int - the number of operations run
+    """
+    count = 0
+    for operation in operations:
+        name, arguments = operation[0], operation[1:]
+        if name not in OPERATIONS:
+            raise ValueError("%s is not an operation that can be run." % name)
+        getattr(b_m, name)(*arguments)
+        count += 1
+    return count
+
+
+def write_operations(file_name: str, operations: list):
+    """
+    A function which saves a script of operations, one JSON list per line.
+
+    :param file_name: str
+    :param operations: list
+    :return: None
+    """
+    with open(file_name, mode="w") as operations_file:
+        for operation in operations:
+            operations_file.write(json.dumps(operation) + "\n")
+
+
+def read_operations(file_name: str):
+    """
+    A generator which reads a script of operations saved by write_operations.
+
+    :param file_name: str
+    :return: Generator of list
+    """
+    with open(file_name, mode="r") as operations_file:
+        for line in operations_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main():
+    """
+    A function which writes the workload chosen on the command line.
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description="Make synthetic brewery workloads.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sales = commands.add_parser("sales", help="write a synthetic sales CSV file")
+    sales.add_argument("file_name")
+    sales.add_argument("--rows", type=int, default=100000)
+    sales.add_argument("--years", type=int, default=1)
+    sales.add_argument("--customers", type=int, default=64)
+    sales.add_argument("--recipes", help="comma separated recipes, ordered equally often")
+    sales.add_argument("--seasonality",
+                       help="12 comma separated weights for the months January to December")
+    sales.add_argument("--growth", type=float, default=ANNUAL_GROWTH)
+    sales.add_argument("--seed", type=int, default=0)
+
+    script = commands.add_parser("operations", help="write a script of brewery operations")
+    script.add_argument("file_name")
+    script.add_argument("--batches", type=int, default=1000)
+    script.add_argument("--tanks", type=int)
+    script.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    try:
+        if arguments.command == "sales":
+            recipes = None
+            if arguments.recipes:
+                recipes = {name.strip(): 1 for name in arguments.recipes.split(",")}
+            seasonality = None
+            if arguments.seasonality:
+                seasonality = [float(weight) for weight in arguments.seasonality.split(",")]
+                if len(seasonality) != 12:
+                    raise ValueError("There must be a weight for each of the 12 months.")
+            written = write_sales_file(
+                arguments.file_name, arguments.rows, years=arguments.years,
+                customers=arguments.customers, recipes=recipes, seasonality=seasonality,
+                growth=arguments.growth, seed=arguments.seed
+            )
+            print("Wrote", written, "orders to", arguments.file_name)
+        else:
+            operations = generate_operations(
+                arguments.batches, arguments.tanks, seed=arguments.seed
+            )
+            write_operations(arguments.file_name, operations)
+            print("Wrote", len(operations), "operations to", arguments.file_name)
+    except ValueError as e:
+        print(e)
+
+
+if __name__ == "__main__":
+    main()